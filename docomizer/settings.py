@@ -51,6 +51,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'main_app.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     "corsheaders.middleware.CorsMiddleware", 
     'django.middleware.common.CommonMiddleware',
@@ -58,9 +59,25 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'main_app.routers.DatabaseRoutingMiddleware',
 ]
 
 
+REST_FRAMEWORK = {
+    'EXCEPTION_HANDLER': 'main_app.errors.exception_handler',
+    'DEFAULT_RENDERER_CLASSES': [
+        'main_app.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# Responses (JSON/text only) smaller than this many bytes are sent uncompressed,
+# larger ones are brotli or gzip encoded depending on Accept-Encoding.
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", 5))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", 6))
+
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "http://192.168.1.16:3000",
@@ -93,13 +110,128 @@ WSGI_APPLICATION = 'docomizer.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DATABASE_ENGINE=postgres switches to the production profile, configured with
+# DATABASE_NAME / DATABASE_USER / DATABASE_PASSWORD / DATABASE_HOST / DATABASE_PORT.
+
+DATABASE_ENGINE = os.environ.get('DATABASE_ENGINE', 'sqlite')
+
+if DATABASE_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DATABASE_NAME', 'docomizer'),
+            'USER': os.environ.get('DATABASE_USER', 'docomizer'),
+            'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+            'HOST': os.environ.get('DATABASE_HOST', 'localhost'),
+            'PORT': os.environ.get('DATABASE_PORT', '5432'),
+            # keep connections open between requests instead of reconnecting every time
+            'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': int(os.environ.get('DATABASE_CONNECT_TIMEOUT', 5)),
+            },
+        }
+    }
+    if os.environ.get('DATABASE_POOL') == 'pgbouncer':
+        # transaction pooling hands each transaction a different server connection
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # seconds a writer waits on the database lock before "database is locked"
+                'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 20)),
+            },
+        }
     }
+
+# Course sharding for multi-college deployments, see main_app/routers.py
+# eg: DATABASE_SHARDS="college_a,college_b" COURSE_SHARDS="1:college_a,2:college_a,3:college_b"
+
+DATABASE_SHARDS = [alias for alias in os.environ.get('DATABASE_SHARDS', '').split(',') if alias]
+
+for alias in DATABASE_SHARDS:
+    if DATABASE_ENGINE == 'postgres':
+        shard_name = f"{DATABASES['default']['NAME']}_{alias}"
+    else:
+        shard_name = BASE_DIR / f'db_{alias}.sqlite3'
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        NAME=os.environ.get(f'DATABASE_{alias.upper()}_NAME', shard_name),
+    )
+
+if DATABASE_ENGINE != 'postgres':
+    # test databases on disk: tests firing parallel requests need SQLite's file
+    # locking, the shared in-memory database fails them with "table is locked"
+    for alias in ['default', *DATABASE_SHARDS]:
+        DATABASES[alias]['TEST'] = {'NAME': BASE_DIR / f'test_db_{alias}.sqlite3'}
+
+COURSE_SHARDS = {
+    int(course_id): alias
+    for course_id, alias in (
+        item.split(':') for item in os.environ.get('COURSE_SHARDS', '').split(',') if item
+    )
 }
 
+# Read replicas, primary alias -> replica alias, see main_app/routers.py
+# eg: DATABASE_REPLICAS="default:replica" DATABASE_REPLICA_HOST="replica.db.internal"
+# Locally, DATABASE_REPLICAS="default:replica" alone uses db_replica.sqlite3.
+
+DATABASE_REPLICAS = dict(
+    item.split(':') for item in os.environ.get('DATABASE_REPLICAS', '').split(',') if item
+)
+
+for primary, alias in DATABASE_REPLICAS.items():
+    if DATABASE_ENGINE == 'postgres':
+        replica_name = DATABASES[primary]['NAME']
+    else:
+        replica_name = BASE_DIR / f'db_{alias}.sqlite3'
+    DATABASES[alias] = dict(
+        DATABASES[primary],
+        NAME=os.environ.get(f'DATABASE_{alias.upper()}_NAME', replica_name),
+        HOST=os.environ.get(f'DATABASE_{alias.upper()}_HOST', DATABASES[primary].get('HOST', '')),
+        TEST={'MIRROR': primary},
+    )
+
+# how long a user keeps reading from the primary after a write (replication lag bound)
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+
+DATABASE_ROUTERS = ['main_app.routers.ReplicaRouter']
+
+# Cache shared by every worker process: the reference data version, login payloads,
+# dashboards, user shards and replica stickiness are all invalidated through it, so a
+# per-process LocMemCache would leave the other gunicorn workers serving stale data.
+# Redis when REDIS_URL is set (eg: redis://127.0.0.1:6379/1), else a table on the default
+# database, created with `python manage.py createcachetable`.
+REDIS_URL = os.environ.get('REDIS_URL', '')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'docomizer_cache',
+            # one login payload per token and a sticky key per writer on result day
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        }
+    }
+
+# seconds a worker trusts its copy of Exam, Course and Subject before reading the shared
+# version again (main_app/reference_cache.py), the delay before other workers see an edit
+REFERENCE_DATA_CHECK_SECONDS = float(os.environ.get('REFERENCE_DATA_CHECK_SECONDS', 2))
+
+# WAL lets readers run alongside the single writer, see main_app/signals.py
+SQLITE_WAL = os.environ.get('SQLITE_WAL', '1') == '1'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -119,6 +251,34 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing policy: PASSWORD_HASHING=pbkdf2 (default), scrypt or argon2 (needs argon2-cffi).
+# The cost parameters below are tuned per deployment with benchmark_login; existing
+# hashes are upgraded to the active policy on the user's next successful login.
+
+PASSWORD_HASHER_POLICIES = {
+    'pbkdf2': 'main_app.hashers.TunedPBKDF2PasswordHasher',
+    'scrypt': 'main_app.hashers.TunedScryptPasswordHasher',
+    'argon2': 'main_app.hashers.TunedArgon2PasswordHasher',
+}
+PASSWORD_HASHING = os.environ.get('PASSWORD_HASHING', 'pbkdf2')
+
+PASSWORD_HASHERS = [PASSWORD_HASHER_POLICIES[PASSWORD_HASHING]] + [
+    hasher for policy, hasher in PASSWORD_HASHER_POLICIES.items() if policy != PASSWORD_HASHING
+] + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+
+# 0 keeps Django's default iteration count
+PBKDF2_ITERATIONS = int(os.environ.get('PBKDF2_ITERATIONS', 0))
+
+SCRYPT_WORK_FACTOR = int(os.environ.get('SCRYPT_WORK_FACTOR', 2 ** 14))
+SCRYPT_BLOCK_SIZE = int(os.environ.get('SCRYPT_BLOCK_SIZE', 8))
+SCRYPT_PARALLELISM = int(os.environ.get('SCRYPT_PARALLELISM', 1))
+
+ARGON2_TIME_COST = int(os.environ.get('ARGON2_TIME_COST', 2))
+ARGON2_MEMORY_COST = int(os.environ.get('ARGON2_MEMORY_COST', 102400))
+ARGON2_PARALLELISM = int(os.environ.get('ARGON2_PARALLELISM', 8))
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.1/topics/i18n/
@@ -141,6 +301,77 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Archive tier for mark sheets of past academic years (main_app/storage.py), any Django
+# storage backend, eg: S3/MinIO with django-storages:
+# {'BACKEND': 'storages.backends.s3boto3.S3Boto3Storage', 'OPTIONS': {'bucket_name': ..., 'endpoint_url': ...}}
+MARKSHEET_ARCHIVE_STORAGE = {
+    'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    'OPTIONS': {
+        'location': os.environ.get('MARKSHEET_ARCHIVE_ROOT', os.path.join(BASE_DIR, 'media_archive')),
+    },
+}
+
+# Archive tables (main_app/archive.py, `archive_history`): a student's marks leave the hot
+# Mark table once their approved sheet for the final semester exam is this many academic
+# years old, expired or revoked tokens once they are this many days old
+FINAL_SEMESTER_EXAM = os.environ.get('FINAL_SEMESTER_EXAM', 'Semester 6')
+MARK_ARCHIVE_AFTER_YEARS = int(os.environ.get('MARK_ARCHIVE_AFTER_YEARS', 2))
+TOKEN_ARCHIVE_AFTER_DAYS = int(os.environ.get('TOKEN_ARCHIVE_AFTER_DAYS', 30))
+
+# Authenticated mark sheet downloads (main_app/media.py): "nginx" hands the transfer to
+# nginx with X-Accel-Redirect to MEDIA_SENDFILE_PREFIX (an `internal` location aliased to
+# MEDIA_ROOT), "apache" uses X-Sendfile, empty streams the file from Django.
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE', '')
+MEDIA_SENDFILE_PREFIX = os.environ.get('MEDIA_SENDFILE_PREFIX', '/protected/')
+# seconds the signed mark sheet links returned by ViewMarkSheetView stay valid
+MARKSHEET_LINK_MAX_AGE = 60 * 10
+
+# seconds the per-token login payload (LoginDataView) stays cached
+LOGIN_PAYLOAD_TIMEOUT = 60 * 60
+
+# seconds a faculty dashboard grid stays cached (it is also updated on every mark sheet change)
+DASHBOARD_CACHE_TIMEOUT = 60 * 10
+
+# Change feed (changes/ and changes/stream/)
+CHANGE_FEED_PAGE_SIZE = 500
+CHANGE_FEED_SETTLE_SECONDS = 1
+CHANGE_FEED_STREAM_INTERVAL = 2
+CHANGE_FEED_STREAM_TIMEOUT = 60 * 5
+
+# seconds after which a mark sheet upload still "Processing" is considered
+# abandoned (eg: the worker was killed mid parse) and may be claimed again
+UPLOAD_CLAIM_TIMEOUT = 60 * 5
+
+# Upload profiling (main_app/profiling.py): share of uploads whose phase timings
+# are recorded, share traced with cProfile (always recorded), and the
+# X-Profile-Upload header value that turns cProfile on for a single upload
+UPLOAD_TRACE_RATE = float(os.environ.get('UPLOAD_TRACE_RATE', 0.05))
+UPLOAD_PROFILING_RATE = float(os.environ.get('UPLOAD_PROFILING_RATE', 0))
+UPLOAD_PROFILING_SECRET = os.environ.get('UPLOAD_PROFILING_SECRET', '')
+UPLOAD_PROFILE_STATS_LIMIT = 40
+
+# Bulk student onboarding: password hashing is spread over a process pool
+# once a file has BULK_HASH_POOL_THRESHOLD rows. Requests share one pool of
+# BULK_HASH_WORKERS processes per server process, the onboard_students
+# command uses every core (large intakes belong there, not in a request).
+# A request takes at most BULK_ONBOARD_MAX_ROWS rows: at ~120 ms per PBKDF2
+# hash on 2 workers, 200 rows hash in ~12 s, well within gunicorn's timeout
+
+BULK_HASH_WORKERS = int(os.environ.get('BULK_HASH_WORKERS', 2))
+BULK_HASH_POOL_THRESHOLD = 20
+BULK_ONBOARD_BATCH_SIZE = 200
+BULK_ONBOARD_MAX_ROWS = int(os.environ.get('BULK_ONBOARD_MAX_ROWS', 200))
+
+# Page 1 previews of mark sheets, rendered with Wand (ImageMagick + Ghostscript)
+
+MARKSHEET_PREVIEWS = os.environ.get('MARKSHEET_PREVIEWS', '1') == '1'
+PREVIEW_FORMAT = 'webp'
+PREVIEW_WIDTH = 800
+PREVIEW_RESOLUTION = 100
+PREVIEW_QUALITY = 60
+PREVIEW_WORKERS = int(os.environ.get('PREVIEW_WORKERS', 2))
+PREVIEW_CACHE_SECONDS = 60 * 60 * 24 * 365
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
@@ -24,5 +24,6 @@ urlpatterns = [
 ]
 
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# mark sheets under MEDIA_ROOT are only served through the authenticated
+# marksheet_file / marksheet_preview views, never by path
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
@@ -0,0 +1,49 @@
+"""
+Production gunicorn config: gunicorn docomizer.wsgi (picked up from the cwd)
+
+The app is loaded once in the master and workers are forked from it, so the
+imported code is shared copy-on-write instead of being imported again by
+every worker. The pdf stack stays out of the general pool. Upload parsing can
+get its own pool (routed by the front proxy for /api/upload/) started with
+GUNICORN_PARSER_POOL=1, which preloads pdfplumber in the master as well.
+
+Env: GUNICORN_BIND, GUNICORN_WORKERS, GUNICORN_THREADS, GUNICORN_TIMEOUT,
+GUNICORN_MAX_REQUESTS, GUNICORN_PARSER_POOL
+"""
+import gc
+import os
+
+
+wsgi_app = "docomizer.wsgi:application"
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("GUNICORN_WORKERS", (os.cpu_count() or 1) * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+# recycle workers now and then, jitter so they do not all restart together
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = max_requests // 10
+preload_app = True
+parser_pool = bool(int(os.environ.get("GUNICORN_PARSER_POOL", 0)))
+
+
+def when_ready(server):
+    """The app is imported in the master, finish warming it before the first fork"""
+    from django.db import connections
+    from django.urls import get_resolver
+
+    # import every view module now, not lazily on each worker's first request
+    get_resolver().url_patterns
+    if parser_pool:
+        import pdfplumber  # noqa: F401
+
+    # connections opened while loading must not be shared with the workers
+    connections.close_all()
+    # move everything loaded so far out of the gc's reach, so collections in
+    # the workers do not write to (and so copy) the shared pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from django.db import connections
+
+    connections.close_all()
@@ -1,17 +1,191 @@
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.http import QueryDict
+from django.utils.functional import cached_property
 from .models import User, Course, Exam, Faculty, Mark, MarkSheetDoc, Student, Subject
+from .reference_cache import reference_data
+from .routers import shard_aliases
+from .services import set_mark_sheet_status, recompute_sgpa
 from django.contrib.auth.admin import UserAdmin
 
 # Register your models here.
 
 # admin.site.register(User)
-admin.site.register(Course)
-admin.site.register(Exam)
-admin.site.register(Faculty)
-admin.site.register(Mark)
-admin.site.register(MarkSheetDoc)
-admin.site.register(Subject)
-admin.site.register(Student)
+
+# below this many rows an exact COUNT(*) is cheap enough
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Unfiltered changelists of big tables use the planner's row estimate
+    (PostgreSQL) instead of a COUNT(*) over the whole table.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if queryset.query.where:
+            return super().count
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql":
+            return super().count
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples FROM pg_class WHERE relname = %s", [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        estimate = int(row[0]) if row else -1
+        if estimate < ESTIMATED_COUNT_THRESHOLD:
+            return super().count
+        return estimate
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # no second COUNT(*) of the unfiltered table on filtered/searched pages
+    show_full_result_count = False
+    list_per_page = 50
+
+
+SHARD_PARAM = "shard"
+
+
+def requested_shard(request):
+    """Database picked with the changelist's shard filter, carried over to the change pages"""
+    alias = request.GET.get(SHARD_PARAM)
+    if alias is None:
+        alias = QueryDict(request.GET.get("_changelist_filters", "")).get(SHARD_PARAM)
+    return alias if alias in shard_aliases() else "default"
+
+
+class ShardFilter(admin.SimpleListFilter):
+    """One course shard at a time, the default database unless another is picked"""
+    title = "shard"
+    parameter_name = SHARD_PARAM
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in shard_aliases()]
+
+    def queryset(self, request, queryset):
+        # ShardedAdmin.get_queryset has already picked the database
+        return queryset
+
+    def choices(self, changelist):
+        current = self.value() or "default"
+        for alias, title in self.lookup_choices:
+            yield {
+                "selected": alias == current,
+                "query_string": changelist.get_query_string({self.parameter_name: alias}),
+                "display": title,
+            }
+
+
+class ShardedAdmin(LargeTableAdmin):
+    """
+    Admin of a model partitioned by course (see routers.py). Users, courses
+    and exams stay on the default database, so relations to them are
+    prefetched rather than joined, and usernames are searched there first.
+    """
+    # relations on the default database shown in the list
+    list_prefetch_related = ()
+    # path to the user, searched by exact username
+    user_search_field = None
+
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        if settings.DATABASE_SHARDS:
+            return (ShardFilter, *list_filter)
+        return list_filter
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).using(requested_shard(request)).prefetch_related(*self.list_prefetch_related)
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term and self.user_search_field:
+            user_ids = list(User.objects.filter(username=search_term.strip()).values_list("id", flat=True))
+            if user_ids:
+                results |= queryset.filter(**{f"{self.user_search_field}__in": user_ids})
+        return results, may_have_duplicates
+
+
+@admin.action(description="Approve selected mark sheets")
+def approve_mark_sheets(modeladmin, request, queryset):
+    changed = set_mark_sheet_status(queryset, MarkSheetDoc.APPROVED)
+    modeladmin.message_user(request, f"{changed} mark sheets approved.", messages.SUCCESS)
+
+
+@admin.action(description="Recompute SGPA from marks")
+def recompute_mark_sheet_sgpa(modeladmin, request, queryset):
+    changed = recompute_sgpa(queryset)
+    modeladmin.message_user(request, f"SGPA changed for {changed} mark sheets.", messages.SUCCESS)
+
+
+@admin.register(Mark)
+class MarkAdmin(ShardedAdmin):
+    list_display = ("id", "student", "subject", "exam", "grade", "grade_point", "credit", "credit_point", "status", "is_active")
+    list_select_related = ("student", "subject")
+    list_prefetch_related = ("student__user", "exam")
+    list_filter = ("exam", "student__course", "status", "is_active")
+    # exact matches only, so the lookups use the username / registration_no indexes
+    search_fields = ("=student__registration_no",)
+    user_search_field = "student__user"
+    raw_id_fields = ("student", "subject", "added_by")
+
+
+@admin.register(MarkSheetDoc)
+class MarkSheetDocAdmin(ShardedAdmin):
+    list_display = ("id", "student", "exam", "status", "sgpa", "created_time", "is_active")
+    list_select_related = ("student",)
+    list_prefetch_related = ("student__user", "exam")
+    list_filter = ("status", "exam", "student__course", "is_active")
+    search_fields = ("=student__registration_no",)
+    user_search_field = "student__user"
+    raw_id_fields = ("student", "added_by")
+    actions = [approve_mark_sheets, recompute_mark_sheet_sgpa]
+
+
+@admin.register(Student)
+class StudentAdmin(ShardedAdmin):
+    list_display = ("id", "user", "registration_no", "course", "is_active")
+    list_select_related = ()
+    list_prefetch_related = ("user", "course")
+    list_filter = ("course", "is_active")
+    search_fields = ("=registration_no",)
+    user_search_field = "user"
+    raw_id_fields = ("user", "added_by")
+
+
+@admin.register(Faculty)
+class FacultyAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "course", "is_active")
+    list_select_related = ("user", "course")
+    list_filter = ("course", "is_active")
+    search_fields = ("=user__username",)
+    raw_id_fields = ("user", "added_by")
+
+
+@admin.action(description="Refresh reference data cache")
+def refresh_reference_data(modeladmin, request, queryset):
+    reference_data.invalidate()
+    modeladmin.message_user(request, "Reference data cache refreshed.", messages.SUCCESS)
+
+
+@admin.register(Course, Exam)
+class ReferenceDataAdmin(admin.ModelAdmin):
+    actions = [refresh_reference_data]
+
+
+@admin.register(Subject)
+class SubjectAdmin(ShardedAdmin):
+    list_display = ("id", "subject_code", "subject_name", "course", "exam", "is_active")
+    list_select_related = ()
+    list_prefetch_related = ("course", "exam")
+    list_filter = ("course", "exam", "is_active")
+    search_fields = ("=subject_code",)
+    raw_id_fields = ("added_by",)
+    actions = [refresh_reference_data]
 
 
 @admin.register(User)
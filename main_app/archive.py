@@ -0,0 +1,106 @@
+"""
+Archive tables for the two tables that only ever grow.
+
+Marks of graduated cohorts move from Mark to ArchivedMark, and expired or
+revoked tokens move from UserAuthToken to ArchivedUserAuthToken, in batches
+of one transaction each (copy, then delete) keeping their ids. The hot
+tables stay sized to the students currently studying.
+
+A student counts as graduated once their sheet for the course's final
+semester (settings.FINAL_SEMESTER_EXAM) has been approved and was uploaded
+more than settings.MARK_ARCHIVE_AFTER_YEARS academic years ago; all of a
+student's marks move together. Students who dropped out or are still
+studying keep their marks in the hot table. Historical views read through `historical_marks`, which
+falls back to the archive transparently. Archived tokens are never read,
+authentication only accepts active unexpired ones.
+
+Native PostgreSQL partitioning by academic year would need the year in the
+primary key of Mark and hand written migrations on every shard, while the
+archive tables work the same on SQLite, PostgreSQL and every course shard.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Exam, Mark, MarkSheetDoc, ArchivedMark, UserAuthToken, ArchivedUserAuthToken
+from .storage import academic_year
+
+
+def archive_cutoff(now=None):
+    """Start of the oldest academic year whose marks stay in the hot table"""
+    year = academic_year(now or timezone.now()) - settings.MARK_ARCHIVE_AFTER_YEARS + 1
+    return timezone.make_aware(datetime.datetime(year, 6, 1))
+
+
+def graduated_students(using, now=None):
+    """Ids of students on the database whose approved final semester sheet is older than the cutoff"""
+    # exams live on the default database, the sheets on the course shard
+    final_exams = list(Exam.objects.filter(exam_name=settings.FINAL_SEMESTER_EXAM).values_list("id", flat=True))
+    return list(
+        MarkSheetDoc.active_objects.using(using)
+        .filter(exam_id__in=final_exams, status=MarkSheetDoc.APPROVED, created_time__lt=archive_cutoff(now))
+        # not those archived by an earlier run
+        .filter(student_id__in=Mark.objects.using(using).values("student_id"))
+        .values_list("student_id", flat=True)
+        .distinct()
+    )
+
+
+def archived_copy(archive_model, row):
+    """Archive row with the same id, timestamps and data as the hot row"""
+    return archive_model(**{
+        field.attname: getattr(row, field.attname)
+        for field in archive_model._meta.concrete_fields
+        if field.name != "archived_time"
+    })
+
+
+def move_rows(queryset, archive_model, using):
+    """Copy the rows to the archive table and delete them, in one transaction"""
+    with transaction.atomic(using=using):
+        rows = list(queryset.using(using).select_for_update())
+        archive_model.objects.using(using).bulk_create(
+            [archived_copy(archive_model, row) for row in rows], batch_size=500
+        )
+        queryset.model.objects.using(using).filter(id__in=[row.id for row in rows]).delete()
+    return len(rows)
+
+
+def archive_marks(using, student_ids, batch_size=200):
+    """Move every mark of the students to ArchivedMark, batch_size students at a time"""
+    moved = 0
+    for start in range(0, len(student_ids), batch_size):
+        batch = student_ids[start:start + batch_size]
+        moved += move_rows(Mark.objects.filter(student_id__in=batch), ArchivedMark, using)
+    return moved
+
+
+def stale_tokens(now=None):
+    """Expired or revoked tokens issued more than TOKEN_ARCHIVE_AFTER_DAYS ago"""
+    before = (now or timezone.now()) - datetime.timedelta(days=settings.TOKEN_ARCHIVE_AFTER_DAYS)
+    return UserAuthToken.objects.filter(Q(is_expired=True) | Q(is_active=False), created_time__lt=before)
+
+
+def archive_tokens(now=None, batch_size=5000):
+    moved = 0
+    stale = stale_tokens(now)
+    while True:
+        ids = list(stale.order_by("id").values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return moved
+        moved += move_rows(UserAuthToken.objects.filter(id__in=ids), ArchivedUserAuthToken, "default")
+
+
+def historical_marks(filters, *fields, **expressions):
+    """
+    .values() of the active marks matching filters, from the hot table and
+    the archive. A student's marks are archived together, so a lookup by
+    student only reads the archive when the hot table has none.
+    """
+    marks = list(Mark.active_objects.filter(**filters).values(*fields, **expressions))
+    if marks and ("student" in filters or "student_id" in filters):
+        return marks
+    return marks + list(ArchivedMark.active_objects.filter(**filters).values(*fields, **expressions))
@@ -1,7 +1,10 @@
+from django.conf import settings
+from django.core import signing
 from rest_framework import exceptions
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.authentication import BaseAuthentication, TokenAuthentication
 
-from .models import UserAuthToken
+from .models import User, UserAuthToken
+from .routers import activate_user_routing
 
 
 class CustomTokenAuthentication(TokenAuthentication):
@@ -11,8 +14,8 @@ class CustomTokenAuthentication(TokenAuthentication):
         model = self.get_model()
         try:
             token = (
-                model.objects.select_related("user")
-                .filter(key=key, is_active=True, is_expired=False)
+                model.active_objects.select_related("user")
+                .filter(key=key, is_expired=False)
                 .order_by("-created_time")
             )
             if not token.exists():
@@ -25,4 +28,43 @@ class CustomTokenAuthentication(TokenAuthentication):
         if not token.user.is_active:
             raise exceptions.ValidationError(("User inactive or deleted."))
 
-        return (token.user, token)
\ No newline at end of file
+        activate_user_routing(token.user)
+        return (token.user, token)
+
+
+def marksheet_link_signer():
+    return signing.TimestampSigner(salt="main_app.marksheet_link")
+
+
+def sign_marksheet_link(user, mark_sheet):
+    """`link` query value opening the mark sheet's file and preview as user, see SignedLinkAuthentication"""
+    return marksheet_link_signer().sign(f"{user.id}/{mark_sheet.id}")
+
+
+class SignedLinkAuthentication(BaseAuthentication):
+    """
+    Browsers fetching <a href> / <img src> links cannot send the token
+    header, so mark sheet links carry a signed `link` parameter instead,
+    valid for settings.MARKSHEET_LINK_MAX_AGE seconds and only for the
+    mark sheet it was issued for.
+    """
+
+    def authenticate(self, request):
+        link = request.query_params.get("link")
+        if not link:
+            return None
+        try:
+            value = marksheet_link_signer().unsign(link, max_age=settings.MARKSHEET_LINK_MAX_AGE)
+        except signing.SignatureExpired:
+            raise exceptions.ValidationError(("Link expired."))
+        except signing.BadSignature:
+            raise exceptions.ValidationError(("Invalid link."))
+        user_id, mark_sheet_id = value.split("/")
+        if mark_sheet_id != request.query_params.get("marksheet"):
+            raise exceptions.ValidationError(("Invalid link."))
+        user = User.objects.filter(id=user_id).first()
+        if user is None or not user.is_active:
+            raise exceptions.ValidationError(("User inactive or deleted."))
+
+        activate_user_routing(user)
+        return (user, None)
@@ -0,0 +1,110 @@
+"""
+Error handling shared by every view.
+
+Expected failures (bad input, duplicate upload, wrong role ...) are
+ValidationErrors, or one of the typed domain errors below, and only turn into
+a message for the frontend: no traceback is formatted for them. Anything else
+is logged with its traceback through a queue, so the formatting and the
+write to stderr happen on a listener thread instead of the request thread.
+Every error is counted per type (see ErrorStatsView).
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+from collections import Counter
+from logging.handlers import QueueHandler, QueueListener
+
+from django.core.exceptions import ValidationError, ObjectDoesNotExist
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import exception_handler as drf_exception_handler
+
+
+class DomainError(ValidationError):
+    """Expected failure whose messages are shown to the user"""
+
+
+class PermissionDeniedError(DomainError):
+    pass
+
+
+class AuthenticationFailedError(DomainError):
+    pass
+
+
+class InvalidDocumentError(DomainError):
+    pass
+
+
+class DuplicateUploadError(DomainError):
+    pass
+
+
+EXPECTED_ERRORS = (ValidationError, ObjectDoesNotExist)
+
+error_counts = Counter()
+_counts_lock = threading.Lock()
+
+logger = logging.getLogger("main_app.errors")
+_listener = None
+_listener_lock = threading.Lock()
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Hand the record over as is, the listener thread formats the traceback"""
+
+    def prepare(self, record):
+        return record
+
+
+def start_error_logging():
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return
+        log_queue = queue.SimpleQueue()
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        _listener = QueueListener(log_queue, stream_handler)
+        _listener.start()
+        atexit.register(_listener.stop)
+        logger.addHandler(DeferredQueueHandler(log_queue))
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+def count_error(e):
+    with _counts_lock:
+        error_counts[type(e).__name__] += 1
+
+
+def error_stats():
+    with _counts_lock:
+        counts = dict(error_counts)
+    return {"pid": os.getpid(), "errors": counts}
+
+
+def error_messages(e):
+    """Messages for the response body, logging unexpected errors"""
+    count_error(e)
+    if isinstance(e, ValidationError):
+        return e.messages
+    if isinstance(e, ObjectDoesNotExist):
+        return ["Something went wrong."]
+    start_error_logging()
+    logger.error("Unhandled %s: %s", type(e).__name__, e, exc_info=e)
+    return ["Something went wrong."]
+
+
+def exception_handler(exc, context):
+    """DRF exception handler for views that do not catch their own errors"""
+    response = drf_exception_handler(exc, context)
+    if response is not None:
+        count_error(exc)
+        return response
+    msg = error_messages(exc)
+    if isinstance(exc, EXPECTED_ERRORS):
+        return Response(status=status.HTTP_404_NOT_FOUND, data=msg)
+    return Response(status=status.HTTP_500_INTERNAL_SERVER_ERROR, data=msg)
@@ -0,0 +1,171 @@
+"""
+Mark table extraction for University of Calicut result sheets.
+
+`page.extract_table()` runs pdfplumber's general table finder (edge merging,
+intersection search, cell grouping) on every upload. Calicut sheets always use
+the same ruled 7 column grid, so the template extractor below reads the column
+and row rules straight from the pdfminer layout objects and buckets the chars
+into those cells. When the page does not look like the template it returns
+None and the caller falls back to `extract_table`.
+"""
+from pdfplumber import utils
+
+
+# eg: A01 | TRANSACTIONS: ESSENTIAL ENGLISH ... | A | 8 | 4 | 32 | Passed
+CALICUT_TEMPLATE_COLUMNS = (
+    "subject_code",
+    "subject_name",
+    "grade",
+    "grade_point",
+    "credit",
+    "credit_point",
+    "status",
+)
+CALICUT_NUMERIC_COLUMNS = (3, 4, 5)
+
+# same as pdfplumber's default snap/join tolerance for the "lines" strategy
+EDGE_TOLERANCE = 3
+
+# eg: IV Semester B.Sc Degree Examination November 2022, opening every
+# semester block of a consolidated grade card
+SEMESTER_LABEL = r"\b(VI|IV|V|I{1,3}) Semester\b"
+ROMAN_SEMESTERS = {"I": 1, "II": 2, "III": 3, "IV": 4, "V": 5, "VI": 6}
+
+
+def cluster_positions(positions, tolerance=EDGE_TOLERANCE):
+    """Collapse edge positions that are within `tolerance` of each other"""
+    clusters = []
+    for position in sorted(positions):
+        if clusters and position - clusters[-1][-1] <= tolerance:
+            clusters[-1].append(position)
+        else:
+            clusters.append([position])
+    return [sum(cluster) / len(cluster) for cluster in clusters]
+
+
+def char_in_bbox(char, bbox):
+    v_mid = (char["top"] + char["bottom"]) / 2
+    h_mid = (char["x0"] + char["x1"]) / 2
+    x0, top, x1, bottom = bbox
+    return x0 <= h_mid < x1 and top <= v_mid < bottom
+
+
+def template_grid(page):
+    """Column and row rules of the marks table, or None if the layout differs"""
+    vertical_edges = page.vertical_edges
+    horizontal_edges = page.horizontal_edges
+    if not vertical_edges or not horizontal_edges:
+        return None
+
+    columns = cluster_positions(edge["x0"] for edge in vertical_edges)
+    if len(columns) != len(CALICUT_TEMPLATE_COLUMNS) + 1:
+        return None
+
+    # only horizontal rules spanning the whole grid separate rows
+    left, right = columns[0], columns[-1]
+    rows = cluster_positions(
+        edge["top"]
+        for edge in horizontal_edges
+        if edge["x0"] <= left + EDGE_TOLERANCE and edge["x1"] >= right - EDGE_TOLERANCE
+    )
+    if len(rows) < 2:
+        return None
+    return columns, rows
+
+
+def extract_template_table(page):
+    """
+    Extract the marks table using the fixed Calicut column layout.
+    Returns rows in the same shape as `page.extract_table()` (header first),
+    or None when the template does not match the page.
+    """
+    grid = template_grid(page)
+    if grid is None:
+        return None
+    columns, rows = grid
+
+    table_bbox = (columns[0], rows[0], columns[-1], rows[-1])
+    chars = [char for char in page.chars if char_in_bbox(char, table_bbox)]
+
+    table = []
+    for top, bottom in zip(rows, rows[1:]):
+        row_chars = [char for char in chars if char_in_bbox(char, (columns[0], top, columns[-1], bottom))]
+        row = []
+        for x0, x1 in zip(columns, columns[1:]):
+            cell_chars = [char for char in row_chars if char_in_bbox(char, (x0, top, x1, bottom))]
+            if cell_chars:
+                row.append(utils.extract_text(cell_chars, x_shift=x0, y_shift=top))
+            else:
+                row.append("")
+        table.append(row)
+
+    if not template_rows_valid(table):
+        return None
+    return table
+
+
+def template_rows_valid(table):
+    """Every passed mark row must have a code and integer GP / credit / CP columns"""
+    if len(table) < 2:
+        return False
+    for row in table[1:]:
+        if not row[0]:
+            return False
+        if row[6] == "Failed":
+            continue
+        for index in CALICUT_NUMERIC_COLUMNS:
+            if not row[index].strip().isdigit():
+                return False
+    return True
+
+
+def extract_marks_table(page):
+    """Template fast path, falling back to pdfplumber's table finder"""
+    table = extract_template_table(page)
+    if table is None:
+        table = page.extract_table()
+    return table
+
+
+def page_regions(page):
+    """
+    Split a grade card page at its semester labels: (semester, region) per
+    block starting on the page, after (None, region) for whatever sits
+    above the first label.
+    """
+    labels = page.search(SEMESTER_LABEL)
+    tops = [0] + [label["top"] for label in labels] + [page.height]
+    semesters = [None] + [ROMAN_SEMESTERS[label["groups"][0]] for label in labels]
+    for semester, top, bottom in zip(semesters, tops, tops[1:]):
+        if bottom - top >= 1:
+            yield semester, page.crop((0, top, page.width, bottom))
+
+
+def semester_blocks(pages):
+    """
+    Walk the pages of a consolidated grade card once, yielding
+    (semester, rows, has_sgpa) for every semester block. Rows above the first
+    label of a page continue the previous block's table (a repeated header is
+    dropped). Each page's layout is released once read, so only one page is
+    held in memory.
+    """
+    block = None
+    for page in pages:
+        for semester, region in page_regions(page):
+            if semester is not None:
+                if block is not None:
+                    yield block
+                block = (semester, None, False)
+            if block is None:
+                # card header, above the first semester
+                continue
+            semester, rows, has_sgpa = block
+            table = extract_marks_table(region)
+            if table and rows:
+                rows = rows + (table[1:] if table[0] == rows[0] else table)
+            elif table:
+                rows = table
+            block = (semester, rows, has_sgpa or bool(region.search("SGPA")))
+        page.flush_cache()
+    if block is not None:
+        yield block
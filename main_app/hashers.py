@@ -0,0 +1,31 @@
+"""
+Password hashers whose cost is set per deployment (see PASSWORD_HASHING in settings).
+
+Django's check_password upgrades a stored hash whenever the preferred hasher
+or its cost parameters differ, so changing the policy rehashes each user on
+their next successful login.
+"""
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    PBKDF2PasswordHasher,
+    ScryptPasswordHasher,
+    Argon2PasswordHasher,
+)
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    iterations = settings.PBKDF2_ITERATIONS or PBKDF2PasswordHasher.iterations
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    work_factor = settings.SCRYPT_WORK_FACTOR
+    block_size = settings.SCRYPT_BLOCK_SIZE
+    parallelism = settings.SCRYPT_PARALLELISM
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """Needs the argon2-cffi package"""
+
+    time_cost = settings.ARGON2_TIME_COST
+    memory_cost = settings.ARGON2_MEMORY_COST
+    parallelism = settings.ARGON2_PARALLELISM
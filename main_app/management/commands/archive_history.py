@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main_app.archive import archive_cutoff, archive_marks, archive_tokens, graduated_students, stale_tokens
+from main_app.routers import shard_aliases
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the marks of graduated cohorts to ArchivedMark and expired or revoked tokens to "
+        "ArchivedUserAuthToken, so Mark and UserAuthToken stay sized to the students currently studying"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", nargs="*", help="databases to archive marks on, defaults to every shard")
+        parser.add_argument("--batch-size", type=int, default=200, help="students moved per transaction")
+        parser.add_argument("--skip-tokens", action="store_true")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        self.stdout.write((
+            f"Archiving marks of students whose {settings.FINAL_SEMESTER_EXAM} sheet was approved "
+            f"and uploaded before {archive_cutoff():%Y-%m-%d}"
+        ))
+        for using in options["database"] or shard_aliases():
+            student_ids = graduated_students(using)
+            if options["dry_run"]:
+                self.stdout.write(f"{using}: {len(student_ids)} graduated students")
+                continue
+            moved = archive_marks(using, student_ids, options["batch_size"])
+            self.stdout.write(f"{using}: {moved} marks of {len(student_ids)} students archived")
+
+        if options["skip_tokens"]:
+            return
+        if options["dry_run"]:
+            self.stdout.write(f"{stale_tokens().count()} tokens to archive")
+            return
+        self.stdout.write(f"{archive_tokens()} tokens archived")
@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main_app.models import MarkSheetDoc
+from main_app.services import move_mark_sheet
+from main_app.storage import ARCHIVE_PREFIX, COMPRESSED_SUFFIX, academic_year, is_archived, is_compressed
+
+
+class Command(BaseCommand):
+    help = "Move mark sheets of past academic years to the archive tier and optionally gzip older sheets"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--compress-older-than", type=int, metavar="DAYS",
+            help="gzip sheets uploaded more than DAYS days ago",
+        )
+        parser.add_argument("--no-archive", action="store_true", help="only compress, keep every sheet in the hot tier")
+        parser.add_argument("--database", default="default")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        current_year = academic_year(now)
+        compress_before = None
+        if options["compress_older_than"] is not None:
+            compress_before = now - timedelta(days=options["compress_older_than"])
+
+        moved = 0
+        # old name -> new name, the semesters of a grade card share one pdf and move together
+        moved_names = {}
+        # claims still being parsed (or released) have no file yet
+        mark_docs = MarkSheetDoc.objects.using(options["database"]).exclude(mark_sheet="").order_by("id")
+        for mark_doc in mark_docs.iterator():
+            name = mark_doc.mark_sheet.name
+            if name in moved_names:
+                continue
+            new_name = name
+            if not options["no_archive"] and not is_archived(name) and academic_year(mark_doc.created_time) < current_year:
+                new_name = ARCHIVE_PREFIX + new_name
+            if compress_before and not is_compressed(name) and mark_doc.created_time < compress_before:
+                new_name = new_name + COMPRESSED_SUFFIX
+            if new_name == name:
+                continue
+
+            self.stdout.write(f"{name} -> {new_name}")
+            if not options["dry_run"]:
+                new_name = move_mark_sheet(mark_doc, new_name)
+            moved_names[name] = new_name
+            moved += 1
+        self.stdout.write(f"{moved} mark sheets moved")
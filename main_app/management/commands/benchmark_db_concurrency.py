@@ -0,0 +1,90 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction, OperationalError
+
+from main_app.models import User, Exam, Subject, Student, Mark
+
+
+class RollbackBenchmark(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent mark-list write transactions against the configured database "
+        "(run once per DATABASE_ENGINE profile to compare backends). Every transaction is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+        parser.add_argument("--transactions", type=int, default=50, help="transactions per thread")
+        parser.add_argument("--rows", type=int, default=8, help="Mark rows per transaction")
+
+    def handle(self, *args, **options):
+        student = Student.objects.select_related("course").first()
+        exam = Exam.objects.first()
+        user = User.objects.first()
+        if student is None or exam is None:
+            raise CommandError("Needs at least one Student and Exam, run populate_db_script.py first")
+        subject = Subject.objects.filter(course=student.course).first()
+        if subject is None:
+            raise CommandError(f"Needs a Subject for {student.course}")
+
+        self.stdout.write(f"backend: {connection.vendor}")
+        for threads in options["threads"]:
+            self.run(threads, options["transactions"], options["rows"], user, student, subject, exam)
+
+    def run(self, thread_count, transactions, rows, user, student, subject, exam):
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def worker():
+            from django.db import connection as thread_connection
+            try:
+                for _ in range(transactions):
+                    start = time.perf_counter()
+                    try:
+                        with transaction.atomic():
+                            for _ in range(rows):
+                                Mark(
+                                    grade="A",
+                                    grade_point=8,
+                                    credit=4,
+                                    credit_point=32,
+                                    status="Passed",
+                                    student=student,
+                                    subject=subject,
+                                    exam=exam,
+                                    added_by=user,
+                                ).save()
+                            raise RollbackBenchmark
+                    except RollbackBenchmark:
+                        with lock:
+                            latencies.append(time.perf_counter() - start)
+                    except OperationalError as e:
+                        with lock:
+                            errors.append(str(e))
+            finally:
+                thread_connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(thread_count)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        if latencies:
+            p50 = latencies[len(latencies) // 2] * 1000
+            p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+        else:
+            p50 = p95 = 0
+        self.stdout.write(
+            f"threads={thread_count}: {len(latencies) / elapsed:.1f} tx/s, "
+            f"p50 {p50:.1f} ms, p95 {p95:.1f} ms, {len(errors)} lock errors"
+        )
@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+
+class Command(BaseCommand):
+    help = "Report password verifications (logins) per core per second under each hashing policy"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--policy", nargs="+", default=list(settings.PASSWORD_HASHER_POLICIES))
+        parser.add_argument(
+            "--pbkdf2-iterations", type=int, nargs="*", default=[],
+            help="extra PBKDF2 iteration counts to try",
+        )
+        parser.add_argument("--logins", type=int, default=20, help="verifications timed per policy")
+
+    def handle(self, *args, **options):
+        hashers = []
+        for policy in options["policy"]:
+            hasher_class = import_string(settings.PASSWORD_HASHER_POLICIES[policy])
+            hashers.append((policy, hasher_class()))
+        for iterations in options["pbkdf2_iterations"]:
+            hasher_class = import_string(settings.PASSWORD_HASHER_POLICIES["pbkdf2"])
+            hasher = type("BenchmarkPBKDF2PasswordHasher", (hasher_class,), {"iterations": iterations})()
+            hashers.append((f"pbkdf2 ({iterations} iterations)", hasher))
+
+        self.stdout.write(f"active policy: {settings.PASSWORD_HASHING}")
+        for name, hasher in hashers:
+            try:
+                encoded = hasher.encode("benchmark-password", hasher.salt())
+            except ValueError as e:
+                # eg: argon2-cffi not installed
+                self.stdout.write(f"{name}: skipped ({e})")
+                continue
+            start = time.perf_counter()
+            for _ in range(options["logins"]):
+                hasher.verify("benchmark-password", encoded)
+            elapsed = (time.perf_counter() - start) / options["logins"]
+            self.stdout.write(
+                f"{name}: {elapsed * 1000:.1f} ms per login, {1 / elapsed:.1f} logins/core/s"
+            )
@@ -0,0 +1,155 @@
+import json
+import time
+import tracemalloc
+from pathlib import Path
+from types import SimpleNamespace
+
+import pdfplumber
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.errors import InvalidDocumentError
+from main_app.extractors import extract_template_table
+from main_app.sample_sheets import MANIFEST_NAME
+from main_app.services import verify_document
+
+
+# edges and rects derived from the parsed layout, dropped between timed runs
+# so each extraction redoes them but not the pdfminer layout parse itself
+DERIVED_CACHES = ["_rect_edges", "_edges"]
+
+
+def parse(path, exam):
+    """The upload parse path: open the pdf and verify / extract page 1"""
+    with pdfplumber.open(path) as pdf:
+        try:
+            return verify_document(pdf.pages[0], exam)
+        except InvalidDocumentError:
+            return False
+
+
+def row_accuracy(rows, expected_rows):
+    """Share of expected mark rows (header excluded) extracted exactly"""
+    expected_marks = expected_rows[1:]
+    if not expected_marks:
+        return None
+    extracted = rows[1:] if rows else []
+    return sum(1 for row in expected_marks if row in extracted) / len(expected_marks)
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the Calicut template extractor against page.extract_table() on a folder of result sheets, "
+        "both on the already parsed page with the layout parse reported separately. "
+        "For a corpus from generate_sample_sheets also time the full upload parse, its peak memory, "
+        "and check the accepted/rejected outcome and mark row accuracy of every fixture."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("corpus", help="directory containing result sheet pdfs")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument(
+            "--check", action="store_true",
+            help="fail when a fixture is wrongly accepted/rejected or an accepted one parses differently",
+        )
+
+    def handle(self, *args, **options):
+        corpus = Path(options["corpus"])
+        files = sorted(corpus.glob("*.pdf"))
+        if not files:
+            raise CommandError(f"No pdf files found in {corpus}")
+        manifest_path = corpus / MANIFEST_NAME
+        manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+        repeat = options["repeat"]
+
+        total_layout = 0
+        total_template = 0
+        total_table = 0
+        total_parse = 0
+        matched = 0
+        accuracies = []
+        failures = []
+        for path in files:
+            with pdfplumber.open(path) as pdf:
+                page = pdf.pages[0]
+
+                # the layout parse both strategies share on upload
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    page.flush_cache()
+                    page.objects
+                layout_time = (time.perf_counter() - start) / repeat
+
+                # then each strategy on the parsed page, as verify_document runs it
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    page.flush_cache(DERIVED_CACHES)
+                    template_rows = extract_template_table(page)
+                template_time = (time.perf_counter() - start) / repeat
+
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    page.flush_cache(DERIVED_CACHES)
+                    table_rows = page.extract_table()
+                table_time = (time.perf_counter() - start) / repeat
+
+            if template_rows is None:
+                result = "fallback"
+            elif template_rows == table_rows:
+                result = "match"
+                matched += 1
+            else:
+                result = "MISMATCH"
+            total_layout += layout_time
+            total_template += template_time
+            total_table += table_time
+            line = (
+                f"{path.name}: layout {layout_time * 1000:.1f} ms, template {template_time * 1000:.1f} ms, "
+                f"extract_table {table_time * 1000:.1f} ms, {result}"
+            )
+
+            expected = manifest.get(path.name)
+            if expected is not None:
+                exam = SimpleNamespace(exam_name=f"Semester {expected['semester']}")
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    rows = parse(path, exam)
+                parse_time = (time.perf_counter() - start) / repeat
+                total_parse += parse_time
+
+                tracemalloc.start()
+                parse(path, exam)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+                accepted = bool(rows)
+                line += f", parse {parse_time * 1000:.1f} ms, peak {peak / 1024:.0f} KiB"
+                if accepted != expected["valid"]:
+                    line += f", WRONGLY {'ACCEPTED' if accepted else 'REJECTED'}"
+                    failures.append(path.name)
+                elif accepted:
+                    accuracy = row_accuracy(rows, expected["rows"])
+                    accuracies.append(accuracy)
+                    line += f", rows {accuracy:.0%}"
+                    if rows != expected["rows"]:
+                        failures.append(path.name)
+                else:
+                    line += ", rejected"
+            self.stdout.write(line)
+
+        saving = 1 - total_template / total_table if total_table else 0
+        self.stdout.write(
+            f"\n{len(files)} files, {matched} matched the template\n"
+            f"layout parse total {total_layout * 1000:.1f} ms (shared by both)\n"
+            f"template total {total_template * 1000:.1f} ms, "
+            f"extract_table total {total_table * 1000:.1f} ms ({saving:.0%} saved on the parsed page)\n"
+            f"with the parse: {(total_layout + total_template) * 1000:.1f} ms vs "
+            f"{(total_layout + total_table) * 1000:.1f} ms"
+        )
+        if manifest:
+            mean_accuracy = sum(accuracies) / len(accuracies) if accuracies else 0
+            self.stdout.write(
+                f"upload parse total {total_parse * 1000:.1f} ms, "
+                f"mean row accuracy of accepted sheets {mean_accuracy:.1%}, {len(failures)} failing fixtures"
+            )
+        if options["check"] and failures:
+            raise CommandError(f"Parser regression in {', '.join(failures)}")
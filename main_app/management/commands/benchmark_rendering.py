@@ -0,0 +1,104 @@
+import json
+import random
+import time
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+
+from main_app.compression import brotli, compress
+from main_app.renderers import FastJSONRenderer, orjson
+
+
+GRADES = ["O", "A+", "A", "B+", "B", "C", "P", "F"]
+
+
+class MarkSerializer(serializers.Serializer):
+    """Shape of the per-mark serializer the mark list views used before the .values() fast path"""
+    id = serializers.IntegerField()
+    grade = serializers.CharField()
+    grade_point = serializers.IntegerField()
+    credit = serializers.IntegerField()
+    credit_point = serializers.IntegerField()
+    status = serializers.CharField()
+    subject_code = serializers.SerializerMethodField()
+    subject_name = serializers.SerializerMethodField()
+
+    def get_subject_code(self, obj):
+        return obj.subject.subject_code
+
+    def get_subject_name(self, obj):
+        return obj.subject.subject_name
+
+
+def class_list(students, subjects):
+    subject_rows = [
+        SimpleNamespace(subject_code=f"BCS{i + 1}B{i + 2:02d}", subject_name=f"Subject number {i + 1} of the semester")
+        for i in range(subjects)
+    ]
+    rows = []
+    for student in range(students):
+        for subject in subject_rows:
+            grade_point = random.randint(0, 10)
+            rows.append({
+                "id": len(rows) + 1,
+                "grade": random.choice(GRADES),
+                "grade_point": grade_point,
+                "credit": 4,
+                "credit_point": grade_point * 4,
+                "status": "Passed" if grade_point else "Failed",
+                "subject_code": subject.subject_code,
+                "subject_name": subject.subject_name,
+                "subject": subject,
+            })
+    return rows
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - start) / repeat
+
+
+class Command(BaseCommand):
+    help = "Compare render time and payload bytes of a class mark list, serializer + stdlib json vs .values() + orjson"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--students", type=int, default=2000)
+        parser.add_argument("--subjects", type=int, default=6)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        random.seed(0)
+        rows = class_list(options["students"], options["subjects"])
+        objects = [SimpleNamespace(**row) for row in rows]
+        values = [{key: value for key, value in row.items() if key != "subject"} for row in rows]
+        repeat = options["repeat"]
+        self.stdout.write(f"{len(rows)} marks, orjson {'installed' if orjson else 'missing'}")
+
+        baseline, baseline_time = timed(
+            lambda: JSONRenderer().render(MarkSerializer(objects, many=True).data), repeat
+        )
+        stdlib, stdlib_time = timed(lambda: JSONRenderer().render(values), repeat)
+        fast, fast_time = timed(lambda: FastJSONRenderer().render(values), repeat)
+        # the fast paths have to produce the same mark list
+        if baseline != stdlib or json.loads(fast) != json.loads(stdlib):
+            raise CommandError("The .values() mark list renders differently from the serializer's")
+        for name, elapsed in [
+            ("serializer + JSONRenderer", baseline_time),
+            (".values() + JSONRenderer", stdlib_time),
+            (".values() + FastJSONRenderer", fast_time),
+        ]:
+            self.stdout.write(f"{name}: {elapsed * 1000:.1f} ms, {baseline_time / elapsed:.1f}x")
+
+        self.stdout.write(f"identity: {len(fast)} bytes")
+        encodings = ["gzip", "br"] if brotli else ["gzip"]
+        for encoding in encodings:
+            compressed, elapsed = timed(lambda: compress(fast, encoding), repeat)
+            self.stdout.write(
+                f"{encoding}: {len(compressed)} bytes ({len(compressed) / len(fast):.1%}), {elapsed * 1000:.1f} ms"
+            )
+        self.stdout.write(f"compression threshold: {settings.COMPRESSION_MIN_SIZE} bytes")
@@ -0,0 +1,398 @@
+import contextlib
+import json
+import os
+import queue
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.models import User, Course, Exam, Faculty, Student, Mark, MarkSheetDoc, RankSnapshot
+from main_app.routers import activate_user_routing, reset_routing, shard_aliases
+from main_app.sample_sheets import make_sheet
+from main_app.services import onboard_students
+
+
+PREFIX = "loadtest-"
+FACULTY_USERNAME = f"{PREFIX}faculty"
+FACULTY_PASSWORD = "loadtest-faculty"
+ENDPOINTS = ("login", "exam_dropdown", "upload", "marks_view", "approve")
+# one approving faculty per this many concurrent students
+STUDENTS_PER_FACULTY = 20
+# a level saturates when throughput grows less than this despite more concurrency
+SATURATION_GAIN = 1.1
+
+
+def percentile(values, q):
+    """Nearest rank percentile of sorted values"""
+    if not values:
+        return 0
+    return values[min(len(values) - 1, max(0, int(round(q / 100 * len(values))) - 1))]
+
+
+def multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    body = b""
+    for name, value in fields.items():
+        body += (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+        ).encode()
+    for name, (filename, content) in files.items():
+        body += (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f"Content-Type: application/pdf\r\n\r\n"
+        ).encode() + content + b"\r\n"
+    body += f"--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+class Recorder:
+    """Latency and status of every request of one concurrency level"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        # first failure body per endpoint, to tell lock timeouts from app errors
+        self.error_samples = {}
+        self.journeys = 0
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, latency, ok, content=b""):
+        with self.lock:
+            self.latencies[endpoint].append(latency)
+            if not ok:
+                self.errors[endpoint] += 1
+                self.error_samples.setdefault(endpoint, content[:200].decode(errors="replace"))
+
+    def journey_done(self):
+        with self.lock:
+            self.journeys += 1
+
+    def summary(self, concurrency, elapsed):
+        requests = sum(len(latencies) for latencies in self.latencies.values())
+        errors = sum(self.errors.values())
+        endpoints = {}
+        for endpoint in ENDPOINTS:
+            latencies = sorted(self.latencies[endpoint])
+            endpoints[endpoint] = {
+                "requests": len(latencies),
+                "errors": self.errors[endpoint],
+                "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+                "error_sample": self.error_samples.get(endpoint),
+            }
+        return {
+            "concurrency": concurrency,
+            "seconds": round(elapsed, 1),
+            "requests": requests,
+            "requests_per_second": round(requests / elapsed, 1) if elapsed else 0,
+            "journeys": self.journeys,
+            "error_rate": round(errors / requests, 4) if requests else 0,
+            "endpoints": endpoints,
+        }
+
+
+class Client:
+
+    def __init__(self, base_url, recorder, timeout):
+        self.base_url = base_url.rstrip("/")
+        self.recorder = recorder
+        self.timeout = timeout
+        self.token = None
+
+    def request(self, endpoint, method, path, params=None, data=None, files=None):
+        url = f"{self.base_url}/api/{path}"
+        headers = {}
+        body = None
+        if params:
+            url += "?" + urllib.parse.urlencode(params)
+        if files:
+            body, headers["Content-Type"] = multipart(data or {}, files)
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        if self.token:
+            headers["Authorization"] = f"Token {self.token}"
+
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(
+                urllib.request.Request(url, data=body, headers=headers, method=method), timeout=self.timeout
+            ) as response:
+                status, content = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, content = e.code, e.read()
+        except OSError as e:
+            status, content = 0, str(e).encode()
+        self.recorder.record(endpoint, time.perf_counter() - start, 200 <= status < 300, content)
+        try:
+            return status, json.loads(content) if content else None
+        except ValueError:
+            return status, None
+
+    def login(self, username, password):
+        status, data = self.request("login", "POST", "login/", data={"username": username, "password": password})
+        self.token = data.get("token") if 200 <= status < 300 and isinstance(data, dict) else None
+        return self.token is not None
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay result day against a seeded instance: students log in, load the exam dropdown, upload a "
+        "synthetic mark sheet and poll their marks while faculty approve the sheets. Ramps concurrency per "
+        "gunicorn worker count and reports requests/s, p50/p95/p99 per endpoint and the saturation point. "
+        "Use the DATABASE_ENGINE=postgres profile for real numbers, SQLite fails concurrent uploads "
+        "with 'database is locked'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", help="test a running server instead of starting gunicorn per --workers")
+        parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="gunicorn worker counts")
+        parser.add_argument("--port", type=int, default=8765, help="port of the gunicorn started for the test")
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 8, 16, 32], help="concurrent students per level")
+        parser.add_argument("--duration", type=int, default=30, help="seconds per concurrency level")
+        parser.add_argument("--students", type=int, default=400, help="seeded students (each uploads once per level)")
+        parser.add_argument("--exam", default="Semester 2", help="exam the students upload for")
+        parser.add_argument("--polls", type=int, default=5, help="ViewMarkSheetView polls per student after uploading")
+        parser.add_argument("--think", type=float, default=0, help="seconds between a student's requests")
+        parser.add_argument("--timeout", type=float, default=60, help="request timeout in seconds")
+        parser.add_argument("--slo", type=float, default=2000, help="p95 in ms above which a level counts as saturated")
+        parser.add_argument("--report", help="also write the capacity report as json to this file")
+        parser.add_argument("--teardown", action="store_true", help="delete the seeded students and faculty afterwards")
+
+    def handle(self, *args, **options):
+        exam = Exam.active_objects.filter(exam_name=options["exam"]).first()
+        course = Course.active_objects.order_by("id").first()
+        if exam is None or course is None:
+            raise CommandError("Needs the exam and a course, run populate_db_script.py first")
+        semester = options["exam"].split()[-1]
+        if not semester.isdigit():
+            raise CommandError("--exam must be one of the 'Semester <n>' exams")
+        semester = int(semester)
+
+        students = self.seed(course, options["students"])
+        # a handful of distinct sheets, generated up front so the clients only send them
+        sheets = [make_sheet(semester, subjects=6, seed=i)[0] for i in range(16)]
+
+        levels = options["concurrency"]
+        report = {"exam": exam.exam_name, "polls": options["polls"], "think": options["think"], "runs": []}
+        try:
+            targets = [("external", options["url"])] if options["url"] else [(n, None) for n in options["workers"]]
+            for workers, url in targets:
+                with self.server(workers, url, options["port"]) as base_url:
+                    self.stdout.write(f"\nworkers: {workers} ({base_url})")
+                    results = []
+                    for concurrency in levels:
+                        self.reset(students)
+                        result = self.run_level(base_url, concurrency, students, exam, sheets, options)
+                        results.append(result)
+                        self.write_level(result)
+                    run = {"workers": workers, "levels": results, **self.saturation(results, options["slo"])}
+                    report["runs"].append(run)
+                    self.write_run(run)
+        finally:
+            self.reset(students)
+            if options["teardown"]:
+                self.teardown()
+
+        if options["report"]:
+            with open(options["report"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"\nreport written to {options['report']}")
+
+    def seed(self, course, count):
+        """Throwaway students (password = registration no) and an approving faculty of the course"""
+        admin = User.objects.filter(is_superuser=True).first()
+        faculty_user = User.objects.filter(username=FACULTY_USERNAME).first()
+        if faculty_user is None:
+            faculty_user = User.objects.create_user(FACULTY_USERNAME, password=FACULTY_PASSWORD, role=2)
+            Faculty.objects.create(user=faculty_user, course=course, added_by=admin or faculty_user)
+
+        rows = [
+            {"username": f"{PREFIX}{i:05d}", "name": f"Load Test {i}", "registration_no": f"LT{i:05d}"}
+            for i in range(count)
+        ]
+        existing = set(User.objects.filter(username__startswith=PREFIX).values_list("username", flat=True))
+        missing = [row for row in rows if row["username"] not in existing]
+        if missing:
+            self.stdout.write(f"seeding {len(missing)} students")
+            activate_user_routing(faculty_user)
+            try:
+                onboard_students(faculty_user, course, missing, hash_workers=os.cpu_count())
+            finally:
+                reset_routing()
+        return [(row["username"], row["registration_no"]) for row in rows]
+
+    def reset(self, students):
+        """Drop what the previous level uploaded, so every student can upload again"""
+        user_ids = list(
+            User.objects.filter(username__in=[username for username, password in students]).values_list("id", flat=True)
+        )
+        for using in shard_aliases():
+            mark_sheets = MarkSheetDoc.objects.using(using).filter(student__user_id__in=user_ids)
+            for mark_doc in mark_sheets.exclude(mark_sheet=""):
+                mark_doc.mark_sheet.delete(save=False)
+            RankSnapshot.objects.using(using).filter(student__user_id__in=user_ids).delete()
+            Mark.objects.using(using).filter(student__user_id__in=user_ids).delete()
+            mark_sheets.delete()
+
+    def teardown(self):
+        users = User.objects.filter(username__startswith=PREFIX)
+        user_ids = list(users.values_list("id", flat=True))
+        for using in shard_aliases():
+            Student.objects.using(using).filter(user_id__in=user_ids).delete()
+        Faculty.objects.filter(user_id__in=user_ids).delete()
+        users.delete()
+
+    @contextlib.contextmanager
+    def server(self, workers, url, port):
+        if url:
+            yield url
+            return
+        env = dict(os.environ, GUNICORN_WORKERS=str(workers), GUNICORN_BIND=f"127.0.0.1:{port}")
+        process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"],
+            cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            deadline = time.monotonic() + 30
+            while True:
+                if process.poll() is not None:
+                    raise CommandError(f"gunicorn exited with {process.returncode}, is it installed?")
+                try:
+                    socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                    break
+                except OSError:
+                    if time.monotonic() > deadline:
+                        raise CommandError("gunicorn did not start listening within 30 s")
+                    time.sleep(0.2)
+            yield f"http://127.0.0.1:{port}"
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def run_level(self, base_url, concurrency, students, exam, sheets, options):
+        recorder = Recorder()
+        pool = iter(enumerate(students))
+        pool_lock = threading.Lock()
+        uploaded = queue.Queue()
+        deadline = time.monotonic() + options["duration"]
+        students_done = threading.Event()
+        think = options["think"]
+
+        def next_student():
+            with pool_lock:
+                return next(pool, None)
+
+        def student():
+            while time.monotonic() < deadline:
+                item = next_student()
+                if item is None:
+                    return
+                i, (username, password) = item
+                client = Client(base_url, recorder, options["timeout"])
+                if not client.login(username, password):
+                    continue
+                time.sleep(think)
+                client.request("exam_dropdown", "GET", "dropdown/exam/")
+                time.sleep(think)
+                client.request(
+                    "upload", "POST", "upload/marksheet/",
+                    data={"exam": exam.id}, files={"doc": (f"{username}.pdf", sheets[i % len(sheets)])},
+                )
+                queued = False
+                for _ in range(options["polls"]):
+                    time.sleep(think)
+                    status, data = client.request("marks_view", "GET", "marks/view/", params={"exam": exam.id})
+                    if not queued and status == 200 and isinstance(data, dict) and data.get("marksheet_id"):
+                        uploaded.put(data["marksheet_id"])
+                        queued = True
+                recorder.journey_done()
+
+        def faculty():
+            client = Client(base_url, recorder, options["timeout"])
+            if not client.login(FACULTY_USERNAME, FACULTY_PASSWORD):
+                return
+            while not (students_done.is_set() and uploaded.empty()):
+                try:
+                    marksheet_id = uploaded.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                client.request("approve", "POST", "marksheet/status/", data={"marksheet": marksheet_id, "status": "Approve"})
+
+        student_threads = [threading.Thread(target=student) for _ in range(concurrency)]
+        faculty_threads = [threading.Thread(target=faculty) for _ in range(max(1, concurrency // STUDENTS_PER_FACULTY))]
+        start = time.perf_counter()
+        for thread in student_threads + faculty_threads:
+            thread.start()
+        for thread in student_threads:
+            thread.join()
+        students_done.set()
+        for thread in faculty_threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        if next_student() is None:
+            self.stderr.write(f"  all {len(students)} students used before the level ended, seed more with --students")
+        return recorder.summary(concurrency, elapsed)
+
+    def write_level(self, result):
+        self.stdout.write(
+            f"  concurrency {result['concurrency']}: {result['requests_per_second']} req/s, "
+            f"{result['journeys']} journeys in {result['seconds']} s, {result['error_rate']:.1%} errors"
+        )
+        for endpoint, stats in result["endpoints"].items():
+            if stats["requests"]:
+                self.stdout.write(
+                    f"    {endpoint:<14} {stats['requests']:>6} req  p50 {stats['p50_ms']:>8.1f} ms  "
+                    f"p95 {stats['p95_ms']:>8.1f} ms  p99 {stats['p99_ms']:>8.1f} ms  {stats['errors']} errors"
+                )
+                if stats["error_sample"]:
+                    self.stdout.write(f"      eg: {stats['error_sample']}")
+
+    def write_run(self, run):
+        if run["sustained_concurrency"] is None:
+            self.stdout.write(f"  saturated already at concurrency {run['saturation_concurrency']}")
+            return
+        self.stdout.write(
+            f"  sustained {run['sustained_requests_per_second']} req/s at concurrency {run['sustained_concurrency']}, "
+            + (f"saturated at {run['saturation_concurrency']}" if run["saturation_concurrency"] else "not saturated")
+        )
+
+    def saturation(self, results, slo):
+        """
+        Highest level that still scaled, and the first one that did not: its
+        throughput grew less than SATURATION_GAIN, a p95 broke the SLO or more
+        than 1% of its requests failed
+        """
+        sustained = None
+        for result in results:
+            worst_p95 = max(stats["p95_ms"] for stats in result["endpoints"].values())
+            saturated = (
+                result["error_rate"] > 0.01
+                or worst_p95 > slo
+                or (sustained and result["requests_per_second"] < sustained["requests_per_second"] * SATURATION_GAIN)
+            )
+            if saturated:
+                break
+            sustained = result
+        else:
+            result = None
+        return {
+            "sustained_concurrency": sustained["concurrency"] if sustained else None,
+            "sustained_requests_per_second": sustained["requests_per_second"] if sustained else 0,
+            "saturation_concurrency": result["concurrency"] if result else None,
+        }
@@ -0,0 +1,81 @@
+import json
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand
+
+
+# Run in a fresh interpreter per scenario: load the app like a worker does,
+# then fork a "worker" that collects garbage (as it would while serving) and
+# report how much of its memory stayed shared with the parent.
+PROBE = r"""
+import gc, json, os, sys, time
+
+def memory(pid="self"):
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Private_Clean", "Private_Dirty"):
+                values[key] = int(rest.split()[0])
+    return values["Rss"], values["Private_Clean"] + values["Private_Dirty"]
+
+start = time.perf_counter()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "docomizer.settings")
+import docomizer.wsgi
+from django.urls import get_resolver
+get_resolver().url_patterns
+if EAGER_PDF:
+    import pdfplumber
+import_time = time.perf_counter() - start
+rss, _ = memory()
+if FREEZE:
+    gc.freeze()
+
+read_fd, write_fd = os.pipe()
+pid = os.fork()
+if pid == 0:
+    gc.collect()
+    os.write(write_fd, json.dumps(memory()).encode())
+    os._exit(0)
+os.waitpid(pid, 0)
+worker_rss, worker_private = json.loads(os.read(read_fd, 4096))
+print(json.dumps({
+    "import_time": import_time,
+    "rss": rss,
+    "worker_private": worker_private,
+    "pdf_stack": "pdfplumber" in sys.modules,
+}))
+"""
+
+SCENARIOS = [
+    ("eager pdf stack (before)", True, False),
+    ("lazy pdf stack", False, False),
+    ("lazy pdf stack + preload gc.freeze (after)", False, True),
+    ("parser pool: preloaded pdf stack + gc.freeze", True, True),
+]
+
+
+class Command(BaseCommand):
+    help = "Report app import time, process RSS and per-worker private memory with and without the lazy pdf stack"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def probe(self, eager_pdf, freeze):
+        code = f"EAGER_PDF = {eager_pdf}\nFREEZE = {freeze}\n" + PROBE
+        output = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        ).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        for name, eager_pdf, freeze in SCENARIOS:
+            runs = [self.probe(eager_pdf, freeze) for _ in range(options["repeat"])]
+            import_time = min(run["import_time"] for run in runs)
+            rss = min(run["rss"] for run in runs)
+            private = min(run["worker_private"] for run in runs)
+            self.stdout.write(
+                f"{name}: import {import_time * 1000:.0f} ms, RSS {rss / 1024:.1f} MiB, "
+                f"forked worker private {private / 1024:.1f} MiB, pdf stack loaded: {runs[0]['pdf_stack']}"
+            )
@@ -0,0 +1,102 @@
+import threading
+import uuid
+from collections import Counter
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+
+from main_app.models import User, Exam, Course, Student, Mark, MarkSheetDoc
+from main_app.services import create_auth_token
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire parallel uploads of one mark sheet for a throwaway student, without and with a shared "
+        "Idempotency-Key, and check exactly one upload is parsed and saved"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("pdf", help="a mark sheet pdf that uploads cleanly for --exam")
+        parser.add_argument("--exam", default="Semester 2", help="exam name the pdf is for")
+        parser.add_argument("--course", help="course name, defaults to the first course")
+        parser.add_argument("--uploads", type=int, default=8, help="parallel uploads per round")
+        parser.add_argument("--keep", action="store_true", help="keep the throwaway students and their sheets")
+
+    def handle(self, *args, **options):
+        exam = Exam.active_objects.filter(exam_name=options["exam"]).first()
+        courses = Course.active_objects.order_by("id")
+        course = courses.filter(course_name=options["course"]).first() if options["course"] else courses.first()
+        if exam is None or course is None:
+            raise CommandError("Needs the exam and a course, run populate_db_script.py first")
+        with open(options["pdf"], "rb") as f:
+            pdf = f.read()
+
+        failures = []
+        for idempotency_key in (None, uuid.uuid4().hex):
+            failures += self.round(pdf, exam, course, options["uploads"], idempotency_key, options["keep"])
+        if failures:
+            raise CommandError("\n".join(failures))
+        self.stdout.write("OK: one parsed upload per round")
+
+    def round(self, pdf, exam, course, uploads, idempotency_key, keep):
+        admin = User.objects.filter(is_superuser=True).first()
+        username = f"concurrency-{uuid.uuid4().hex[:8]}"
+        user = User.objects.create_user(username, password=uuid.uuid4().hex, role=3, first_name=username)
+        student = Student.objects.create(user=user, course=course, registration_no=username, added_by=admin or user)
+        token = create_auth_token(user)
+
+        barrier = threading.Barrier(uploads)
+        responses = []
+        lock = threading.Lock()
+
+        def upload():
+            client = Client()
+            headers = {"HTTP_AUTHORIZATION": f"Token {token}"}
+            if idempotency_key:
+                headers["HTTP_IDEMPOTENCY_KEY"] = idempotency_key
+            barrier.wait()
+            try:
+                doc = SimpleUploadedFile(f"{username}.pdf", pdf, content_type="application/pdf")
+                response = client.post("/api/upload/marksheet/", {"exam": exam.id, "doc": doc}, **headers)
+                with lock:
+                    responses.append((response.status_code, str(response.json())))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=upload) for _ in range(uploads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        using = student._state.db
+        mark_sheets = MarkSheetDoc.objects.using(using).filter(student=student, exam=exam)
+        active_sheets = mark_sheets.filter(is_active=True).count()
+        duplicate_marks = (
+            Mark.objects.using(using).filter(student=student, exam=exam, is_active=True)
+            .values("subject").annotate(count=Count("id")).filter(count__gt=1).count()
+        )
+        outcomes = Counter(responses)
+        label = "shared Idempotency-Key" if idempotency_key else "no Idempotency-Key"
+        self.stdout.write(f"{label}: {uploads} uploads")
+        for (status_code, body), count in outcomes.most_common():
+            self.stdout.write(f"  {count} x {status_code} {body}")
+        self.stdout.write(f"  active mark sheets: {active_sheets}, subjects with duplicate marks: {duplicate_marks}")
+
+        failures = []
+        created = sum(count for (status_code, body), count in outcomes.items() if status_code == 200)
+        if active_sheets != 1 or duplicate_marks:
+            failures.append(f"{label}: {active_sheets} active mark sheets, {duplicate_marks} duplicated subjects")
+        if not idempotency_key and created != 1:
+            failures.append(f"{label}: {created} uploads reported success")
+
+        if not keep:
+            for mark_doc in mark_sheets:
+                if mark_doc.mark_sheet:
+                    mark_doc.mark_sheet.delete(save=False)
+            student.delete()
+            user.delete()
+        return failures
@@ -0,0 +1,25 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from main_app.sample_sheets import corpus, MANIFEST_NAME
+
+
+class Command(BaseCommand):
+    help = "Write a corpus of synthetic Calicut result sheets and the expected parse of each (for benchmark_parser)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory")
+        parser.add_argument("--count", type=int, default=60)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        directory = Path(options["directory"])
+        directory.mkdir(parents=True, exist_ok=True)
+        manifest = {}
+        for name, pdf, expected in corpus(options["count"], options["seed"]):
+            (directory / name).write_bytes(pdf)
+            manifest[name] = expected
+        (directory / MANIFEST_NAME).write_text(json.dumps(manifest, indent=1))
+        self.stdout.write(f"{len(manifest)} sheets written to {directory}")
@@ -0,0 +1,30 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.models import User, Faculty
+from main_app.routers import activate_user_routing
+from main_app.services import parse_student_rows, onboard_students
+
+
+class Command(BaseCommand):
+    help = "Create the students listed in a csv/json file (username, name, registration_no) for a faculty's course"
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help="csv with a header row, or json list of students")
+        parser.add_argument("--faculty", required=True, help="username of the faculty adding the students")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes hashing the passwords")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["faculty"], role=2)
+            faculty = Faculty.objects.get(user=user)
+        except (User.DoesNotExist, Faculty.DoesNotExist):
+            raise CommandError(f"No faculty with username {options['faculty']}")
+
+        activate_user_routing(user)
+        with open(options["file"], "rb") as file:
+            rows = parse_student_rows(file)
+        report = onboard_students(user, faculty.course, rows, hash_workers=options["workers"])
+        self.stdout.write(json.dumps(report, indent=2))
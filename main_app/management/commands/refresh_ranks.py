@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from main_app.models import Course, MarkSheetDoc
+from main_app.routers import shard_for_course
+from main_app.services import refresh_ranks
+
+
+class Command(BaseCommand):
+    help = "Rebuild the rank snapshot of every (course, exam) cohort with approved mark sheets"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--course", type=int, nargs="*", help="course ids, defaults to every course")
+
+    def handle(self, *args, **options):
+        courses = Course.active_objects.all()
+        if options["course"]:
+            courses = courses.filter(id__in=options["course"])
+        for course in courses:
+            exam_ids = (
+                MarkSheetDoc.active_objects.using(shard_for_course(course.id))
+                .filter(student__course=course, status=MarkSheetDoc.APPROVED)
+                .values_list("exam_id", flat=True).distinct()
+            )
+            for exam_id in exam_ids:
+                ranked = refresh_ranks(course.id, exam_id)
+                self.stdout.write(f"{course} / exam {exam_id}: {ranked} students ranked")
@@ -0,0 +1,27 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main_app.models import MarkSheetDoc
+from main_app.previews import has_preview, render_preview_by_id
+
+
+class Command(BaseCommand):
+    help = "Render missing page 1 previews for uploaded mark sheets"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=settings.PREVIEW_WORKERS)
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        mark_docs = (
+            MarkSheetDoc.active_objects.using(options["database"]).exclude(mark_sheet="").only("id", "mark_sheet")
+        )
+        missing = [mark_doc.id for mark_doc in mark_docs.iterator() if not has_preview(mark_doc)]
+        self.stdout.write(f"{len(missing)} mark sheets without a preview")
+
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            for mark_doc_id in missing:
+                executor.submit(render_preview_by_id, mark_doc_id, options["database"])
+        self.stdout.write("Done")
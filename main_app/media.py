@@ -0,0 +1,116 @@
+"""
+Serving stored mark sheet files to authenticated users.
+
+With settings.MEDIA_SENDFILE set to "nginx" (X-Accel-Redirect) or "apache"
+(X-Sendfile) Django only checks permissions and the front web server sends
+the file. Otherwise the file is streamed from storage with ETag and single
+HTTP Range support, so repeat and partial fetches (pdf viewers) stay cheap.
+"""
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+
+def file_etag(storage, name):
+    try:
+        size = storage.size(name)
+        modified = storage.get_modified_time(name).timestamp()
+    except (NotImplementedError, OSError):
+        return None
+    return f'"{size:x}-{int(modified):x}"'
+
+
+def etag_matches(etag, header):
+    """If-None-Match check: any of the listed (possibly weak) tags, or *"""
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single byte range, None to send the whole file"""
+    match = RANGE_RE.match(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    start, end = match.groups()
+    if start == "":
+        # suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = int(end) if end else size - 1
+    if start >= size or end < start:
+        raise ValueError("Unsatisfiable range")
+    return start, min(end, size - 1)
+
+
+def stream_range(file, start, length):
+    try:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def sendfile_response(storage, name, content_type):
+    response = HttpResponse(content_type=content_type)
+    if settings.MEDIA_SENDFILE == "nginx":
+        response["X-Accel-Redirect"] = settings.MEDIA_SENDFILE_PREFIX + name
+    else:
+        response["X-Sendfile"] = storage.path(name)
+    return response
+
+
+def serve_file(request, storage, name, content_type, cache_control="private, no-cache"):
+    # archived or compressed sheets have to go through Django
+    serves_directly = getattr(storage, "serves_directly", lambda name: True)
+    if settings.MEDIA_SENDFILE and serves_directly(name):
+        response = sendfile_response(storage, name, content_type)
+        response["Cache-Control"] = cache_control
+        return response
+
+    etag = file_etag(storage, name)
+    if etag and etag_matches(etag, request.headers.get("If-None-Match", "")):
+        response = HttpResponse(status=304)
+        response["ETag"] = etag
+        response["Cache-Control"] = cache_control
+        return response
+
+    size = storage.size(name)
+    byte_range = None
+    range_header = request.headers.get("Range")
+    # If-Range: only honour the range when the client's copy is still current
+    if range_header and request.headers.get("If-Range", etag) == etag:
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+    file = storage.open(name, "rb")
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            stream_range(file, start, end - start + 1), status=206, content_type=content_type
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(end - start + 1)
+    response["Accept-Ranges"] = "bytes"
+    response["Cache-Control"] = cache_control
+    if etag:
+        response["ETag"] = etag
+    return response
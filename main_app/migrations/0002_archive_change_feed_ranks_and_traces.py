@@ -0,0 +1,275 @@
+# Generated by Django 4.1.7 on 2026-10-19 18:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import main_app.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedMark',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('grade', models.CharField(blank=True, max_length=10, null=True)),
+                ('grade_point', models.IntegerField(blank=True, null=True)),
+                ('credit', models.IntegerField(blank=True, null=True)),
+                ('credit_point', models.IntegerField(blank=True, null=True)),
+                ('status', models.CharField(blank=True, max_length=10, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_time', models.DateTimeField()),
+                ('modified_time', models.DateTimeField()),
+                ('archived_time', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedUserAuthToken',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('key', models.TextField()),
+                ('is_expired', models.BooleanField(default=False)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_time', models.DateTimeField()),
+                ('modified_time', models.DateTimeField()),
+                ('archived_time', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('uploaded', 'Mark Sheet Uploaded'), ('status_changed', 'Mark Sheet Status Changed'), ('mark_edited', 'Mark Edited')], max_length=30)),
+                ('student_id', models.BigIntegerField()),
+                ('object_id', models.BigIntegerField()),
+                ('data', models.JSONField(default=dict)),
+                ('created_time', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RankSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveIntegerField()),
+                ('percentile', models.FloatField()),
+                ('cohort_size', models.PositiveIntegerField()),
+                ('computed_time', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UploadTrace',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mark_sheet_id', models.BigIntegerField(db_index=True)),
+                ('student_id', models.BigIntegerField()),
+                ('file_size', models.PositiveIntegerField()),
+                ('parse_seconds', models.FloatField()),
+                ('save_seconds', models.FloatField()),
+                ('duration', models.FloatField()),
+                ('profiled', models.BooleanField(default=False)),
+                ('stats', models.TextField(blank=True)),
+                ('raw', models.BinaryField(blank=True, null=True)),
+                ('created_time', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='marksheetdoc',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AlterField(
+            model_name='mark',
+            name='added_by',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='mark',
+            name='exam',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='main_app.exam'),
+        ),
+        migrations.AlterField(
+            model_name='marksheetdoc',
+            name='added_by',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='marksheetdoc',
+            name='exam',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='main_app.exam'),
+        ),
+        migrations.AlterField(
+            model_name='marksheetdoc',
+            name='mark_sheet',
+            field=models.FileField(max_length=255, storage=main_app.storage.get_mark_sheet_storage, upload_to=main_app.storage.mark_sheet_upload_to),
+        ),
+        migrations.AlterField(
+            model_name='student',
+            name='added_by',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='student',
+            name='course',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='main_app.course'),
+        ),
+        migrations.AlterField(
+            model_name='student',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='student_user', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='subject',
+            name='added_by',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='subject',
+            name='course',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='main_app.course'),
+        ),
+        migrations.AlterField(
+            model_name='subject',
+            name='exam',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='main_app.exam'),
+        ),
+        migrations.AddIndex(
+            model_name='mark',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['student', 'exam'], name='mark_student_exam_active'),
+        ),
+        migrations.AddIndex(
+            model_name='mark',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['subject'], name='mark_subject_active'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['course'], name='student_course_active'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user'], name='student_user_active'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['registration_no'], name='student_registration_no'),
+        ),
+        migrations.AddIndex(
+            model_name='subject',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['subject_code', 'subject_name'], name='subject_code_name_active'),
+        ),
+        migrations.AddIndex(
+            model_name='userauthtoken',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_expired', False)), fields=['key'], name='token_key_active'),
+        ),
+        migrations.AddField(
+            model_name='uploadtrace',
+            name='course',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main_app.course'),
+        ),
+        migrations.AddField(
+            model_name='uploadtrace',
+            name='exam',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main_app.exam'),
+        ),
+        migrations.AddField(
+            model_name='ranksnapshot',
+            name='course',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='main_app.course'),
+        ),
+        migrations.AddField(
+            model_name='ranksnapshot',
+            name='exam',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='main_app.exam'),
+        ),
+        migrations.AddField(
+            model_name='ranksnapshot',
+            name='student',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main_app.student'),
+        ),
+        migrations.AddField(
+            model_name='ranksnapshot',
+            name='subject',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='main_app.subject'),
+        ),
+        migrations.AddField(
+            model_name='changeevent',
+            name='course',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main_app.course'),
+        ),
+        migrations.AddField(
+            model_name='changeevent',
+            name='exam',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main_app.exam'),
+        ),
+        migrations.AddField(
+            model_name='archiveduserauthtoken',
+            name='added_by',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archiveduserauthtoken',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_token_user', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedmark',
+            name='added_by',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedmark',
+            name='exam',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='main_app.exam'),
+        ),
+        migrations.AddField(
+            model_name='archivedmark',
+            name='student',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main_app.student'),
+        ),
+        migrations.AddField(
+            model_name='archivedmark',
+            name='subject',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main_app.subject'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadtrace',
+            index=models.Index(fields=['-duration'], name='upload_trace_slowest'),
+        ),
+        migrations.AddIndex(
+            model_name='ranksnapshot',
+            index=models.Index(fields=['course', 'exam', 'subject', 'rank'], name='rank_cohort_order'),
+        ),
+        migrations.AddConstraint(
+            model_name='ranksnapshot',
+            constraint=models.UniqueConstraint(condition=models.Q(('subject__isnull', True)), fields=('student', 'exam'), name='rank_student_exam'),
+        ),
+        migrations.AddConstraint(
+            model_name='ranksnapshot',
+            constraint=models.UniqueConstraint(condition=models.Q(('subject__isnull', False)), fields=('student', 'exam', 'subject'), name='rank_student_subject'),
+        ),
+        migrations.AddIndex(
+            model_name='changeevent',
+            index=models.Index(fields=['course', 'id'], name='change_course_cursor'),
+        ),
+        migrations.AddIndex(
+            model_name='changeevent',
+            index=models.Index(fields=['student_id', 'id'], name='change_student_cursor'),
+        ),
+        migrations.AddIndex(
+            model_name='archiveduserauthtoken',
+            index=models.Index(fields=['user', 'created_time'], name='archived_token_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedmark',
+            index=models.Index(fields=['student', 'exam'], name='archived_mark_student_exam'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedmark',
+            index=models.Index(fields=['subject'], name='archived_mark_subject'),
+        ),
+    ]
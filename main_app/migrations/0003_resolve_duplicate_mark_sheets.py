@@ -0,0 +1,64 @@
+from django.db import migrations
+from django.db.models import Count
+from django.utils import timezone
+
+
+# the sheet kept among a student's active sheets for an exam: the most
+# reviewed one, then the latest
+KEEP_ORDER = ["Approved", "Rejected", "Pending", "Processing"]
+
+
+def keep_order(mark_doc):
+    status = KEEP_ORDER.index(mark_doc.status) if mark_doc.status in KEEP_ORDER else len(KEEP_ORDER)
+    return status, -mark_doc.id
+
+
+def resolve_duplicate_mark_sheets(apps, schema_editor):
+    """
+    Uploads before the unique (student, exam) constraint could save a sheet
+    twice. Keep one active sheet per student and exam and deactivate the
+    others together with the marks their uploads saved: an upload saved its
+    marks right before its sheet, so a mark belongs to the first sheet
+    created at or after it.
+    """
+    using = schema_editor.connection.alias
+    MarkSheetDoc = apps.get_model("main_app", "MarkSheetDoc")
+    Mark = apps.get_model("main_app", "Mark")
+    now = timezone.now()
+
+    duplicates = (
+        MarkSheetDoc.objects.using(using).filter(is_active=True)
+        .values("student_id", "exam_id").annotate(count=Count("id")).filter(count__gt=1)
+    )
+    for duplicate in list(duplicates):
+        lookup = {"student_id": duplicate["student_id"], "exam_id": duplicate["exam_id"], "is_active": True}
+        mark_docs = sorted(MarkSheetDoc.objects.using(using).filter(**lookup), key=keep_order)
+        kept, dropped = mark_docs[0], mark_docs[1:]
+
+        by_created = sorted(mark_docs, key=lambda mark_doc: mark_doc.created_time)
+        dropped_marks = []
+        for mark in Mark.objects.using(using).filter(**lookup).only("id", "created_time"):
+            owner = next((mark_doc for mark_doc in by_created if mark_doc.created_time >= mark.created_time), None)
+            if owner is not None and owner.id != kept.id:
+                dropped_marks.append(mark.id)
+
+        Mark.objects.using(using).filter(id__in=dropped_marks).update(is_active=False, modified_time=now)
+        MarkSheetDoc.objects.using(using).filter(id__in=[mark_doc.id for mark_doc in dropped]).update(
+            is_active=False, modified_time=now
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0002_archive_change_feed_ranks_and_traces'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            resolve_duplicate_mark_sheets,
+            migrations.RunPython.noop,
+            # runs on every course shard as well
+            hints={"model_name": "marksheetdoc"},
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0003_resolve_duplicate_mark_sheets'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='marksheetdoc',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('student', 'exam'), name='marksheet_student_exam_unique_active', violation_error_message='You have already uploaded marks for this exam'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.1.7 on 2026-10-19 18:22
+
+from django.db import migrations, models
+import uuid
+
+
+def split_upload_ids(apps, schema_editor):
+    # AddField gave every existing trace the same upload_id, each was its own upload
+    UploadTrace = apps.get_model("main_app", "UploadTrace")
+    traces = list(UploadTrace.objects.only("id"))
+    for trace in traces:
+        trace.upload_id = uuid.uuid4()
+    UploadTrace.objects.bulk_update(traces, ["upload_id"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0004_marksheet_student_exam_unique_active'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadtrace',
+            name='database',
+            field=models.CharField(default='default', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='uploadtrace',
+            name='upload_id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False),
+        ),
+        migrations.RunPython(split_upload_ids, migrations.RunPython.noop),
+    ]
@@ -1,25 +1,64 @@
+import uuid
+
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
 
+from .storage import mark_sheet_upload_to, get_mark_sheet_storage
+
 
 ROLE_CHOICES = (
     (1, "Admin"),
     (2, "Faculty"),
     (3, "Student"),
 )
+ROLE_NAMES = dict(ROLE_CHOICES)
 
 
 class User(AbstractUser):
     role = models.IntegerField(choices=ROLE_CHOICES, default=1)
 
 
+class TimeStampQuerySet(models.QuerySet):
+
+    def active(self):
+        return self.filter(is_active=True)
+
+    def deactivate(self):
+        """Soft delete every row in one UPDATE"""
+        return self.update(is_active=False, modified_time=timezone.now())
+
+
+class ActiveManager(models.Manager.from_queryset(TimeStampQuerySet)):
+    """Only rows that are not soft deleted"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_active=True)
+
+
 class TimeStamp(models.Model):
     is_active = models.BooleanField(default=True)
     created_time = models.DateTimeField(auto_now_add=True)
     modified_time = models.DateTimeField(auto_now=True)
     added_by = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    objects = TimeStampQuerySet.as_manager()
+    active_objects = ActiveManager()
+
+    class Meta:
+        abstract = True
+
+
+class ShardedTimeStamp(TimeStamp):
+    """
+    Base for the models partitioned by course across databases (see routers.py).
+    Relations to rows that always live on the default database are declared
+    without a database constraint, since the referenced table is on another database.
+    """
+    added_by = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False)
+
     class Meta:
         abstract = True
 
@@ -32,6 +71,12 @@ class UserAuthToken(TimeStamp):
     class Meta:
         verbose_name = "UserAuthToken"
         verbose_name_plural = "UserAuthTokens"
+        indexes = [
+            models.Index(
+                fields=["key"], name="token_key_active",
+                condition=Q(is_active=True, is_expired=False),
+            ),
+        ]
 
     def __str__(self):
         return self.key
@@ -42,6 +87,27 @@ class UserAuthToken(TimeStamp):
         return super().save(*args, **kwargs)
 
 
+class ArchivedUserAuthToken(models.Model):
+    """An expired or revoked UserAuthToken moved out of the hot table (see archive.py)"""
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="archived_token_user")
+    key = models.TextField()
+    is_expired = models.BooleanField(default=False)
+    is_active = models.BooleanField(default=True)
+    created_time = models.DateTimeField()
+    modified_time = models.DateTimeField()
+    added_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    archived_time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "created_time"], name="archived_token_user_created"),
+        ]
+
+    def __str__(self):
+        return self.key
+
+
 class Course(TimeStamp):
     course_name = models.CharField(max_length=255) # eg: BSC Computer Science
 
@@ -55,20 +121,35 @@ class Exam(TimeStamp):
         return self.exam_name
 
 
-class Subject(TimeStamp):
+class Subject(ShardedTimeStamp):
     subject_name = models.CharField(max_length=255) # eg: TRANSACTIONS: ESSENTIAL ENGLISH LANGUAGE SKILLS
     subject_code = models.CharField(max_length=255, null=True, blank=True) # eg: A01
-    course = models.ForeignKey(Course, on_delete=models.CASCADE)
-    exam = models.ForeignKey(Exam, on_delete=models.CASCADE)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, db_constraint=False)
+    exam = models.ForeignKey(Exam, on_delete=models.CASCADE, db_constraint=False)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["subject_code", "subject_name"], name="subject_code_name_active",
+                condition=Q(is_active=True),
+            ),
+        ]
 
     def __str__(self):
         return self.subject_name
 
 
-class Student(TimeStamp):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="student_user")
+class Student(ShardedTimeStamp):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="student_user", db_constraint=False)
     registration_no = models.CharField(max_length=100, null=True, blank=True)
-    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, db_constraint=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["course"], name="student_course_active", condition=Q(is_active=True)),
+            models.Index(fields=["user"], name="student_user_active", condition=Q(is_active=True)),
+            models.Index(fields=["registration_no"], name="student_registration_no"),
+        ]
 
     def __str__(self):
         return self.user.username
@@ -82,7 +163,7 @@ class Faculty(TimeStamp):
         return self.user.username
 
 
-class Mark(TimeStamp):
+class Mark(ShardedTimeStamp):
     grade = models.CharField(max_length=10, null=True, blank=True)
     grade_point = models.IntegerField(null=True, blank=True)
     credit = models.IntegerField(null=True, blank=True)
@@ -90,18 +171,199 @@ class Mark(TimeStamp):
     status = models.CharField(max_length=10, null=True, blank=True)
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
-    exam = models.ForeignKey(Exam, on_delete=models.CASCADE)
+    exam = models.ForeignKey(Exam, on_delete=models.CASCADE, db_constraint=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["student", "exam"], name="mark_student_exam_active", condition=Q(is_active=True)),
+            models.Index(fields=["subject"], name="mark_subject_active", condition=Q(is_active=True)),
+        ]
 
     def __str__(self):
         return str(self.student.user.username) + " - " + str(self.subject.subject_name) + " - " + str(self.credit_point)
 
 
-class MarkSheetDoc(TimeStamp):
-    mark_sheet = models.FileField(upload_to="mark_sheet")
+class ArchivedMark(models.Model):
+    """
+    A Mark moved out of the hot table once its student's cohort has graduated
+    (see archive.py), under its original id and timestamps. Lives on the same
+    database as the student.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    grade = models.CharField(max_length=10, null=True, blank=True)
+    grade_point = models.IntegerField(null=True, blank=True)
+    credit = models.IntegerField(null=True, blank=True)
+    credit_point = models.IntegerField(null=True, blank=True)
+    status = models.CharField(max_length=10, null=True, blank=True)
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
+    exam = models.ForeignKey(Exam, on_delete=models.CASCADE, db_constraint=False)
+    is_active = models.BooleanField(default=True)
+    created_time = models.DateTimeField()
+    modified_time = models.DateTimeField()
+    added_by = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False)
+    archived_time = models.DateTimeField(auto_now_add=True)
+
+    objects = TimeStampQuerySet.as_manager()
+    active_objects = ActiveManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["student", "exam"], name="archived_mark_student_exam"),
+            models.Index(fields=["subject"], name="archived_mark_subject"),
+        ]
+
+    def __str__(self):
+        return f"{self.student_id} - {self.subject_id} - {self.credit_point}"
+
+
+class MarkSheetDoc(ShardedTimeStamp):
+    """
+    A student's mark sheet for an exam. An upload first claims the row in the
+    "Processing" status (no file yet) and only then parses the pdf, the unique
+    constraint makes sure a single upload per student and exam gets that far.
+    """
+    PROCESSING = "Processing"
+    PENDING = "Pending"
+    APPROVED = "Approved"
+    REJECTED = "Rejected"
+
+    mark_sheet = models.FileField(upload_to=mark_sheet_upload_to, storage=get_mark_sheet_storage, max_length=255)
     sgpa = models.CharField(max_length=10, null=True, blank=True)
-    status = models.CharField(max_length=10, default="Pending")
+    status = models.CharField(max_length=10, default=PENDING)
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
-    exam = models.ForeignKey(Exam, on_delete=models.CASCADE)
+    exam = models.ForeignKey(Exam, on_delete=models.CASCADE, db_constraint=False)
+    # client supplied Idempotency-Key of the upload that claimed the row
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["student", "exam"],
+                condition=Q(is_active=True),
+                name="marksheet_student_exam_unique_active",
+                violation_error_message="You have already uploaded marks for this exam",
+            ),
+        ]
+
+    # status as last loaded or saved, post_save handlers compare it with the
+    # new one to tell a claim completing from a sheet reopened or reviewed
+    saved_status = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.saved_status = instance.__dict__.get("status")
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.saved_status = self.status
 
     def __str__(self):
         return str(self.student.user.username) + " - " + str(self.exam.exam_name)
+
+
+class RankSnapshot(models.Model):
+    """
+    Precomputed rank and percentile of a student in their course cohort for
+    an exam: by SGPA when subject is empty, else by grade point in that
+    subject. Only approved mark sheets are ranked. Rebuilt per (course, exam)
+    whenever a sheet is approved or leaves the approved status, per subject
+    when a mark of an approved sheet is edited (see services.refresh_ranks),
+    so a lookup is a single indexed read. Stored on the course's shard.
+    """
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, db_constraint=False)
+    exam = models.ForeignKey(Exam, on_delete=models.CASCADE, db_constraint=False)
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, null=True, blank=True)
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    score = models.FloatField()
+    rank = models.PositiveIntegerField()
+    # share of the cohort scoring the same or lower, the topper is at 100
+    percentile = models.FloatField()
+    cohort_size = models.PositiveIntegerField()
+    computed_time = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["student", "exam"], condition=Q(subject__isnull=True), name="rank_student_exam",
+            ),
+            models.UniqueConstraint(
+                fields=["student", "exam", "subject"], condition=Q(subject__isnull=False), name="rank_student_subject",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["course", "exam", "subject", "rank"], name="rank_cohort_order"),
+        ]
+
+    def __str__(self):
+        return f"{self.student_id} - {self.exam_id} - {self.rank}/{self.cohort_size}"
+
+
+class ChangeEvent(models.Model):
+    """
+    Monotonic log of mark sheet uploads, status changes and mark edits,
+    read by clients as "changes since cursor N" (see ChangeFeedView).
+    Always stored on the default database, the student id is not a foreign
+    key since students may live on a course shard.
+    """
+    UPLOADED = "uploaded"
+    STATUS_CHANGED = "status_changed"
+    MARK_EDITED = "mark_edited"
+    KIND_CHOICES = (
+        (UPLOADED, "Mark Sheet Uploaded"),
+        (STATUS_CHANGED, "Mark Sheet Status Changed"),
+        (MARK_EDITED, "Mark Edited"),
+    )
+
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    student_id = models.BigIntegerField()
+    exam = models.ForeignKey(Exam, on_delete=models.CASCADE)
+    object_id = models.BigIntegerField()
+    data = models.JSONField(default=dict)
+    created_time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["course", "id"], name="change_course_cursor"),
+            models.Index(fields=["student_id", "id"], name="change_student_cursor"),
+        ]
+
+    def __str__(self):
+        return f"{self.id} - {self.kind}"
+
+
+class UploadTrace(models.Model):
+    """
+    Timing of a mark sheet upload's parse and save phases, with a cProfile
+    trace when the upload was profiled (see profiling.py). One row per mark
+    sheet the upload saved, a grade card's semesters share the upload_id and
+    the upload's timings. Always stored on the default database, the mark
+    sheet and student ids are not foreign keys since those rows may live on
+    a course shard (`database`).
+    """
+    upload_id = models.UUIDField(default=uuid.uuid4, editable=False)
+    database = models.CharField(max_length=100, default="default")
+    mark_sheet_id = models.BigIntegerField(db_index=True)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    student_id = models.BigIntegerField()
+    exam = models.ForeignKey(Exam, on_delete=models.CASCADE)
+    file_size = models.PositiveIntegerField()
+    parse_seconds = models.FloatField()
+    save_seconds = models.FloatField()
+    duration = models.FloatField()
+    profiled = models.BooleanField(default=False)
+    # top functions by cumulative time, and the raw pstats dump
+    stats = models.TextField(blank=True)
+    raw = models.BinaryField(null=True, blank=True)
+    created_time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-duration"], name="upload_trace_slowest"),
+        ]
+
+    def __str__(self):
+        return f"{self.mark_sheet_id} - {self.duration:.2f}s"
@@ -0,0 +1,89 @@
+"""
+Page 1 previews of uploaded mark sheets.
+
+Faculty reviewing a cohort only need to glance at each sheet, so every
+MarkSheetDoc gets a small compressed image of its first page stored next to
+the pdf (eg: mark_sheet/abc.pdf -> mark_sheet/abc.pdf.preview.webp). Previews
+are rendered with Wand (ImageMagick + Ghostscript) in a background thread pool
+once the upload commits; `render_previews` backfills older sheets.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+
+from .models import MarkSheetDoc
+
+
+logger = logging.getLogger(__name__)
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def preview_name(mark_doc):
+    return f"{mark_doc.mark_sheet.name}.preview.{settings.PREVIEW_FORMAT}"
+
+
+def preview_content_type():
+    return f"image/{settings.PREVIEW_FORMAT}"
+
+
+def has_preview(mark_doc):
+    return mark_doc.mark_sheet.storage.exists(preview_name(mark_doc))
+
+
+def render_preview(mark_doc):
+    """Render page 1 of the mark sheet and store it next to the pdf"""
+    from wand.image import Image
+
+    storage = mark_doc.mark_sheet.storage
+    with mark_doc.mark_sheet.open("rb") as file:
+        data = file.read()
+
+    with Image(blob=data, format="pdf", resolution=settings.PREVIEW_RESOLUTION) as pdf:
+        with Image(pdf.sequence[0]) as page:
+            page.background_color = "white"
+            page.alpha_channel = "remove"
+            if page.width > settings.PREVIEW_WIDTH:
+                page.transform(resize=f"{settings.PREVIEW_WIDTH}x")
+            page.format = settings.PREVIEW_FORMAT
+            page.compression_quality = settings.PREVIEW_QUALITY
+            page.strip()
+            preview = page.make_blob()
+
+    name = preview_name(mark_doc)
+    if storage.exists(name):
+        storage.delete(name)
+    storage.save(name, ContentFile(preview))
+    return name
+
+
+def render_preview_by_id(mark_doc_id, using="default"):
+    try:
+        mark_doc = MarkSheetDoc.objects.using(using).get(id=mark_doc_id)
+        if mark_doc.mark_sheet and not has_preview(mark_doc):
+            render_preview(mark_doc)
+    except Exception as e:
+        # a missing preview only means the review screen falls back to the pdf
+        logger.warning("Preview rendering failed for MarkSheetDoc %s: %s", mark_doc_id, e)
+    finally:
+        close_old_connections()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PREVIEW_WORKERS, thread_name_prefix="preview"
+            )
+    return _executor
+
+
+def schedule_preview(mark_doc):
+    """Queue rendering on the preview pool, callers schedule it once the upload commits"""
+    if settings.MARKSHEET_PREVIEWS:
+        get_executor().submit(render_preview_by_id, mark_doc.id, mark_doc._state.db)
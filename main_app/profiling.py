@@ -0,0 +1,124 @@
+"""
+Opt-in profiling of mark sheet uploads.
+
+A sample of uploads (settings.UPLOAD_TRACE_RATE) records how long its parse
+(pdfplumber + verify_document) and save phases took, so the slowest uploads
+can be listed. A cProfile trace of both phases is captured as well when the
+upload is sampled for it (settings.UPLOAD_PROFILING_RATE) or asked for with
+the X-Profile-Upload header: by staff users with any value, by anyone else
+with settings.UPLOAD_PROFILING_SECRET (so an admin can reproduce a slow sheet
+through a student account); profiled uploads are always recorded. Traces are
+kept in UploadTrace under the database and MarkSheetDoc id of every sheet
+the upload saved, and served by UploadTraceView.
+"""
+import cProfile
+import hmac
+import io
+import logging
+import marshal
+import pstats
+import random
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .models import UploadTrace
+
+
+logger = logging.getLogger(__name__)
+
+
+class UploadProfile:
+    """Wall time per phase of one upload, plus a cProfile trace of the phases when enabled"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.profiler = cProfile.Profile() if enabled else None
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        if self.profiler:
+            self.profiler.enable()
+        try:
+            yield
+        finally:
+            if self.profiler:
+                self.profiler.disable()
+            self.phases[name] = self.phases.get(name, 0) + time.perf_counter() - start
+
+    def stats(self):
+        """(top functions by cumulative time as text, raw pstats dump loadable by pstats / snakeviz)"""
+        if not self.profiler:
+            return "", None
+        self.profiler.create_stats()
+        # dumped first, pstats.Stats takes the profiler's stats away from it
+        raw = marshal.dumps(self.profiler.stats)
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).sort_stats("cumulative").print_stats(settings.UPLOAD_PROFILE_STATS_LIMIT)
+        return out.getvalue(), raw
+
+
+class NoProfile(UploadProfile):
+    """Stand in for callers outside an upload request, times nothing"""
+
+    @contextmanager
+    def phase(self, name):
+        yield
+
+
+NO_PROFILE = NoProfile()
+
+
+def profile_requested(request):
+    header = request.headers.get("X-Profile-Upload")
+    if header:
+        if request.user.is_staff:
+            return True
+        secret = settings.UPLOAD_PROFILING_SECRET
+        if secret and hmac.compare_digest(header.encode(), secret.encode()):
+            return True
+    return random.random() < settings.UPLOAD_PROFILING_RATE
+
+
+def start_upload_profile(request):
+    enabled = profile_requested(request)
+    if not enabled and random.random() >= settings.UPLOAD_TRACE_RATE:
+        return NO_PROFILE
+    return UploadProfile(enabled=enabled)
+
+
+def save_upload_trace(profile, mark_docs, file_size):
+    """One UploadTrace per mark sheet the upload saved"""
+    if isinstance(profile, NoProfile):
+        return
+    try:
+        stats, raw = profile.stats()
+        upload_id = uuid.uuid4()
+        UploadTrace.objects.bulk_create([
+            UploadTrace(
+                upload_id=upload_id,
+                database=mark_doc._state.db,
+                mark_sheet_id=mark_doc.id,
+                course_id=mark_doc.student.course_id,
+                student_id=mark_doc.student_id,
+                exam_id=mark_doc.exam_id,
+                file_size=file_size,
+                parse_seconds=profile.phases.get("parse", 0),
+                save_seconds=profile.phases.get("save", 0),
+                duration=sum(profile.phases.values()),
+                profiled=profile.enabled,
+                stats=stats,
+                raw=raw,
+            )
+            for mark_doc in mark_docs
+        ])
+    except Exception as e:
+        # the upload itself has succeeded, a missing trace is not worth failing it
+        logger.warning(
+            "Could not store the upload trace of MarkSheetDoc %s: %s",
+            ", ".join(str(mark_doc.id) for mark_doc in mark_docs), e,
+        )
@@ -0,0 +1,123 @@
+"""
+Per-process copy of the small, almost static reference tables
+(Exam, Course and Subject).
+
+Every worker keeps its own copy of the rows and a version number. Subjects are
+kept per database, since they are partitioned by course (see routers.py).
+Saving or deleting a reference row bumps the version in the cache all workers
+share (settings.CACHES) once the transaction commits (see signals.py), and
+each worker reloads its copy the next time it sees a newer version. Workers
+read the shared version at most every settings.REFERENCE_DATA_CHECK_SECONDS,
+so lookups cost no query in between (the shared cache may be a database
+table) and another worker's edit shows up within that many seconds; the
+worker that made the edit reloads right away.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Exam, Course, Subject
+from .routers import active_shard, shard_aliases
+
+
+VERSION_KEY = "reference_data_version"
+
+
+class ReferenceDataCache:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0
+        self._exams = {}
+        self._courses = {}
+        self._subjects = {}
+        self._subjects_by_code_name = {}
+
+    def current_version(self):
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < settings.REFERENCE_DATA_CHECK_SECONDS:
+            return self._version
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, 1, timeout=None)
+            version = cache.get(VERSION_KEY, 1)
+        self._checked_at = now
+        return version
+
+    def invalidate(self):
+        """Bump the shared version so every worker reloads on next access"""
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, 1, timeout=None)
+        self._version = None
+
+    def refresh(self):
+        version = self.current_version()
+        exams = {exam.id: exam for exam in Exam.objects.using("default").order_by("id")}
+        courses = {course.id: course for course in Course.objects.using("default").order_by("id")}
+        subjects = {}
+        subjects_by_code_name = {}
+        for alias in shard_aliases():
+            subjects[alias] = {
+                subject.id: subject for subject in Subject.objects.using(alias).order_by("id")
+            }
+            subjects_by_code_name[alias] = {}
+            for subject in subjects[alias].values():
+                if subject.is_active:
+                    subjects_by_code_name[alias].setdefault((subject.subject_code, subject.subject_name), subject)
+        self._exams = exams
+        self._courses = courses
+        self._subjects = subjects
+        self._subjects_by_code_name = subjects_by_code_name
+        self._version = version
+
+    def _ensure_loaded(self):
+        if self._version != self.current_version():
+            with self._lock:
+                if self._version != self.current_version():
+                    self.refresh()
+
+    def get_exam(self, exam_id):
+        self._ensure_loaded()
+        try:
+            return self._exams[int(exam_id)]
+        except (KeyError, TypeError, ValueError):
+            raise Exam.DoesNotExist("Exam matching query does not exist.")
+
+    def active_exams(self):
+        self._ensure_loaded()
+        return [exam for exam in self._exams.values() if exam.is_active]
+
+    def get_course(self, course_id):
+        self._ensure_loaded()
+        try:
+            return self._courses[int(course_id)]
+        except (KeyError, TypeError, ValueError):
+            raise Course.DoesNotExist("Course matching query does not exist.")
+
+    def get_subject(self, subject_id):
+        self._ensure_loaded()
+        try:
+            return self._subjects[active_shard() or "default"][int(subject_id)]
+        except (KeyError, TypeError, ValueError):
+            raise Subject.DoesNotExist("Subject matching query does not exist.")
+
+    def subjects_for(self, course_id, exam_id):
+        self._ensure_loaded()
+        return [
+            subject
+            for subject in self._subjects[active_shard() or "default"].values()
+            if subject.course_id == course_id and subject.exam_id == exam_id
+        ]
+
+    def find_subject(self, subject_code, subject_name):
+        """Active subject with the given code and name, or None"""
+        self._ensure_loaded()
+        return self._subjects_by_code_name[active_shard() or "default"].get((subject_code, subject_name))
+
+
+reference_data = ReferenceDataCache()
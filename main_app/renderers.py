@@ -0,0 +1,44 @@
+"""
+JSON rendering for the API.
+
+FastJSONRenderer encodes with orjson when it is installed and falls back to
+DRF's JSONRenderer otherwise. Views with a hot list endpoint can skip the
+serializer entirely and hand `.values()` rows (plain dicts) straight to the
+Response, orjson encodes those natively.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+_fallback_encoder = JSONEncoder()
+
+
+def _default(obj):
+    # Decimal, lazy translation strings ... and datetimes, so .values() rows
+    # come out exactly as DRF's own renderer and serializer fields write them
+    return _fallback_encoder.default(obj)
+
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+
+
+def dumps(data):
+    """JSON bytes for data, orjson when available"""
+    if orjson is None:
+        return JSONRenderer().render(data)
+    return orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+
+
+class FastJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
@@ -0,0 +1,223 @@
+"""
+Course sharding for multi-college deployments.
+
+Student, Mark (and ArchivedMark), MarkSheetDoc, Subject and RankSnapshot
+rows are partitioned by course across the databases listed in
+settings.DATABASE_SHARDS, using settings.COURSE_SHARDS (course id ->
+database alias). Courses without an entry stay on "default", as do auth,
+tokens and the reference tables.
+
+Views activate the shard of the logged in user's course (see
+authentication.py and DatabaseRoutingMiddleware), so queries on the sharded
+models go to that college's database without passing `using=` around.
+
+Read-only views can additionally send their reads to a replica of each
+database (settings.DATABASE_REPLICAS, primary alias -> replica alias). A user
+who has just written something reads from the primary for
+settings.REPLICA_STICKY_SECONDS afterwards, so they always see their own
+upload or edit even if the replica is lagging.
+"""
+import contextlib
+import contextvars
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+SHARDED_MODELS = {"student", "mark", "archivedmark", "marksheetdoc", "subject", "ranksnapshot"}
+
+_active_shard = contextvars.ContextVar("active_shard", default=None)
+_current_user_id = contextvars.ContextVar("current_user_id", default=None)
+_replica_reads = contextvars.ContextVar("replica_reads", default=False)
+_wrote = contextvars.ContextVar("wrote", default=False)
+
+
+def is_cache_table(model):
+    """DatabaseCache's table, always on the default primary"""
+    return model._meta.app_label == "django_cache"
+
+
+def is_sharded(model):
+    return model._meta.app_label == "main_app" and model._meta.model_name in SHARDED_MODELS
+
+
+def shard_for_course(course_id):
+    return settings.COURSE_SHARDS.get(course_id, "default")
+
+
+def shard_aliases():
+    return ["default"] + [alias for alias in settings.DATABASE_SHARDS if alias != "default"]
+
+
+def activate_shard(alias):
+    _active_shard.set(alias)
+
+
+def deactivate_shard():
+    _active_shard.set(None)
+
+
+def active_shard():
+    return _active_shard.get()
+
+
+def user_shard(user):
+    """Database holding the course data of a faculty or student user"""
+    if not settings.DATABASE_SHARDS:
+        return "default"
+
+    cache_key = f"user_shard:{user.id}"
+    alias = cache.get(cache_key)
+    if alias is not None:
+        return alias
+
+    from .models import Faculty, Student
+
+    alias = "default"
+    if user.role == 2:
+        course_id = Faculty.objects.filter(user=user).values_list("course_id", flat=True).first()
+        if course_id is not None:
+            alias = shard_for_course(course_id)
+    elif user.role == 3:
+        # the Student row itself is sharded, so look for it in every database
+        for candidate in shard_aliases():
+            if Student.objects.using(candidate).filter(user_id=user.id).exists():
+                alias = candidate
+                break
+    cache.set(cache_key, alias, timeout=None)
+    return alias
+
+
+def activate_user_routing(user):
+    """Route the rest of the request for the given logged in user"""
+    activate_shard(user_shard(user))
+    _current_user_id.set(user.id)
+
+
+def sticky_key(user_id):
+    return f"replica_sticky:{user_id}"
+
+
+def use_replica_reads():
+    """Send this request's reads to the replicas, unless the user wrote recently"""
+    if not settings.DATABASE_REPLICAS:
+        return
+    user_id = _current_user_id.get()
+    if user_id is not None and cache.get(sticky_key(user_id)):
+        return
+    _replica_reads.set(True)
+
+
+@contextlib.contextmanager
+def replica_reads():
+    """Run export/analytics queries outside a request against the replicas"""
+    token = _replica_reads.set(bool(settings.DATABASE_REPLICAS))
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def record_write():
+    """Pin the current user to the primaries while the replicas catch up"""
+    _replica_reads.set(False)
+    user_id = _current_user_id.get()
+    if user_id is None or _wrote.get():
+        return
+    _wrote.set(True)
+    cache.set(sticky_key(user_id), True, timeout=settings.REPLICA_STICKY_SECONDS)
+
+
+def reset_routing():
+    deactivate_shard()
+    _current_user_id.set(None)
+    _replica_reads.set(False)
+    _wrote.set(False)
+
+
+class DatabaseRoutingMiddleware:
+    """Make sure routing state set for one request never leaks into the next"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reset_routing()
+        try:
+            return self.get_response(request)
+        finally:
+            reset_routing()
+
+
+class CourseShardRouter:
+
+    def _shard(self, model, **hints):
+        if not is_sharded(model):
+            # without this Django would follow the instance hint onto the shard
+            return "default"
+        instance = hints.get("instance")
+        if isinstance(instance, model):
+            if instance._state.db:
+                return instance._state.db
+            course_id = getattr(instance, "course_id", None)
+            if course_id is not None:
+                return shard_for_course(course_id)
+        elif instance is not None and is_sharded(type(instance)):
+            # related object being assigned to a foreign key
+            return instance._state.db
+        return active_shard()
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        return self._shard(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # relations from sharded rows to users and reference data cross databases
+        if is_sharded(type(obj1)) and is_sharded(type(obj2)):
+            return obj1._state.db == obj2._state.db
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == "default":
+            return True
+        return app_label == "main_app" and model_name in SHARDED_MODELS
+
+
+class ReplicaRouter(CourseShardRouter):
+    """CourseShardRouter that serves reads from replicas when a view asks for it"""
+
+    def primary(self, alias):
+        for primary, replica in settings.DATABASE_REPLICAS.items():
+            if alias == replica:
+                return primary
+        return alias
+
+    def _shard(self, model, **hints):
+        alias = super()._shard(model, **hints)
+        if alias is None:
+            return None
+        # instances loaded from a replica still belong to the primary
+        return self.primary(alias)
+
+    def db_for_read(self, model, **hints):
+        alias = self._shard(model, **hints) or "default"
+        if _replica_reads.get() and not is_cache_table(model):
+            return settings.DATABASE_REPLICAS.get(alias, alias)
+        return alias
+
+    def db_for_write(self, model, **hints):
+        # caching a payload is not a write the user has to read back
+        if not is_cache_table(model):
+            record_write()
+        return self._shard(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if is_sharded(type(obj1)) and is_sharded(type(obj2)):
+            return self.primary(obj1._state.db) == self.primary(obj2._state.db)
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # lets `migrate --database <replica>` build a local SQLite replica
+        return super().allow_migrate(self.primary(db), app_label, model_name, **hints)
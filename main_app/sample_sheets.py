@@ -0,0 +1,333 @@
+"""
+Synthetic University of Calicut result sheets for exercising the parser.
+
+Real student sheets cannot be committed, so `make_sheet` draws a one page pdf
+with the same layout: the university header, the semester line, a ruled 7
+column marks table (code, title, grade, GP, credit, CP, result) and the SGPA
+line. It returns the pdf bytes together with what the parser should make of
+it. Malformed variants cover the ways uploads go wrong in practice. The pdf is
+written by hand (standard Helvetica, no embedded fonts), so generating a
+corpus needs nothing beyond the standard library.
+"""
+import random
+
+
+ROMAN = {1: "I", 2: "II", 3: "III", 4: "IV", 5: "V", 6: "VI"}
+
+# expected results of a generated corpus, next to its pdfs
+MANIFEST_NAME = "expected.json"
+
+HEADER = ["Course Code", "Course Title", "Grade", "GP", "Credit", "CP", "Result"]
+
+GRADES = {10: "O", 9: "A+", 8: "A", 7: "B+", 6: "B", 5: "C", 4: "P", 0: "F"}
+
+# (code, title) per semester, B.Sc Computer Science (CBCSS)
+SUBJECTS = {
+    1: [
+        ("A01", "TRANSACTIONS: ESSENTIAL ENGLISH LANGUAGE SKILLS"),
+        ("A02", "INEVITABLE SPACES: LANGUAGE AND LITERATURE"),
+        ("A07(3)", "COMMUNICATIONS IN MALAYALAM"),
+        ("BCS1B01", "COMPUTER FUNDAMENTALS AND HTML"),
+        ("MTS1C01", "MATHEMATICS FOR COMPUTER SCIENCE I"),
+        ("STA1C01", "INTRODUCTORY STATISTICS"),
+    ],
+    2: [
+        ("A03", "READINGS ON LIFE AND NATURE"),
+        ("A04", "SIGNATURES: LITERATURE AND SOCIETY"),
+        ("A09(3)", "MALAYALA SAHITHYAM"),
+        ("BCS2B02", "PROBLEM SOLVING USING C"),
+        ("MTS2C02", "MATHEMATICS FOR COMPUTER SCIENCE II"),
+        ("STA2C02", "PROBABILITY THEORY"),
+    ],
+    3: [
+        ("A11", "BASIC NUMERICAL SKILLS"),
+        ("A12", "GENERAL INFORMATICS"),
+        ("BCS3B03", "DATA STRUCTURES USING C++"),
+        ("BCS3B04", "DATABASE MANAGEMENT SYSTEM AND RDBMS"),
+        ("MTS3C03", "MATHEMATICS FOR COMPUTER SCIENCE III"),
+        ("STA3C03", "STATISTICAL INFERENCE"),
+    ],
+    4: [
+        ("A13", "ENTREPRENEURSHIP DEVELOPMENT"),
+        ("A14", "BANKING AND INSURANCE"),
+        ("BCS4B05", "OPERATING SYSTEMS"),
+        ("BCS4B06", "OBJECT ORIENTED PROGRAMMING USING JAVA"),
+        ("MTS4C04", "MATHEMATICS FOR COMPUTER SCIENCE IV"),
+        ("STA4C04", "STATISTICAL QUALITY CONTROL"),
+    ],
+    5: [
+        ("BCS5B07", "JAVA PROGRAMMING USING LINUX"),
+        ("BCS5B08", "COMPUTER NETWORKS"),
+        ("BCS5B09", "SOFTWARE ENGINEERING"),
+        ("BCS5B10", "WEB PROGRAMMING USING PHP"),
+        ("BCS5D01", "INTRODUCTION TO COMPUTERS AND OFFICE AUTOMATION"),
+        ("BCS5B11", "PROJECT"),
+    ],
+    6: [
+        ("BCS6B12", "COMPUTER GRAPHICS"),
+        ("BCS6B13", "ANDROID PROGRAMMING"),
+        ("BCS6B14", "PYTHON PROGRAMMING"),
+        ("BCS6B15", "DATA MINING"),
+        ("BCS6E01", "CLOUD COMPUTING"),
+        ("BCS6B16", "PROJECT AND VIVA"),
+    ],
+}
+
+# variant -> accepted by verify_document
+VARIANTS = {
+    None: True,
+    "wrapped": True,
+    # a column rule is missing, so the rows have 6 cells
+    "missing_rule": False,
+    "no_university": False,
+    "no_sgpa": False,
+    "wrong_semester": False,
+    "too_many_subjects": False,
+    "header_only": False,
+    "scanned": False,
+}
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+COLUMNS = [20, 75, 350, 385, 420, 460, 500, 560]
+ROW_HEIGHT = 20
+WRAPPED_ROW_HEIGHT = 30
+TABLE_TOP = 640
+# consolidated grade cards flow semester blocks down the page between these
+PAGE_TOP, PAGE_BOTTOM = 800, 60
+
+
+def escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def text_op(x, y, text, size=8):
+    return f"BT /F1 {size} Tf {x} {y} Td ({escape(text)}) Tj ET"
+
+
+def wrap(title, width=34):
+    """Split a title over two lines at a word boundary, like the university's sheets do"""
+    if len(title) <= width or " " not in title[:width]:
+        return [title]
+    cut = title.rindex(" ", 0, width)
+    return [title[:cut], title[cut + 1:]]
+
+
+def mark_rows(rng, semester, count, failed):
+    subjects = list(SUBJECTS[semester])
+    while len(subjects) < count:
+        # elective / additional courses beyond the core six
+        subjects.append((f"BCS{semester}X{len(subjects):02d}", f"ADDITIONAL COURSE {len(subjects) - 5}"))
+    subjects = subjects[:count]
+    failed_rows = set(rng.sample(range(count), min(failed, count)))
+
+    rows = []
+    for i, (code, title) in enumerate(subjects):
+        credit = rng.choice([2, 3, 4, 4, 5]) if not code.startswith("A") else rng.choice([3, 4])
+        if i in failed_rows:
+            grade_point, result = 0, "Failed"
+        else:
+            grade_point, result = rng.choice([4, 5, 6, 7, 7, 8, 8, 9, 10]), "Passed"
+        rows.append([
+            code, title, GRADES[grade_point], str(grade_point), str(credit),
+            str(grade_point * credit), result,
+        ])
+    return rows
+
+
+def sheet_sgpa(rows):
+    if any(row[6] == "Failed" for row in rows):
+        return None
+    credits = sum(int(row[4]) for row in rows)
+    return round(sum(int(row[5]) for row in rows) / credits, 2) if credits else None
+
+
+def content_stream(semester, rows, variant, rng):
+    label_semester = semester
+    if variant == "wrong_semester":
+        # a semester whose label does not contain the expected one (eg: "II" is inside "III")
+        wanted = f"{ROMAN[semester]} Semester"
+        label_semester = rng.choice([
+            other for other in ROMAN if other != semester and wanted not in f"{ROMAN[other]} Semester"
+        ])
+
+    ops = []
+    if variant != "scanned":
+        if variant != "no_university":
+            ops.append(text_op(190, 800, "UNIVERSITY OF CALICUT", 12))
+        ops.append(text_op(170, 782, "Provisional Result of the Examination", 10))
+        ops.append(text_op(30, 750, f"Name : STUDENT {rng.randint(1000, 9999)}", 9))
+        ops.append(text_op(30, 736, f"Register No : {rng.choice('ABCDEFGH')}{rng.randint(10, 99)}AXXX{rng.randint(1000, 9999)}", 9))
+        ops.append(text_op(30, 722, "Programme : B.Sc Computer Science (CBCSS)", 9))
+        ops.append(text_op(
+            30, 708, f"{ROMAN[label_semester]} Semester B.Sc Degree Examination November {rng.randint(2019, 2024)}", 9
+        ))
+
+    columns = list(COLUMNS)
+    if variant == "missing_rule":
+        del columns[rng.randint(2, len(columns) - 2)]
+    table_ops, bottom = draw_table(
+        [HEADER] + rows, TABLE_TOP, columns, wrapped=variant == "wrapped", text=variant != "scanned"
+    )
+    ops += table_ops
+
+    if variant not in ("scanned", "no_sgpa"):
+        ops += sgpa_ops(rows, bottom)
+    return "\n".join(ops).encode("latin-1")
+
+
+def draw_table(table, top, columns=COLUMNS, wrapped=False, text=True):
+    """Ruled grid and cell text of `table` from `top` down, returns (ops, bottom)"""
+    heights = [
+        WRAPPED_ROW_HEIGHT if wrapped and len(wrap(row[1])) > 1 else ROW_HEIGHT for row in table
+    ]
+    tops = [top]
+    for height in heights:
+        tops.append(tops[-1] - height)
+
+    ops = []
+    for x in columns:
+        ops.append(f"{x} {tops[0]} m {x} {tops[-1]} l S")
+    for y in tops:
+        ops.append(f"{COLUMNS[0]} {y} m {COLUMNS[-1]} {y} l S")
+    if text:
+        for row, row_top in zip(table, tops):
+            for j, cell in enumerate(row):
+                lines = wrap(cell) if wrapped and j == 1 else [cell]
+                for k, line in enumerate(lines):
+                    ops.append(text_op(COLUMNS[j] + 3, row_top - 13 - k * 10, line))
+    return ops, tops[-1]
+
+
+def sgpa_ops(rows, bottom):
+    sgpa = sheet_sgpa(rows)
+    return [
+        text_op(30, bottom - 25, f"SGPA : {sgpa if sgpa is not None else '--'}", 9),
+        text_op(30, bottom - 40, f"Result : {'Passed' if sgpa is not None else 'Failed'}", 9),
+    ]
+
+
+def write_pdf(*streams):
+    """One page per content stream"""
+    count = len(streams)
+    font = 3 + 2 * count
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            b" ".join(b"%d 0 R" % (3 + 2 * i) for i in range(count)), count
+        ),
+    ]
+    for i, stream in enumerate(streams):
+        objects += [
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (PAGE_WIDTH, PAGE_HEIGHT, 4 + 2 * i, font),
+            b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream",
+        ]
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return out
+
+
+def make_sheet(semester, subjects=6, failed=0, variant=None, seed=None):
+    """
+    Result sheet pdf for `semester` (1-6) and what verify_document should
+    return for it: {"semester", "variant", "valid", "rows"}, rows
+    being the marks table including its header (cells as the extractor
+    yields them).
+    """
+    if variant not in VARIANTS:
+        raise ValueError(f"Unknown variant {variant}, choose from {sorted(filter(None, VARIANTS))}")
+    rng = random.Random(seed)
+    if variant == "too_many_subjects":
+        subjects = max(subjects, 9)
+    if variant == "header_only":
+        subjects = 0
+    rows = mark_rows(rng, semester, subjects, failed)
+    pdf = write_pdf(content_stream(semester, rows, variant, rng))
+
+    expected_rows = [list(HEADER)] + [list(row) for row in rows]
+    if variant == "wrapped":
+        for row in expected_rows[1:]:
+            row[1] = "\n".join(wrap(row[1]))
+    return pdf, {
+        "semester": semester,
+        "variant": variant,
+        "valid": VARIANTS[variant],
+        "rows": expected_rows,
+    }
+
+
+def corpus(count, seed=0):
+    """
+    A mix of fixtures: every semester, 3 to 8 subjects, some failed rows, and
+    one malformed variant in every four sheets. Yields (name, pdf, expected).
+    """
+    rng = random.Random(seed)
+    malformed = [variant for variant in VARIANTS if variant]
+    for i in range(count):
+        semester = i % 6 + 1
+        variant = malformed[(i // 4) % len(malformed)] if i % 4 == 3 else None
+        subjects = rng.randint(3, 8)
+        failed = rng.choice([0, 0, 0, 1, 2])
+        pdf, expected = make_sheet(semester, subjects, failed, variant, seed=rng.random())
+        name = f"sem{semester}_{i:04d}_{variant or 'valid'}.pdf"
+        yield name, pdf, expected
+
+
+def grade_card_streams(blocks, rng):
+    """
+    Semester blocks (label line, marks table, SGPA lines) flowed down as many
+    pages as they need. A table that does not fit is split over two pages,
+    without repeating its header, as the university's cards do.
+    """
+    pages = [[
+        text_op(190, 800, "UNIVERSITY OF CALICUT", 12),
+        text_op(190, 782, "Consolidated Grade Card", 10),
+        text_op(30, 750, f"Name : STUDENT {rng.randint(1000, 9999)}", 9),
+        text_op(30, 736, f"Register No : {rng.choice('ABCDEFGH')}{rng.randint(10, 99)}AXXX{rng.randint(1000, 9999)}", 9),
+        text_op(30, 722, "Programme : B.Sc Computer Science (CBCSS)", 9),
+    ]]
+    y = 690
+
+    for semester, rows in blocks:
+        # keep the label with the header and first mark row
+        if y - 20 - 2 * ROW_HEIGHT < PAGE_BOTTOM:
+            pages.append([])
+            y = PAGE_TOP
+        pages[-1].append(text_op(30, y, f"{ROMAN[semester]} Semester B.Sc Degree Examination November {rng.randint(2019, 2024)}", 9))
+        y -= 12
+
+        table = [HEADER] + rows
+        while table:
+            fits = max(1, int((y - PAGE_BOTTOM) // ROW_HEIGHT))
+            ops, y = draw_table(table[:fits], y)
+            pages[-1] += ops
+            table = table[fits:]
+            if table:
+                pages.append([])
+                y = PAGE_TOP
+        if y - 45 < PAGE_BOTTOM:
+            pages.append([])
+            y = PAGE_TOP + 25
+        pages[-1] += sgpa_ops(rows, y)
+        y -= 70
+    return ["\n".join(ops).encode("latin-1") for ops in pages]
+
+
+def make_grade_card(semesters, subjects=6, failed=0, seed=None):
+    """
+    Consolidated grade card pdf covering `semesters` and the marks table
+    expected for each, as {semester: rows including the header}.
+    """
+    rng = random.Random(seed)
+    blocks = [(semester, mark_rows(rng, semester, subjects, failed)) for semester in semesters]
+    pdf = write_pdf(*grade_card_streams(blocks, rng))
+    return pdf, {semester: [list(HEADER)] + [list(row) for row in rows] for semester, rows in blocks}
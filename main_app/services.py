@@ -1,32 +1,53 @@
-import sys
+import io
+import gzip
+import csv
+import json
 import string
 import random
-import traceback
-import pdfplumber
+import threading
+import multiprocessing
+from datetime import timedelta
+from concurrent.futures import ProcessPoolExecutor
 
-from django.db import transaction
+from django.conf import settings
+from django.utils import timezone
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connections, router, transaction, IntegrityError
+from django.db.models import Count, F, FloatField, Q, Sum, Window
+from django.db.models.functions import Cast, Rank
 from django.core.exceptions import ValidationError
-from .serializers import UserLoginSerializer
+from django.contrib.auth.hashers import make_password
+from .serializers import UserLoginSerializer, StudentCreateSerializer
+from .errors import (
+    error_messages,
+    AuthenticationFailedError,
+    PermissionDeniedError,
+    InvalidDocumentError,
+    DuplicateUploadError,
+)
+from .reference_cache import reference_data
+from .previews import schedule_preview, preview_name
+from .storage import is_compressed
+from .profiling import NO_PROFILE, save_upload_trace
 from .models import (
     User,
     UserAuthToken,
-    ROLE_CHOICES,
+    ROLE_NAMES,
     Faculty,
     Student,
     Subject, 
     Mark,
+    ArchivedMark,
     MarkSheetDoc, 
+    ChangeEvent,
+    RankSnapshot,
 )
+from .routers import shard_for_course
 
 
 def handle_error(e):
-    msg = ["Something went wrong."]
-    error_info = "\n".join(traceback.format_exception(*sys.exc_info()))
-    print(error_info)
-    if isinstance(e, ValidationError):
-        error_info = "\n".join(e.messages)
-        msg = e.messages
-    return msg
+    return error_messages(e)
 
 
 def validate_login_data(data):
@@ -53,20 +74,56 @@ def get_login_user(username, password):
         if not success:
             raise User.DoesNotExist
         if admin:
-            raise ValidationError("Admin user!!!")
+            raise AuthenticationFailedError("Admin user!!!")
         return user
     except User.DoesNotExist:
-        raise ValidationError("Invalid Username or Password")
+        raise AuthenticationFailedError("Invalid Username or Password")
 
 
 def check_deleted(user):
+    # deactivate_student switches off the user along with the student row
     role = user.role
     if role == 3:
-        if Student.objects.filter(user=user,is_active=False).exists():
-            raise ValidationError("Deleted User!!!")
+        if not user.is_active:
+            raise AuthenticationFailedError("Deleted User!!!")
     return True
 
 
+def can_view_marksheet(user, mark_doc):
+    """Students see their own sheets, faculty the sheets of their course"""
+    if user.role == 1:
+        return True
+    if user.role == 3:
+        return Student.active_objects.filter(id=mark_doc.student_id, user=user).exists()
+    if user.role == 2:
+        course_id = Student.objects.filter(id=mark_doc.student_id).values_list("course_id", flat=True).first()
+        return Faculty.active_objects.filter(user=user, course_id=course_id).exists()
+    return False
+
+
+def deactivate_student(student):
+    """Soft delete a student with their marks, mark sheets and tokens in bulk UPDATEs"""
+    user = student.user
+    with transaction.atomic(), transaction.atomic(using=student._state.db):
+        student.is_active = False
+        student.full_clean()
+        student.save()
+        user.is_active = False
+        user.save()
+        Mark.objects.filter(student=student).active().deactivate()
+        ArchivedMark.objects.filter(student=student).active().deactivate()
+        ranked_exams = list(
+            MarkSheetDoc.objects.filter(student=student, status__in=RANKED_STATUSES).active()
+            .values_list("exam_id", flat=True)
+        )
+        MarkSheetDoc.objects.filter(student=student).active().deactivate()
+        UserAuthToken.objects.filter(user=user).active().deactivate()
+        for exam_id in ranked_exams:
+            transaction.on_commit(
+                lambda exam_id=exam_id: refresh_ranks(student.course_id, exam_id), using=student._state.db
+            )
+
+
 def create_auth_token(user):
     string_chars = string.ascii_lowercase + string.digits
     token = "".join(random.choice(string_chars) for _ in range(15))
@@ -78,19 +135,61 @@ def create_auth_token(user):
     return token
 
 
+def get_user_profile(user):
+    """Faculty or Student profile of the user, None for admins"""
+    if user.role == 2:
+        return Faculty.objects.get(user=user)
+    elif user.role == 3:
+        return Student.objects.get(user=user)
+    return None
+
+
+def login_payload_key(user_id):
+    return f"login_payload:{user_id}"
+
+
+def login_payload(user, token):
+    """
+    Profile data shown by the frontend on every page load, cached per token.
+    The course name is resolved from the reference data cache, so renaming a
+    course never leaves a stale name in here.
+    """
+    cache_key = login_payload_key(user.id)
+    payload = cache.get(cache_key)
+    if payload is None or payload["token"] != token:
+        profile = get_user_profile(user)
+        payload = {
+            "token": token,
+            "username": user.username,
+            "user_role": user.role,
+            "profile_id": profile.id if profile else None,
+            "course_id": profile.course_id if profile else None,
+        }
+        cache.set(cache_key, payload, timeout=settings.LOGIN_PAYLOAD_TIMEOUT)
+
+    res = {}
+    res["username"] = payload["username"]
+    res["user_role"] = payload["user_role"]
+    res['role_name'] = ROLE_NAMES.get(payload["user_role"])
+    res['profile_id'] = payload["profile_id"]
+    res['course'] = None
+    if payload["course_id"] is not None:
+        res['course'] = reference_data.get_course(payload["course_id"]).course_name
+    return res
+
+
+def invalidate_login_payload(user_id):
+    cache.delete(login_payload_key(user_id))
+
+
 def login_success_data(user, token):
+    data = login_payload(user, token)
     res = {}
     res["token"] = token
-    res["username"] = user.username
-    res["user_role"] = user.role
-    res['role_name'] = dict(ROLE_CHOICES).get(user.role)
-    if user.role == 2:
-        faculty = Faculty.objects.get(user=user)
-        course = faculty.course.course_name
-    elif user.role == 3:
-        student = Student.objects.get(user=user)
-        course = student.course.course_name
-    res['course'] = course
+    res["username"] = data["username"]
+    res["user_role"] = data["user_role"]
+    res['role_name'] = data["role_name"]
+    res['course'] = data["course"]
     return res
 
 def validate_file_upload_request(exam_id, file):
@@ -103,7 +202,7 @@ def validate_file_upload_request(exam_id, file):
 def verify_file_type(file):
     file_extension = file.name.split('.')[-1]
     if file_extension != "pdf":
-        raise ValidationError("Invalid file type")
+        raise InvalidDocumentError("Invalid file type")
 
 
 def verify_document(page, exam):
@@ -117,14 +216,25 @@ def verify_document(page, exam):
 
     verify_exam_marksheet_match(page, exam)
 
-    marks_list = page.extract_table()
-    marks_list_length = len(marks_list)
-    if marks_list_length < 3 or marks_list_length > 9:
+    from .extractors import extract_marks_table
+
+    marks_list = extract_marks_table(page)
+    if not valid_marks_table(marks_list):
         return False
 
     return marks_list
 
 
+def valid_marks_table(marks_list):
+    """A header and 2 to 8 subjects, every row with the 7 columns save_marks reads"""
+    from .extractors import CALICUT_TEMPLATE_COLUMNS
+
+    if marks_list is None or not 3 <= len(marks_list) <= 9:
+        return False
+    # a missing column rule merges two columns in the generic table finder's rows
+    return all(len(row) == len(CALICUT_TEMPLATE_COLUMNS) for row in marks_list)
+
+
 def verify_exam_marksheet_match(page, exam):
     res = []
     if exam.exam_name == "Semester 1":
@@ -140,83 +250,774 @@ def verify_exam_marksheet_match(page, exam):
     elif exam.exam_name == "Semester 6":
         res = page.search("VI Semester")
     if len(res) == 0:
-        raise ValidationError("Exam and Result Mismatch!")
+        raise InvalidDocumentError("Exam and Result Mismatch!")
+
+
+def verify_consolidated_document(pdf):
+    """
+    Marks of every semester on a consolidated grade card as {semester: marks_list},
+    each block held to the same checks verify_document applies to a single sheet
+    """
+    if not pdf.pages or pdf.pages[0].search("UNIVERSITY OF CALICUT") == []:
+        return False
+
+    from .extractors import semester_blocks
+
+    blocks = {}
+    for semester, marks_list, has_sgpa in semester_blocks(pdf.pages):
+        if semester in blocks:
+            raise InvalidDocumentError(f"Semester {semester} appears twice in the grade card")
+        if not has_sgpa or not valid_marks_table(marks_list):
+            raise InvalidDocumentError(f"Could not read the Semester {semester} marks")
+        blocks[semester] = marks_list
+    return blocks or False
+
+
+def calculate_sgpa(total_credit_points, total_credit, failed):
+    if failed or not total_credit:
+        return 0
+    return round(total_credit_points / total_credit, 2)
+
 
+def validate_idempotency_key(key):
+    if key and len(key) > MarkSheetDoc._meta.get_field("idempotency_key").max_length:
+        raise ValidationError("Idempotency-Key is too long!")
+    return key or None
 
-def retreive_and_save_marks(user, file, exam, student):
-    with pdfplumber.open(file) as pdf:
+
+def claim_mark_sheet(user, student, exam, idempotency_key=None):
+    """
+    Reserve the student's mark sheet for the exam before any parsing, as a
+    "Processing" row guarded by the unique (student, exam) constraint.
+    Returns (mark_doc, claimed), claimed is False when the request repeats the
+    Idempotency-Key of the upload holding the row.
+    """
+    using = student._state.db
+    mark_doc = MarkSheetDoc(
+        student=student,
+        exam=exam,
+        status=MarkSheetDoc.PROCESSING,
+        idempotency_key=idempotency_key,
+        added_by=user,
+    )
+    mark_doc.full_clean(exclude=["mark_sheet"], validate_constraints=False)
+    for _ in range(2):
+        try:
+            with transaction.atomic(using=using):
+                mark_doc.save(using=using)
+            return mark_doc, True
+        except IntegrityError:
+            existing = MarkSheetDoc.active_objects.using(using).filter(student=student, exam=exam).first()
+        if existing is None:
+            # released meanwhile, try again
+            continue
+        if idempotency_key and existing.idempotency_key == idempotency_key:
+            return existing, False
+        if existing.status != MarkSheetDoc.PROCESSING:
+            break
+        # take over an upload abandoned mid parse, only one request wins the update
+        stale = timezone.now() - timedelta(seconds=settings.UPLOAD_CLAIM_TIMEOUT)
+        MarkSheetDoc.objects.using(using).filter(
+            id=existing.id, status=MarkSheetDoc.PROCESSING, modified_time__lt=stale
+        ).deactivate()
+    raise DuplicateUploadError("You have already uploaded marks for this exam")
+
+
+def release_mark_sheet(mark_doc):
+    """Give up a claim whose upload failed, so the student can upload again"""
+    shared = (
+        MarkSheetDoc.active_objects.using(mark_doc._state.db)
+        .filter(mark_sheet=mark_doc.mark_sheet.name).exclude(id=mark_doc.id)
+    )
+    # a grade card's semesters share one pdf, it goes with the last of them
+    if mark_doc.mark_sheet and not shared.exists():
+        mark_doc.mark_sheet.delete(save=False)
+    mark_doc.status = MarkSheetDoc.PROCESSING
+    mark_doc.is_active = False
+    mark_doc.save()
+
+
+def upload_mark_sheet(user, file, exam, student, idempotency_key=None, profile=NO_PROFILE):
+    """Claim, then parse and save. Returns (mark_doc, created)"""
+    mark_doc, claimed = claim_mark_sheet(user, student, exam, idempotency_key)
+    if not claimed:
+        return mark_doc, False
+    try:
+        retreive_and_save_marks(user, file, exam, student, mark_doc, profile)
+    except Exception:
+        release_mark_sheet(mark_doc)
+        raise
+    save_upload_trace(profile, [mark_doc], file.size)
+    return mark_doc, True
+
+
+def upload_consolidated_mark_sheet(user, file, student, idempotency_key=None, profile=NO_PROFILE):
+    """
+    Import every semester of a consolidated grade card: parse all of its pages,
+    claim a mark sheet per semester, then save all their marks in one
+    transaction. Semesters the student already has a mark sheet for are
+    skipped. Returns (mark_docs, skipped_exams, created), created is False
+    when the request repeats the Idempotency-Key of an earlier import.
+    """
+    import pdfplumber
+
+    with profile.phase("parse"), pdfplumber.open(file) as pdf:
+        blocks = verify_consolidated_document(pdf)
+        if not blocks:
+            raise InvalidDocumentError("Invalid pdf")
+
+    exams = {exam.exam_name: exam for exam in reference_data.active_exams()}
+    semesters = []
+    for semester, marks_list in sorted(blocks.items()):
+        exam = exams.get(f"Semester {semester}")
+        if exam is None:
+            raise InvalidDocumentError(f"Semester {semester} is not an active examination")
+        semesters.append((exam, marks_list))
+
+    claimed = []
+    replayed = []
+    skipped = []
+    try:
+        for exam, marks_list in semesters:
+            try:
+                mark_doc, created = claim_mark_sheet(user, student, exam, idempotency_key)
+            except DuplicateUploadError:
+                skipped.append(exam)
+                continue
+            if created:
+                claimed.append((mark_doc, exam, marks_list))
+            else:
+                replayed.append(mark_doc)
+        if replayed:
+            # a retry of an import that holds these semesters, leave them to it
+            for mark_doc, exam, marks_list in claimed:
+                release_mark_sheet(mark_doc)
+            return replayed, skipped, False
+        if not claimed:
+            raise DuplicateUploadError("You have already uploaded marks for every semester on this grade card")
+
+        with profile.phase("save"), transaction.atomic(using=student._state.db):
+            stored = file
+            for mark_doc, exam, marks_list in claimed:
+                save_marks(user, stored, exam, student, mark_doc, marks_list)
+                # the pdf is stored once, every semester's sheet points at it
+                stored = mark_doc.mark_sheet.name
+    except Exception:
+        for mark_doc, exam, marks_list in claimed:
+            release_mark_sheet(mark_doc)
+        raise
+    mark_docs = [mark_doc for mark_doc, exam, marks_list in claimed]
+    save_upload_trace(profile, mark_docs, file.size)
+    return mark_docs, skipped, True
+
+
+def retreive_and_save_marks(user, file, exam, student, mark_doc, profile=NO_PROFILE):
+    """Parse the pdf into marks and complete the claimed mark sheet"""
+    # the pdf stack (pdfplumber, pdfminer, Pillow) is only imported by workers
+    # that parse uploads, see gunicorn.conf.py
+    import pdfplumber
+
+    with profile.phase("parse"), pdfplumber.open(file) as pdf:
         first_page = pdf.pages[0]
         verified = verify_document(first_page,exam)
         if not verified:
-            raise ValidationError("Invalid pdf")
+            raise InvalidDocumentError("Invalid pdf")
         marks_list = verified
-        
-        # mark list data save
-        with transaction.atomic():
-            total_credit_points = 0
-            total_credit = 0
-            failed = False
-            for marks in marks_list[1:]:
-                print(marks)
-                subject_code = marks[0]
-                subject_name = marks[1]
-                grade = marks[2]
-                grade_point = marks[3]
-                credit = marks[4]
-                credit_piont = marks[5]
-                mark_status = marks[6]
-                if mark_status == "Failed":
-                    failed = True
-                
-                if not failed:
-                    total_credit_points += int(credit_piont)
-                    total_credit += int(credit)
-                else:
-                    credit_piont = 0
-                    credit = 0
-                    grade_point = 0
-
-                subject = Subject.objects.filter(subject_code=subject_code, subject_name=subject_name, is_active=True)
-                if not subject.exists():
-                    subject = Subject(
-                        subject_code=subject_code,
-                        subject_name=subject_name,
-                        course=student.course,
-                        exam=exam,
-                        added_by=user,
-                    )
-                    subject.full_clean()
-                    subject.save()
-                else:
-                    subject = subject[0]
-
-                mark = Mark(
-                    subject=subject,
-                    grade=grade,
-                    grade_point=grade_point,
-                    credit=credit,
-                    credit_point=credit_piont,
-                    status=mark_status,
-                    student=student,
-                    exam=exam,
-                    added_by=user,
-                )
-                mark.full_clean()
-                mark.save()
 
-            try:
-                sgpa = round(total_credit_points / total_credit, 2)
-                if failed:
-                    sgpa = 0
-            except ZeroDivisionError:
-                sgpa = 0
-
-            mark_doc = MarkSheetDoc(
-                mark_sheet=file,
-                sgpa=sgpa,
-                student=student,
+    # mark list data save, on the database holding the student's course
+    with profile.phase("save"), transaction.atomic(using=student._state.db):
+        save_marks(user, file, exam, student, mark_doc, marks_list)
+
+
+def save_marks(user, file, exam, student, mark_doc, marks_list):
+    """Marks of one exam and the completed mark sheet, inside the caller's transaction"""
+    total_credit_points = 0
+    total_credit = 0
+    failed = False
+    for marks in marks_list[1:]:
+        subject_code = marks[0]
+        subject_name = marks[1]
+        grade = marks[2]
+        grade_point = marks[3]
+        credit = marks[4]
+        credit_piont = marks[5]
+        mark_status = marks[6]
+        if mark_status == "Failed":
+            failed = True
+
+        if not failed:
+            total_credit_points += int(credit_piont)
+            total_credit += int(credit)
+        else:
+            credit_piont = 0
+            credit = 0
+            grade_point = 0
+
+        subject = reference_data.find_subject(subject_code, subject_name)
+        if subject is None:
+            subject = Subject(
+                subject_code=subject_code,
+                subject_name=subject_name,
+                course=student.course,
                 exam=exam,
                 added_by=user,
             )
-            mark_doc.full_clean()
-            mark_doc.save()
+            subject.full_clean()
+            subject.save()
+
+        mark = Mark(
+            subject=subject,
+            grade=grade,
+            grade_point=grade_point,
+            credit=credit,
+            credit_point=credit_piont,
+            status=mark_status,
+            student=student,
+            exam=exam,
+            added_by=user,
+        )
+        mark.full_clean()
+        mark.save()
+
+    sgpa = calculate_sgpa(total_credit_points, total_credit, failed)
+
+    mark_doc.mark_sheet = file
+    mark_doc.sgpa = sgpa
+    mark_doc.status = MarkSheetDoc.PENDING
+    mark_doc.full_clean()
+    mark_doc.save()
+    transaction.on_commit(lambda: schedule_preview(mark_doc), using=student._state.db)
+
+
+def parse_student_rows(file):
+    """Rows of username, name, registration_no from an uploaded csv or json file"""
+    content = file.read()
+    if isinstance(content, bytes):
+        content = content.decode("utf-8-sig")
+    if file.name.split('.')[-1] == "json":
+        rows = json.loads(content)
+        if isinstance(rows, dict):
+            rows = rows.get("students", [])
+        return rows
+    return list(csv.DictReader(io.StringIO(content)))
+
+
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+
+
+def hash_pool(workers):
+    # spawned workers start clean instead of forking a server process with
+    # its threads, locks and open database connections
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def get_hash_pool():
+    """Pool shared by onboarding requests, at most BULK_HASH_WORKERS processes per server process"""
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            _hash_pool = hash_pool(settings.BULK_HASH_WORKERS)
+    return _hash_pool
+
+
+def hash_passwords(passwords, workers=None):
+    """
+    PBKDF2 hashing dominates onboarding, so spread it over a process pool:
+    the shared bounded pool inside requests, or a pool of `workers`
+    processes of its own (onboard_students command).
+    """
+    if len(passwords) < settings.BULK_HASH_POOL_THRESHOLD:
+        return [make_password(password) for password in passwords]
+    chunksize = max(1, len(passwords) // ((workers or settings.BULK_HASH_WORKERS) * 4))
+    if workers is None:
+        return list(get_hash_pool().map(make_password, passwords, chunksize=chunksize))
+    with hash_pool(workers) as executor:
+        return list(executor.map(make_password, passwords, chunksize=chunksize))
+
+
+def validate_student_rows(rows):
+    """Split rows into valid student data and a row level error report"""
+    valid = []
+    errors = []
+    seen = set()
+    for row_no, row in enumerate(rows, start=1):
+        serializer = StudentCreateSerializer(data=row)
+        serializer.is_valid()
+        if serializer.errors:
+            errors.append({
+                "row": row_no,
+                "username": row.get("username") if isinstance(row, dict) else None,
+                "errors": [
+                    f"{error.upper()}: {serializer.errors[error][0]}"
+                    for error in serializer.errors
+                ],
+            })
+            continue
+        data = serializer.validated_data
+        row_errors = []
+        try:
+            User(username=data["username"], first_name=data["name"]).clean_fields(
+                exclude=["password", "last_name", "email"]
+            )
+        except ValidationError as e:
+            row_errors += e.messages
+        if data["username"] in seen:
+            row_errors.append("Username repeated in this file")
+        seen.add(data["username"])
+        if row_errors:
+            errors.append({"row": row_no, "username": data["username"], "errors": row_errors})
+            continue
+        valid.append((row_no, data))
+
+    # one query for every username in the file
+    existing = set(
+        User.objects.filter(username__in=[data["username"] for _, data in valid])
+        .values_list("username", flat=True)
+    )
+    students = []
+    for row_no, data in valid:
+        if data["username"] in existing:
+            errors.append({"row": row_no, "username": data["username"], "errors": ["Username already exists"]})
+        else:
+            students.append(data)
+    errors.sort(key=lambda error: error["row"])
+    return students, errors
+
+
+def onboard_students(user, course, rows, hash_workers=None):
+    students, errors = validate_student_rows(rows)
+    password_hashes = hash_passwords([data["registration_no"] for data in students], hash_workers)
+
+    batch_size = settings.BULK_ONBOARD_BATCH_SIZE
+    created = 0
+    for start in range(0, len(students), batch_size):
+        batch = students[start:start + batch_size]
+        hashes = password_hashes[start:start + batch_size]
+        st_users = [
+            User(username=data["username"], first_name=data["name"], password=password, role=3)
+            for data, password in zip(batch, hashes)
+        ]
+        student_db = router.db_for_write(Student)
+        with transaction.atomic(), transaction.atomic(using=student_db):
+            st_users = User.objects.bulk_create(st_users)
+            Student.objects.bulk_create([
+                Student(
+                    user=st_user,
+                    registration_no=data["registration_no"],
+                    course=course,
+                    added_by=user,
+                )
+                for st_user, data in zip(st_users, batch)
+            ])
+        created += len(batch)
+    if created:
+        # bulk_create sends no signals
+        invalidate_dashboard(course.id)
+    return {"created": created, "failed": len(errors), "errors": errors}
+
+
+def move_mark_sheet(mark_doc, new_name):
+    """
+    Move a mark sheet (and its preview) to another tier or compression,
+    eg: mark_sheet/3f/a2/x.pdf -> archive/mark_sheet/3f/a2/x.pdf.gz,
+    along with every other sheet stored in the same pdf
+    """
+    storage = mark_doc.mark_sheet.storage
+    old_name = mark_doc.mark_sheet.name
+    old_preview = preview_name(mark_doc)
+
+    with storage.open(old_name, "rb") as file:
+        data = file.read()
+    if is_compressed(new_name):
+        data = gzip.compress(data)
+    new_name = storage.save(new_name, ContentFile(data))
+
+    # the semesters of a consolidated grade card share one pdf
+    MarkSheetDoc.objects.using(mark_doc._state.db).filter(mark_sheet=old_name).update(mark_sheet=new_name)
+    mark_doc.mark_sheet.name = new_name
+
+    if storage.exists(old_preview):
+        with storage.open(old_preview, "rb") as file:
+            storage.save(preview_name(mark_doc), ContentFile(file.read()))
+        storage.delete(old_preview)
+    storage.delete(old_name)
+    return new_name
+
+
+def record_mark_sheet_changes(mark_sheets):
+    """Feed events and dashboard updates for mark sheets changed by a bulk UPDATE (no signals)"""
+    ChangeEvent.objects.bulk_create([
+        ChangeEvent(
+            kind=ChangeEvent.STATUS_CHANGED,
+            course_id=mark_doc.student.course_id,
+            student_id=mark_doc.student_id,
+            exam_id=mark_doc.exam_id,
+            object_id=mark_doc.id,
+            data={
+                "marksheet": mark_doc.id,
+                "status": mark_doc.status,
+                "previous_status": mark_doc.saved_status,
+                "sgpa": mark_doc.sgpa,
+            },
+        )
+        for mark_doc in mark_sheets
+    ])
+    invalidate_dashboard_cells({mark_doc.student_id for mark_doc in mark_sheets})
+    cohorts = {
+        (mark_doc.student.course_id, mark_doc.exam_id)
+        for mark_doc in mark_sheets
+        if mark_doc.status in RANKED_STATUSES or mark_doc.saved_status in RANKED_STATUSES
+    }
+    for course_id, exam_id in cohorts:
+        refresh_ranks(course_id, exam_id)
+
+
+def reviewable_mark_sheets(queryset):
+    """Mark sheets that can be approved or rejected: active, with their upload complete"""
+    return queryset.active().exclude(status=MarkSheetDoc.PROCESSING)
+
+
+def set_mark_sheet_status(queryset, new_status):
+    """Approve / reject mark sheets in one UPDATE, returns how many changed"""
+    mark_sheets = list(
+        reviewable_mark_sheets(queryset)
+        .exclude(status=new_status)
+        .select_related("student")
+    )
+    if not mark_sheets:
+        return 0
+    using = queryset.db
+    with transaction.atomic(using=using):
+        MarkSheetDoc.objects.using(using).filter(id__in=[mark_doc.id for mark_doc in mark_sheets]).update(
+            status=new_status, modified_time=timezone.now()
+        )
+        for mark_doc in mark_sheets:
+            mark_doc.status = new_status
+        transaction.on_commit(lambda: record_mark_sheet_changes(mark_sheets), using=using)
+    return len(mark_sheets)
+
+
+def recompute_sgpa(queryset):
+    """
+    Recalculate the SGPA of mark sheets from their current (possibly edited)
+    marks, aggregated in one query. Returns how many changed.
+    """
+    mark_sheets = list(queryset.active().exclude(status=MarkSheetDoc.PROCESSING).select_related("student"))
+    if not mark_sheets:
+        return 0
+    using = queryset.db
+    totals = {
+        (row["student_id"], row["exam_id"]): row
+        for row in Mark.active_objects.using(using)
+        .filter(student_id__in={mark_doc.student_id for mark_doc in mark_sheets})
+        .values("student_id", "exam_id")
+        .annotate(
+            credit_points=Sum("credit_point"),
+            credits=Sum("credit"),
+            failed=Count("id", filter=Q(status="Failed")),
+        )
+    }
+    changed = []
+    for mark_doc in mark_sheets:
+        row = totals.get((mark_doc.student_id, mark_doc.exam_id))
+        if row is None:
+            continue
+        sgpa = str(calculate_sgpa(row["credit_points"] or 0, row["credits"] or 0, row["failed"]))
+        if sgpa != mark_doc.sgpa:
+            mark_doc.sgpa = sgpa
+            mark_doc.modified_time = timezone.now()
+            changed.append(mark_doc)
+    if changed:
+        with transaction.atomic(using=using):
+            MarkSheetDoc.objects.using(using).bulk_update(changed, ["sgpa", "modified_time"], batch_size=500)
+            transaction.on_commit(lambda: record_mark_sheet_changes(changed), using=using)
+    return len(changed)
+
+
+def record_change(kind, instance, object_id, data):
+    """Append a change feed event for a mark sheet / mark of a student"""
+    ChangeEvent.objects.create(
+        kind=kind,
+        course_id=instance.student.course_id,
+        student_id=instance.student_id,
+        exam_id=instance.exam_id,
+        object_id=object_id,
+        data=data,
+    )
+
+
+def change_feed(user, since, limit=None):
+    """Changes visible to the user with an id above the `since` cursor"""
+    limit = limit or settings.CHANGE_FEED_PAGE_SIZE
+    profile = get_user_profile(user)
+    if profile is None:
+        raise PermissionDeniedError("Log in as faculty or student to follow changes")
+    events = ChangeEvent.objects.filter(id__gt=since, course_id=profile.course_id)
+    if user.role == 3:
+        events = events.filter(student_id=profile.id)
+    # ids are handed out before commit, so a just-written lower id may still be
+    # in flight; leave the newest events for the next poll
+    settle = timezone.now() - timedelta(seconds=settings.CHANGE_FEED_SETTLE_SECONDS)
+    events = list(
+        events.filter(created_time__lte=settle)
+        .order_by("id")
+        .values("id", "kind", "student_id", "exam_id", "object_id", "data", "created_time")[:limit + 1]
+    )
+    more = len(events) > limit
+    events = events[:limit]
+    return {
+        "cursor": events[-1]["id"] if events else since,
+        "more": more,
+        "changes": events,
+    }
+
+
+NOT_UPLOADED = "Not Uploaded"
+
+
+def dashboard_key(course_id):
+    return f"dashboard:{course_id}"
+
+
+def dashboard_cells_key(student_id):
+    return f"dashboard:cells:{student_id}"
+
+
+def build_dashboard(course_id):
+    """Active students of the course, the rows of the dashboard"""
+    students = list(
+        Student.active_objects.filter(course_id=course_id)
+        .values("id", "user_id", "registration_no")
+    )
+    # users live on the default database, students may be on a course shard
+    names = dict(
+        User.objects.filter(id__in=[student["user_id"] for student in students]).values_list("id", "first_name")
+    )
+    return {
+        student["id"]: {
+            "student_id": student["id"],
+            "name": names.get(student["user_id"]),
+            "registration_no": student["registration_no"],
+        }
+        for student in students
+    }
+
+
+def build_dashboard_cells(student_ids, batch_size=500):
+    """Upload / approval status of the students' mark sheets per exam, latest upload wins"""
+    cells = {student_id: {} for student_id in student_ids}
+    for start in range(0, len(student_ids), batch_size):
+        mark_sheets = (
+            MarkSheetDoc.active_objects.filter(student_id__in=student_ids[start:start + batch_size])
+            .order_by("student_id", "exam_id", "id")
+            .values_list("id", "student_id", "exam_id", "status", "sgpa")
+        )
+        for mark_sheet_id, student_id, exam_id, mark_sheet_status, sgpa in mark_sheets:
+            cells[student_id][exam_id] = {
+                "marksheet_id": mark_sheet_id,
+                "status": mark_sheet_status,
+                "sgpa": sgpa,
+            }
+    return cells
+
+
+def get_dashboard(course_id):
+    """
+    The course's students are cached under the course, each student's cells
+    under the student: a mark sheet change drops only that student's cells,
+    so parallel uploads never write over each other's cached grid.
+    """
+    students = cache.get(dashboard_key(course_id))
+    if students is None:
+        students = build_dashboard(course_id)
+        cache.set(dashboard_key(course_id), students, timeout=settings.DASHBOARD_CACHE_TIMEOUT)
+
+    keys = {dashboard_cells_key(student_id): student_id for student_id in students}
+    cells = {keys[key]: student_cells for key, student_cells in cache.get_many(keys).items()}
+    missing = [student_id for student_id in students if student_id not in cells]
+    if missing:
+        built = build_dashboard_cells(missing)
+        cache.set_many(
+            {dashboard_cells_key(student_id): built[student_id] for student_id in missing},
+            timeout=settings.DASHBOARD_CACHE_TIMEOUT,
+        )
+        cells.update(built)
+
+    exams = reference_data.active_exams()
+    res = []
+    for row in sorted(students.values(), key=lambda row: (row["name"] or "").lower()):
+        student_cells = cells[row["student_id"]]
+        row_cells = []
+        for exam in exams:
+            cell = student_cells.get(exam.id)
+            row_cells.append({
+                "exam_id": exam.id,
+                "exam": exam.exam_name,
+                "marksheet_id": cell["marksheet_id"] if cell else "",
+                "status": cell["status"] if cell else NOT_UPLOADED,
+                "sgpa": cell["sgpa"] if cell else "",
+            })
+        res.append({
+            "student_id": row["student_id"],
+            "name": row["name"],
+            "registration_no": row["registration_no"],
+            "exams": row_cells,
+        })
+    return res
+
+
+def invalidate_dashboard_cells(student_ids):
+    """Drop the cached cells of students whose mark sheets changed, rebuilt on next read"""
+    cache.delete_many([dashboard_cells_key(student_id) for student_id in student_ids])
+
+
+def invalidate_dashboard(course_id):
+    cache.delete(dashboard_key(course_id))
+
+
+# only approved sheets and their marks make up a cohort (see cohort_rank_rows)
+RANKED_STATUSES = (MarkSheetDoc.APPROVED,)
+
+
+def percentile(rank, cohort_size):
+    """Share of the cohort scoring the same or lower (ie: cume_dist), the topper gets 100"""
+    return round(100 * (cohort_size - rank + 1) / cohort_size, 2)
+
+
+def rank_in_memory(rows, partition=None):
+    """Competition ranking (1, 2, 2, 4) of score rows, for databases without window functions"""
+    groups = {}
+    for row in rows:
+        groups.setdefault(row[partition] if partition else None, []).append(row)
+    for group in groups.values():
+        group.sort(key=lambda row: row["score"], reverse=True)
+        for i, row in enumerate(group):
+            tied = i and row["score"] == group[i - 1]["score"]
+            row["rank"] = group[i - 1]["rank"] if tied else i + 1
+            row["cohort_size"] = len(group)
+    return [row for group in groups.values() for row in group]
+
+
+def cohort_rank_rows(course_id, exam_id, using, subject_id=None):
+    """
+    Rank rows of the cohort by SGPA and, per subject, by grade point. With
+    subject_id only that subject's rows, the SGPA ranks are left out.
+    """
+    sheets = (
+        MarkSheetDoc.active_objects.using(using)
+        .filter(student__course_id=course_id, student__is_active=True, exam_id=exam_id, status__in=RANKED_STATUSES)
+        .annotate(score=Cast("sgpa", FloatField()))
+    )
+    mark_filters = {"exam_id": exam_id, "student_id__in": sheets.values("student_id"), "grade_point__isnull": False}
+    if subject_id is not None:
+        mark_filters["subject_id"] = subject_id
+    marks = Mark.active_objects.using(using).filter(**mark_filters).annotate(score=Cast("grade_point", FloatField()))
+    # students of graduated cohorts keep their subject ranks from the archive
+    archived_marks = (
+        ArchivedMark.active_objects.using(using).filter(**mark_filters)
+        .annotate(score=Cast("grade_point", FloatField()))
+    )
+    if not connections[using].features.supports_over_clause or archived_marks.exists():
+        mark_fields = ("student_id", "subject_id", "score")
+        return (
+            rank_in_memory(list(sheets.values("student_id", "score"))) if subject_id is None else [],
+            rank_in_memory(
+                list(marks.values(*mark_fields)) + list(archived_marks.values(*mark_fields)), partition="subject_id"
+            ),
+        )
+
+    by_score = F("score").desc()
+    sheet_rows = sheets.annotate(
+        rank=Window(Rank(), order_by=by_score),
+        cohort_size=Window(Count("id")),
+    ).values("student_id", "score", "rank", "cohort_size")
+    mark_rows = marks.annotate(
+        rank=Window(Rank(), partition_by=F("subject_id"), order_by=by_score),
+        cohort_size=Window(Count("id"), partition_by=F("subject_id")),
+    ).values("student_id", "subject_id", "score", "rank", "cohort_size")
+    return list(sheet_rows) if subject_id is None else [], list(mark_rows)
+
+
+def refresh_ranks(course_id, exam_id, subject_id=None):
+    """
+    Rebuild the rank snapshot of one (course, exam) cohort, or only its
+    ranks in one subject when a mark of an approved sheet was edited
+    """
+    using = shard_for_course(course_id)
+    snapshots_filter = {"course_id": course_id, "exam_id": exam_id}
+    if subject_id is not None:
+        snapshots_filter["subject_id"] = subject_id
+    for attempt in range(2):
+        sheet_rows, mark_rows = cohort_rank_rows(course_id, exam_id, using, subject_id)
+        snapshots = [
+            RankSnapshot(
+                course_id=course_id,
+                exam_id=exam_id,
+                subject_id=row.get("subject_id"),
+                student_id=row["student_id"],
+                score=row["score"],
+                rank=row["rank"],
+                percentile=percentile(row["rank"], row["cohort_size"]),
+                cohort_size=row["cohort_size"],
+            )
+            for row in sheet_rows + mark_rows
+        ]
+        try:
+            with transaction.atomic(using=using):
+                RankSnapshot.objects.using(using).filter(**snapshots_filter).delete()
+                RankSnapshot.objects.using(using).bulk_create(snapshots, batch_size=500)
+            return len(sheet_rows)
+        except IntegrityError:
+            # a concurrent refresh of the same cohort got in first, rebuild from its state
+            if attempt:
+                raise
+
+
+def snapshot_data(snapshot):
+    return {
+        "score": snapshot.score,
+        "rank": snapshot.rank,
+        "percentile": snapshot.percentile,
+        "cohort_size": snapshot.cohort_size,
+    }
+
+
+def student_ranks(student, exam_id):
+    """SGPA rank and per subject ranks of a student, read from the snapshot"""
+    snapshots = RankSnapshot.objects.using(student._state.db).filter(student=student, exam_id=exam_id)
+    res = {"sgpa": None, "subjects": []}
+    for snapshot in snapshots.select_related("subject"):
+        if snapshot.subject_id is None:
+            res["sgpa"] = snapshot_data(snapshot)
+        else:
+            res["subjects"].append({
+                "subject_id": snapshot.subject_id,
+                "subject_code": snapshot.subject.subject_code,
+                "subject_name": snapshot.subject.subject_name,
+                **snapshot_data(snapshot),
+            })
+    res["subjects"].sort(key=lambda subject: subject["subject_code"] or "")
+    return res
+
+
+def cohort_ranking(course_id, exam_id, subject_id=None):
+    """The cohort in rank order, by SGPA or in one subject"""
+    snapshots = list(
+        RankSnapshot.objects.filter(course_id=course_id, exam_id=exam_id, subject_id=subject_id)
+        .select_related("student")
+        .order_by("rank", "student_id")
+    )
+    # users live on the default database, students may be on a course shard
+    names = dict(
+        User.objects.filter(id__in=[snapshot.student.user_id for snapshot in snapshots]).values_list("id", "first_name")
+    )
+    return [
+        {
+            "student_id": snapshot.student_id,
+            "name": names.get(snapshot.student.user_id),
+            "registration_no": snapshot.student.registration_no,
+            **snapshot_data(snapshot),
+        }
+        for snapshot in snapshots
+    ]
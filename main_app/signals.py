@@ -0,0 +1,125 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import User, Exam, Course, Subject, Student, Faculty, Mark, MarkSheetDoc, ChangeEvent
+from .reference_cache import reference_data
+from .services import (
+    invalidate_login_payload,
+    record_change,
+    invalidate_dashboard_cells,
+    invalidate_dashboard,
+    refresh_ranks,
+    RANKED_STATUSES,
+)
+
+
+@receiver(post_save, sender=Exam)
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Exam)
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Subject)
+def invalidate_reference_data(sender, using, **kwargs):
+    transaction.on_commit(reference_data.invalidate, using=using)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_login_payload(sender, instance, using, **kwargs):
+    # password change, deactivation or any other edit of the user
+    transaction.on_commit(lambda: invalidate_login_payload(instance.id), using=using)
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_save, sender=Faculty)
+@receiver(post_delete, sender=Student)
+@receiver(post_delete, sender=Faculty)
+def invalidate_profile_login_payload(sender, instance, using, **kwargs):
+    # deletion (is_active=False) or course change of a student / faculty
+    transaction.on_commit(lambda: invalidate_login_payload(instance.user_id), using=using)
+
+
+@receiver(post_save, sender=MarkSheetDoc)
+def record_marksheet_change(sender, instance, created, using, **kwargs):
+    if instance.status == MarkSheetDoc.PROCESSING:
+        # claimed by an upload still being parsed (or released after it failed)
+        return
+    # a claimed upload enters "Pending" once its marks are saved, any other
+    # save (review, faculty reopening a sheet for changes) is a status change
+    if created or instance.saved_status == MarkSheetDoc.PROCESSING:
+        kind = ChangeEvent.UPLOADED
+    else:
+        kind = ChangeEvent.STATUS_CHANGED
+    data = {
+        "marksheet": instance.id,
+        "status": instance.status,
+        "previous_status": instance.saved_status,
+        "sgpa": instance.sgpa,
+    }
+    transaction.on_commit(lambda: record_change(kind, instance, instance.id, data), using=using)
+
+
+@receiver(post_save, sender=Mark)
+def record_mark_change(sender, instance, created, using, **kwargs):
+    # marks created by an upload are covered by the upload's event
+    if created:
+        return
+    data = {
+        "mark": instance.id,
+        "grade": instance.grade,
+        "grade_point": instance.grade_point,
+        "credit": instance.credit,
+        "credit_point": instance.credit_point,
+    }
+    transaction.on_commit(lambda: record_change(ChangeEvent.MARK_EDITED, instance, instance.id, data), using=using)
+
+
+@receiver(post_save, sender=MarkSheetDoc)
+def invalidate_marksheet_dashboard(sender, instance, using, **kwargs):
+    transaction.on_commit(lambda: invalidate_dashboard_cells([instance.student_id]), using=using)
+
+
+@receiver(post_save, sender=MarkSheetDoc)
+def refresh_marksheet_ranks(sender, instance, using, **kwargs):
+    # only approved sheets are ranked: re-rank the cohort when a sheet is
+    # approved, or leaves the approved status (rejected or reopened)
+    if instance.status not in RANKED_STATUSES and instance.saved_status not in RANKED_STATUSES:
+        return
+    course_id = instance.student.course_id
+    transaction.on_commit(lambda: refresh_ranks(course_id, instance.exam_id), using=using)
+
+
+@receiver(post_save, sender=Mark)
+def refresh_mark_ranks(sender, instance, created, using, **kwargs):
+    # new marks belong to a pending upload, and so do edits before the sheet
+    # is approved; an edit of an approved sheet re-ranks only its subject
+    if created:
+        return
+    approved = MarkSheetDoc.active_objects.using(using).filter(
+        student_id=instance.student_id, exam_id=instance.exam_id, status__in=RANKED_STATUSES
+    )
+    if not approved.exists():
+        return
+    course_id = instance.student.course_id
+    transaction.on_commit(
+        lambda: refresh_ranks(course_id, instance.exam_id, instance.subject_id), using=using
+    )
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def invalidate_student_dashboard(sender, instance, using, **kwargs):
+    # new, deleted or moved student
+    transaction.on_commit(lambda: invalidate_dashboard(instance.course_id), using=using)
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != "sqlite" or not settings.SQLITE_WAL:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA journal_mode=WAL;")
+        cursor.execute("PRAGMA synchronous=NORMAL;")
@@ -0,0 +1,143 @@
+"""
+Storage for uploaded mark sheets.
+
+New uploads are sharded into hashed subdirectories
+(mark_sheet/3f/a2/<name>.pdf) so no directory grows without limit. Older
+sheets can be gzip compressed in place (name + ".gz") and sheets of past
+academic years moved to an archive tier, addressed with the "archive/" name
+prefix. The archive is a separate local directory by default or any Django
+storage backend, eg: an S3 compatible one such as MinIO through
+django-storages (settings.MARKSHEET_ARCHIVE_STORAGE).
+
+Names stored on MarkSheetDoc keep working across tiers, and reads through
+this storage decompress transparently, so views never see the difference.
+"""
+import gzip
+import os
+import struct
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+
+
+ARCHIVE_PREFIX = "archive/"
+COMPRESSED_SUFFIX = ".gz"
+
+
+def mark_sheet_upload_to(instance, filename):
+    shard = uuid.uuid4().hex
+    return f"mark_sheet/{shard[:2]}/{shard[2:4]}/{os.path.basename(filename)}"
+
+
+def is_archived(name):
+    return name.startswith(ARCHIVE_PREFIX)
+
+
+def is_compressed(name):
+    return name.endswith(COMPRESSED_SUFFIX)
+
+
+def academic_year(date):
+    """Calicut academic years start in June, eg: March 2024 is in 2023"""
+    return date.year if date.month >= 6 else date.year - 1
+
+
+def gzip_size(file):
+    """gzip keeps the uncompressed size (mod 2**32) in its last 4 bytes"""
+    file.seek(-4, os.SEEK_END)
+    size = struct.unpack("<I", file.read(4))[0]
+    file.seek(0)
+    return size
+
+
+class CompressedFile(File):
+    """Read only view of a gzip compressed mark sheet"""
+
+    def __init__(self, raw, name):
+        self.raw = raw
+        super().__init__(gzip.GzipFile(fileobj=raw, mode="rb"), name=name)
+        self.size = gzip_size(raw)
+
+    def close(self):
+        super().close()
+        self.raw.close()
+
+
+class MarkSheetStorage(FileSystemStorage):
+
+    @cached_property
+    def archive(self):
+        config = settings.MARKSHEET_ARCHIVE_STORAGE
+        return import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+
+    def _clear_cached_properties(self, setting, **kwargs):
+        super()._clear_cached_properties(setting, **kwargs)
+        if setting == "MARKSHEET_ARCHIVE_STORAGE":
+            self.__dict__.pop("archive", None)
+
+    def _route(self, name):
+        if is_archived(name):
+            return self.archive, name[len(ARCHIVE_PREFIX):]
+        return None, name
+
+    def serves_directly(self, name):
+        """Plain file in the hot tier, ie: the web server can send it as is"""
+        return not is_archived(name) and not is_compressed(name)
+
+    def _open(self, name, mode="rb"):
+        storage, inner = self._route(name)
+        file = storage.open(inner, mode) if storage else super()._open(name, mode)
+        if is_compressed(name):
+            return CompressedFile(file, name[:-len(COMPRESSED_SUFFIX)])
+        return file
+
+    def _save(self, name, content):
+        storage, inner = self._route(name)
+        if storage:
+            return ARCHIVE_PREFIX + storage.save(inner, content)
+        return super()._save(name, content)
+
+    def get_available_name(self, name, max_length=None):
+        storage, inner = self._route(name)
+        if storage:
+            return ARCHIVE_PREFIX + storage.get_available_name(inner, max_length=max_length)
+        return super().get_available_name(name, max_length=max_length)
+
+    def delete(self, name):
+        storage, inner = self._route(name)
+        return storage.delete(inner) if storage else super().delete(name)
+
+    def exists(self, name):
+        storage, inner = self._route(name)
+        return storage.exists(inner) if storage else super().exists(name)
+
+    def size(self, name):
+        """Size of the pdf as read back, ie: uncompressed"""
+        storage, inner = self._route(name)
+        if is_compressed(name):
+            with (storage.open(inner) if storage else super()._open(name)) as file:
+                return gzip_size(file)
+        return storage.size(inner) if storage else super().size(name)
+
+    def path(self, name):
+        storage, inner = self._route(name)
+        return storage.path(inner) if storage else super().path(name)
+
+    def url(self, name):
+        storage, inner = self._route(name)
+        return storage.url(inner) if storage else super().url(name)
+
+    def get_modified_time(self, name):
+        storage, inner = self._route(name)
+        return storage.get_modified_time(inner) if storage else super().get_modified_time(name)
+
+
+def get_mark_sheet_storage():
+    return mark_sheet_storage
+
+
+mark_sheet_storage = MarkSheetStorage()
@@ -1,3 +1,1115 @@
-from django.test import TestCase
+import datetime
+import gzip
+import io
+import json
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import pdfplumber
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.test import (
+    AsyncClient, Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .compression import CompressionMiddleware, brotli
+from .archive import archive_marks, archive_tokens, graduated_students
+from . import errors
+from .errors import DuplicateUploadError, InvalidDocumentError
+from .extractors import extract_marks_table, page_regions
+from .media import parse_range, serve_file
+from .models import (
+    User, UserAuthToken, Exam, Course, Faculty, Subject, Student, Mark, MarkSheetDoc, ChangeEvent, RankSnapshot,
+    ArchivedMark, ArchivedUserAuthToken,
+)
+from .previews import preview_name
+from .renderers import FastJSONRenderer, orjson
+from .reference_cache import ReferenceDataCache, reference_data
+from .routers import (
+    ReplicaRouter, activate_shard, activate_user_routing, replica_reads, reset_routing, shard_for_course,
+    use_replica_reads,
+)
+from .sample_sheets import VARIANTS, corpus, make_grade_card, make_sheet, sheet_sgpa
+from . import services
+from .services import (
+    create_auth_token, deactivate_student, get_dashboard, move_mark_sheet, set_mark_sheet_status, upload_consolidated_mark_sheet,
+    upload_mark_sheet,
+)
+from .storage import ARCHIVE_PREFIX
+
+
+def expected_marks(rows):
+    """Mark rows save_marks stores: from the first failed subject on, points and credits are 0"""
+    marks = []
+    failed = False
+    for code, name, grade, grade_point, credit, credit_point, result in rows[1:]:
+        failed = failed or result == "Failed"
+        if failed:
+            grade_point = credit = credit_point = 0
+        marks.append((code, grade, int(grade_point), int(credit), int(credit_point), result))
+    return marks
+
+
+class TemporaryMediaMixin:
+    """Uploaded sheets go to a throwaway MEDIA_ROOT and archive tier, without previews"""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.archive_root = os.path.join(media_root, "archive_tier")
+        archive = {"BACKEND": "django.core.files.storage.FileSystemStorage", "OPTIONS": {"location": self.archive_root}}
+        settings = override_settings(
+            MEDIA_ROOT=media_root, MARKSHEET_ARCHIVE_STORAGE=archive, MARKSHEET_PREVIEWS=False
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        reference_data.invalidate()
+
+
+class ConcurrentUploadTests(TemporaryMediaMixin, TransactionTestCase):
+    """Parallel uploads of one student's sheet: one is parsed and saved, the rest are turned away"""
+
+    uploads = 6
+
+    def setUp(self):
+        super().setUp()
+        admin = User.objects.create_superuser("admin", "admin@example.com", uuid.uuid4().hex, role=1)
+        self.exam = Exam.objects.create(exam_name="Semester 2", added_by=admin)
+        course = Course.objects.create(course_name="BSc Computer Science", added_by=admin)
+        user = User.objects.create_user("student", password=uuid.uuid4().hex, role=3, first_name="Student")
+        self.student = Student.objects.create(user=user, course=course, registration_no="REG1", added_by=admin)
+        self.token = create_auth_token(user)
+        self.pdf, self.expected = make_sheet(2, subjects=5, seed=1)
+
+    def upload_in_parallel(self, idempotency_key=None):
+        barrier = threading.Barrier(self.uploads)
+        responses = []
+        lock = threading.Lock()
+
+        def upload():
+            headers = {"HTTP_AUTHORIZATION": f"Token {self.token}"}
+            if idempotency_key:
+                headers["HTTP_IDEMPOTENCY_KEY"] = idempotency_key
+            doc = SimpleUploadedFile("sheet.pdf", self.pdf, content_type="application/pdf")
+            barrier.wait()
+            try:
+                response = Client().post("/api/upload/marksheet/", {"exam": self.exam.id, "doc": doc}, **headers)
+                with lock:
+                    responses.append(response.status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=upload) for _ in range(self.uploads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return Counter(responses)
+
+    def assert_saved_once(self):
+        mark_sheets = MarkSheetDoc.active_objects.filter(student=self.student, exam=self.exam)
+        self.assertEqual(mark_sheets.count(), 1)
+        self.assertEqual(mark_sheets[0].status, MarkSheetDoc.PENDING)
+        marks = Mark.active_objects.filter(student=self.student, exam=self.exam)
+        self.assertEqual(marks.count(), len(self.expected["rows"]) - 1)
+        self.assertEqual(marks.values("subject").distinct().count(), marks.count())
+
+    def test_duplicate_uploads_are_rejected(self):
+        responses = self.upload_in_parallel()
+        # the losers get the duplicate upload error
+        self.assertEqual(responses, Counter({200: 1, 404: self.uploads - 1}))
+        self.assert_saved_once()
+
+    def test_retried_upload_is_accepted_once(self):
+        responses = self.upload_in_parallel(idempotency_key=uuid.uuid4().hex)
+        # retries carrying the winner's key are told it is still processing, or that it is done
+        self.assertEqual(responses[200] + responses[202], self.uploads)
+        self.assertGreaterEqual(responses[200], 1)
+        self.assert_saved_once()
+
+
+class SampleSheetUploadTests(TemporaryMediaMixin, TestCase):
+    """Every generated fixture through upload_mark_sheet: valid sheets save their marks, the rest save nothing"""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", uuid.uuid4().hex, role=1)
+        self.course = Course.objects.create(course_name="BSc Computer Science", added_by=self.admin)
+        self.exams = {
+            semester: Exam.objects.create(exam_name=f"Semester {semester}", added_by=self.admin)
+            for semester in range(1, 7)
+        }
+
+    def new_student(self, name):
+        user = User.objects.create_user(name, password=uuid.uuid4().hex, role=3, first_name=name)
+        return Student.objects.create(user=user, course=self.course, registration_no=name, added_by=self.admin)
+
+    def test_fixtures(self):
+        variants = set()
+        for name, pdf, expected in corpus(36, seed=0):
+            variants.add(expected["variant"])
+            with self.subTest(name):
+                student = self.new_student(name.removesuffix(".pdf"))
+                exam = self.exams[expected["semester"]]
+                doc = SimpleUploadedFile(name, pdf, content_type="application/pdf")
+                marks = Mark.active_objects.filter(student=student, exam=exam).order_by("id")
+
+                if not expected["valid"]:
+                    with self.assertRaises(InvalidDocumentError):
+                        upload_mark_sheet(self.admin, doc, exam, student)
+                    self.assertFalse(marks.exists())
+                    self.assertFalse(MarkSheetDoc.active_objects.filter(student=student, exam=exam).exists())
+                    continue
+
+                with self.captureOnCommitCallbacks(execute=True):
+                    mark_doc, created = upload_mark_sheet(self.admin, doc, exam, student)
+                self.assertTrue(created)
+                self.assertEqual(mark_doc.status, MarkSheetDoc.PENDING)
+                self.assertEqual(mark_doc.sgpa, str(sheet_sgpa(expected["rows"][1:]) or 0))
+                saved = marks.values_list("subject__subject_code", "grade", "grade_point", "credit", "credit_point", "status")
+                self.assertEqual(list(saved), expected_marks(expected["rows"]))
+        self.assertEqual(variants, set(VARIANTS))
+
+
+@override_settings(CHANGE_FEED_SETTLE_SECONDS=0, CHANGE_FEED_STREAM_TIMEOUT=0.2, CHANGE_FEED_STREAM_INTERVAL=0.05)
+class ChangeFeedStreamTests(TestCase):
+    """The SSE change feed: the student's own events after the cursor, settled ones only, resumable"""
+
+    def setUp(self):
+        admin = User.objects.create_superuser("admin", "admin@example.com", uuid.uuid4().hex, role=1)
+        self.exam = Exam.objects.create(exam_name="Semester 1", added_by=admin)
+        self.course = Course.objects.create(course_name="BSc Computer Science", added_by=admin)
+        user = User.objects.create_user("student", password=uuid.uuid4().hex, role=3, first_name="Student")
+        self.student = Student.objects.create(user=user, course=self.course, registration_no="REG1", added_by=admin)
+        self.token = create_auth_token(user)
+        self.events = [self.event(self.student.id) for _ in range(3)]
+        # another student's change is not streamed to this one
+        self.event(self.student.id + 1)
+
+    def event(self, student_id):
+        return ChangeEvent.objects.create(
+            kind=ChangeEvent.UPLOADED, course=self.course, student_id=student_id, exam=self.exam, object_id=1,
+        ).id
+
+    def stream(self, **headers):
+        response = Client().get("/api/changes/stream/", HTTP_AUTHORIZATION=f"Token {self.token}", **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        body = b"".join(response.streaming_content).decode()
+        return [int(line.removeprefix("id: ")) for line in body.splitlines() if line.startswith("id: ")]
+
+    def test_streams_changes_after_the_cursor(self):
+        self.assertEqual(self.stream(), self.events)
+        self.assertEqual(self.stream(QUERY_STRING=f"since={self.events[0]}"), self.events[1:])
+
+    def test_reconnect_resumes_from_last_event_id(self):
+        # the browser's Last-Event-ID wins over the since= of the original url
+        headers = {"HTTP_LAST_EVENT_ID": str(self.events[1]), "QUERY_STRING": "since=0"}
+        self.assertEqual(self.stream(**headers), self.events[2:])
+
+    @override_settings(CHANGE_FEED_SETTLE_SECONDS=60)
+    def test_unsettled_changes_wait_for_a_later_poll(self):
+        self.assertEqual(self.stream(), [])
+        ChangeEvent.objects.filter(id__in=self.events[:2]).update(
+            created_time=timezone.now() - datetime.timedelta(minutes=5)
+        )
+        self.assertEqual(self.stream(), self.events[:2])
+
+    def test_unauthenticated(self):
+        self.assertEqual(Client().get("/api/changes/stream/").status_code, 401)
+
+    async def test_asgi_is_not_implemented(self):
+        response = await AsyncClient().get("/api/changes/stream/")
+        self.assertEqual(response.status_code, 501)
+
+
+class ReferenceDataCacheTests(TestCase):
+    """Workers answer reference lookups from their own copy and pick up other workers' edits"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", uuid.uuid4().hex, role=1)
+        self.exam = Exam.objects.create(exam_name="Semester 1", added_by=self.admin)
+        reference_data.invalidate()
+        # the copy of another gunicorn worker
+        self.worker = ReferenceDataCache()
+        self.worker.get_exam(self.exam.id)
+
+    def edit_in_admin(self, exam_name):
+        client = Client()
+        client.force_login(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(
+                f"/admin/main_app/exam/{self.exam.id}/change/",
+                {"exam_name": exam_name, "is_active": "on", "added_by": self.admin.id},
+            )
+        self.assertEqual(response.status_code, 302)
+
+    def test_lookups_need_no_query(self):
+        with self.assertNumQueries(0):
+            for _ in range(5):
+                self.worker.get_exam(self.exam.id)
+            self.worker.active_exams()
+
+    @override_settings(REFERENCE_DATA_CHECK_SECONDS=60)
+    def test_admin_edit_reaches_other_workers(self):
+        self.edit_in_admin("Semester One")
+        # the editing worker reloads right away
+        self.assertEqual(reference_data.get_exam(self.exam.id).exam_name, "Semester One")
+        # the others once they read the shared version again
+        self.assertEqual(self.worker.get_exam(self.exam.id).exam_name, "Semester 1")
+        with override_settings(REFERENCE_DATA_CHECK_SECONDS=0):
+            self.assertEqual(self.worker.get_exam(self.exam.id).exam_name, "Semester One")
+
+    @override_settings(REFERENCE_DATA_CHECK_SECONDS=0)
+    def test_new_exam_reaches_other_workers(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            exam = Exam.objects.create(exam_name="Semester 2", added_by=self.admin)
+        self.assertEqual(self.worker.get_exam(exam.id).exam_name, "Semester 2")
+        self.assertEqual({exam.exam_name for exam in self.worker.active_exams()}, {"Semester 1", "Semester 2"})
+
+
+class CourseFixtureMixin:
+    """An admin, a course with its six semester exams, and helpers for its students and mark sheets"""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", uuid.uuid4().hex, role=1)
+        self.course = Course.objects.create(course_name="BSc Computer Science", added_by=self.admin)
+        self.exams = {
+            semester: Exam.objects.create(exam_name=f"Semester {semester}", added_by=self.admin)
+            for semester in range(1, 7)
+        }
+        reference_data.invalidate()
+
+    def new_student(self, name, course=None):
+        user = User.objects.create_user(name, password=uuid.uuid4().hex, role=3, first_name=name)
+        return Student.objects.create(
+            user=user, course=course or self.course, registration_no=name.upper(), added_by=self.admin
+        )
+
+    def new_mark_sheet(self, student, semester, status=MarkSheetDoc.PENDING, sgpa="7.5"):
+        return MarkSheetDoc.objects.create(
+            student=student, exam=self.exams[semester], status=status, sgpa=sgpa,
+            mark_sheet=f"mark_sheet/{student.id}-{semester}.pdf", added_by=self.admin,
+        )
+
+
+class DashboardTests(CourseFixtureMixin, TestCase):
+    """The faculty dashboard follows mark sheet changes without rebuilding other students' cells"""
+
+    def setUp(self):
+        super().setUp()
+        self.anu = self.new_student("anu")
+        self.binu = self.new_student("binu")
+
+    def statuses(self):
+        return {
+            row["name"]: [cell["status"] for cell in row["exams"][:2]]
+            for row in get_dashboard(self.course.id)
+        }
+
+    def test_live_update(self):
+        self.assertEqual(self.statuses(), {"anu": ["Not Uploaded"] * 2, "binu": ["Not Uploaded"] * 2})
+        # result day: sheets of both students change before the dashboard is read again
+        with self.captureOnCommitCallbacks(execute=True):
+            anu_sheet = self.new_mark_sheet(self.anu, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.new_mark_sheet(self.binu, 2)
+        with mock.patch.object(services, "build_dashboard_cells", wraps=services.build_dashboard_cells) as build:
+            self.assertEqual(self.statuses(), {"anu": ["Pending", "Not Uploaded"], "binu": ["Not Uploaded", "Pending"]})
+        self.assertEqual(sorted(build.call_args.args[0]), sorted([self.anu.id, self.binu.id]))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            set_mark_sheet_status(MarkSheetDoc.objects.filter(id=anu_sheet.id), MarkSheetDoc.APPROVED)
+        with mock.patch.object(services, "build_dashboard_cells", wraps=services.build_dashboard_cells) as build:
+            self.assertEqual(self.statuses(), {"anu": ["Approved", "Not Uploaded"], "binu": ["Not Uploaded", "Pending"]})
+        # only the reviewed student's cells were rebuilt
+        build.assert_called_once_with([self.anu.id])
+
+    def test_rebuild(self):
+        self.new_mark_sheet(self.anu, 1, status=MarkSheetDoc.APPROVED)
+        cached = get_dashboard(self.course.id)
+        cache.clear()
+        self.assertEqual(get_dashboard(self.course.id), cached)
+        # a new student shows up once their course's roster is rebuilt
+        with self.captureOnCommitCallbacks(execute=True):
+            self.new_student("chinnu")
+        self.assertEqual([row["name"] for row in get_dashboard(self.course.id)], ["anu", "binu", "chinnu"])
+
+
+class RankTests(CourseFixtureMixin, TestCase):
+    """Rank snapshots: competition ranks with ties, the same rows on every path, refreshed only when they change"""
+
+    # name: (sgpa, grade point in subject a, grade point in subject b)
+    COHORT = {
+        "anu": ("9.0", 9, 7),
+        "binu": ("8.0", 8, 7),
+        "chinnu": ("8.0", 8, 6),
+        "dinu": ("7.0", 6, 9),
+    }
+
+    def setUp(self):
+        super().setUp()
+        exam = self.exams[1]
+        self.subjects = [
+            Subject.objects.create(subject_name=name, subject_code=name, course=self.course, exam=exam, added_by=self.admin)
+            for name in ("a", "b")
+        ]
+        self.students = {}
+        for name, (sgpa, *grade_points) in self.COHORT.items():
+            student = self.students[name] = self.new_student(name)
+            self.new_mark_sheet(student, 1, status=MarkSheetDoc.APPROVED, sgpa=sgpa)
+            for subject, grade_point in zip(self.subjects, grade_points):
+                Mark.objects.create(
+                    student=student, subject=subject, exam=exam, grade_point=grade_point, added_by=self.admin
+                )
+        # pending and rejected sheets are not ranked
+        self.new_mark_sheet(self.new_student("pending"), 1, sgpa="10.0")
+        self.new_mark_sheet(self.new_student("rejected"), 1, status=MarkSheetDoc.REJECTED, sgpa="10.0")
+
+    def rows(self):
+        sheet_rows, mark_rows = services.cohort_rank_rows(self.course.id, self.exams[1].id, "default")
+        return sorted(
+            (row["student_id"], row.get("subject_id") or 0, row["score"], row["rank"], row["cohort_size"])
+            for row in sheet_rows + mark_rows
+        )
+
+    def snapshot(self, subject=None):
+        snapshots = RankSnapshot.objects.filter(exam=self.exams[1], subject=subject).select_related("student__user")
+        return {snapshot.student.user.username: (snapshot.rank, snapshot.percentile) for snapshot in snapshots}
+
+    def test_ties_and_percentiles(self):
+        services.refresh_ranks(self.course.id, self.exams[1].id)
+        self.assertEqual(self.snapshot(), {"anu": (1, 100), "binu": (2, 75), "chinnu": (2, 75), "dinu": (4, 25)})
+        self.assertEqual(
+            self.snapshot(self.subjects[1]), {"dinu": (1, 100), "anu": (2, 75), "binu": (2, 75), "chinnu": (4, 25)}
+        )
+
+    def test_window_and_in_memory_ranks_match(self):
+        self.assertTrue(connection.features.supports_over_clause)
+        window = self.rows()
+        with mock.patch.object(connection.features, "supports_over_clause", False):
+            self.assertEqual(self.rows(), window)
+
+    def test_archived_marks_keep_their_ranks(self):
+        window = self.rows()
+        archive_marks("default", [self.students["binu"].id, self.students["dinu"].id])
+        # archived marks are ranked in memory, together with the hot ones
+        self.assertEqual(self.rows(), window)
+
+    def test_edits_refresh_only_when_ranked(self):
+        pending = MarkSheetDoc.objects.get(student__user__username="pending")
+        with mock.patch.object(services, "cohort_rank_rows", wraps=services.cohort_rank_rows) as rank:
+            with self.captureOnCommitCallbacks(execute=True):
+                pending.sgpa = "9.5"
+                pending.save()
+                set_mark_sheet_status(MarkSheetDoc.objects.filter(student__user__username="rejected"), MarkSheetDoc.PENDING)
+            self.assertFalse(rank.called)
+
+            # a mark edit of an approved sheet re-ranks its subject only
+            mark = Mark.objects.get(student=self.students["dinu"], subject=self.subjects[0])
+            with self.captureOnCommitCallbacks(execute=True):
+                mark.grade_point = 10
+                mark.save()
+            rank.assert_called_once_with(self.course.id, self.exams[1].id, "default", self.subjects[0].id)
+        self.assertEqual(self.snapshot(self.subjects[0])["dinu"], (1, 100))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            set_mark_sheet_status(MarkSheetDoc.objects.filter(student__user__username="pending"), MarkSheetDoc.APPROVED)
+        self.assertEqual(self.snapshot()["pending"], (1, 100))
+
+
+@override_settings(BULK_ONBOARD_MAX_ROWS=3)
+class StudentBulkCreateTests(CourseFixtureMixin, TestCase):
+    """Bulk onboarding through the endpoint, capped so the hashing fits in a request"""
+
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create_user("faculty", password=uuid.uuid4().hex, role=2, first_name="Faculty")
+        Faculty.objects.create(user=user, course=self.course, added_by=self.admin)
+        self.token = create_auth_token(user)
+
+    def onboard(self, count):
+        students = [{"username": f"s{i}", "name": f"Student {i}", "registration_no": f"REG{i}"} for i in range(count)]
+        return Client().post(
+            "/api/create/student/bulk/", {"students": students},
+            content_type="application/json", HTTP_AUTHORIZATION=f"Token {self.token}",
+        )
+
+    def test_onboards_up_to_the_limit(self):
+        response = self.onboard(3)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {"created": 3, "failed": 0, "errors": []})
+        self.assertEqual(Student.active_objects.filter(course=self.course).count(), 3)
+
+    def test_larger_files_go_to_the_command(self):
+        response = self.onboard(4)
+        self.assertEqual(response.status_code, 404)
+        self.assertIn("manage.py onboard_students", response.json()[0])
+        self.assertFalse(Student.objects.exists())
+
+
+class GradeCardUploadTests(TemporaryMediaMixin, CourseFixtureMixin, TestCase):
+    """Consolidated grade cards: every semester imported from one stored pdf, or none of them"""
+
+    def setUp(self):
+        super().setUp()
+        self.student = self.new_student("anu")
+
+    def upload(self, pdf, idempotency_key=None):
+        doc = SimpleUploadedFile("card.pdf", pdf, content_type="application/pdf")
+        with self.captureOnCommitCallbacks(execute=True):
+            return upload_consolidated_mark_sheet(self.student.user, doc, self.student, idempotency_key)
+
+    def assert_imported(self, expected):
+        for semester, rows in expected.items():
+            exam = self.exams[semester]
+            mark_doc = MarkSheetDoc.active_objects.get(student=self.student, exam=exam)
+            self.assertEqual(mark_doc.status, MarkSheetDoc.PENDING)
+            self.assertEqual(mark_doc.sgpa, str(sheet_sgpa(rows[1:]) or 0))
+            saved = (
+                Mark.active_objects.filter(student=self.student, exam=exam).order_by("id")
+                .values_list("subject__subject_code", "grade", "grade_point", "credit", "credit_point", "status")
+            )
+            self.assertEqual(list(saved), expected_marks(rows))
+
+    def test_table_split_across_pages(self):
+        # semester 3's table runs over onto the second page
+        pdf, expected = make_grade_card([1, 2, 3], subjects=7, seed=3)
+        with pdfplumber.open(io.BytesIO(pdf)) as card:
+            self.assertEqual(len(card.pages), 2)
+            semester, region = next(page_regions(card.pages[1]))
+            self.assertIsNone(semester)
+            self.assertTrue(extract_marks_table(region))
+        mark_docs, skipped, created = self.upload(pdf)
+        self.assertTrue(created)
+        self.assertEqual(skipped, [])
+        self.assert_imported(expected)
+
+    def test_semester_with_failed_subjects(self):
+        pdf, expected = make_grade_card([4, 5], subjects=6, failed=2, seed=4)
+        self.upload(pdf)
+        self.assertTrue(any(row[-1] == "Failed" for rows in expected.values() for row in rows))
+        self.assert_imported(expected)
+
+    def test_duplicate_semester_is_rejected(self):
+        pdf, expected = make_grade_card([5, 5], seed=2)
+        with self.assertRaisesMessage(InvalidDocumentError, "Semester 5 appears twice in the grade card"):
+            self.upload(pdf)
+        self.assertFalse(MarkSheetDoc.active_objects.filter(student=self.student).exists())
+        self.assertFalse(Mark.objects.filter(student=self.student).exists())
+
+    def test_replay_and_duplicate(self):
+        pdf, expected = make_grade_card([1, 2], seed=5)
+        mark_docs, skipped, created = self.upload(pdf, "key-1")
+        # a retry with the same key gets the same sheets back, without importing again
+        replayed, skipped, created = self.upload(pdf, "key-1")
+        self.assertFalse(created)
+        self.assertEqual(sorted(mark_doc.id for mark_doc in replayed), sorted(mark_doc.id for mark_doc in mark_docs))
+        self.assertEqual(Mark.objects.filter(student=self.student).count(), sum(len(rows) - 1 for rows in expected.values()))
+        with self.assertRaises(DuplicateUploadError):
+            self.upload(pdf)
+
+        # a later card imports only its new semesters
+        pdf, expected = make_grade_card([2, 3], seed=6)
+        mark_docs, skipped, created = self.upload(pdf)
+        self.assertEqual(skipped, [self.exams[2]])
+        self.assertEqual([mark_doc.exam for mark_doc in mark_docs], [self.exams[3]])
+
+    def test_one_stored_pdf(self):
+        pdf, expected = make_grade_card([1, 2, 3], seed=7)
+        mark_docs, skipped, created = self.upload(pdf)
+        self.assertEqual(len(mark_docs), 3)
+        names = {mark_doc.mark_sheet.name for mark_doc in MarkSheetDoc.active_objects.filter(student=self.student)}
+        self.assertEqual(len(names), 1)
+        stored = [name for root, dirs, files in os.walk(settings.MEDIA_ROOT) for name in files]
+        self.assertEqual(stored, ["card.pdf"])
+
+
+@override_settings(MARK_ARCHIVE_AFTER_YEARS=2, FINAL_SEMESTER_EXAM="Semester 6")
+class ArchiveTests(CourseFixtureMixin, TestCase):
+    """Graduated students' marks move to the archive and keep showing up in their views, dead tokens move too"""
+
+    def setUp(self):
+        super().setUp()
+        self.subject = Subject.objects.create(
+            subject_name="Compiler Design", subject_code="CSC6B01", course=self.course, exam=self.exams[6],
+            added_by=self.admin,
+        )
+        self.long_ago = timezone.now() - datetime.timedelta(days=3 * 365)
+        # graduated: final semester approved years ago
+        self.graduate = self.student_with_final_sheet("anu", MarkSheetDoc.APPROVED, self.long_ago)
+        # final semester still under review, or approved this year
+        self.student_with_final_sheet("binu", MarkSheetDoc.PENDING, self.long_ago)
+        self.student_with_final_sheet("chinnu", MarkSheetDoc.APPROVED, timezone.now())
+        # dropped out after semester 4, old marks but no final semester
+        dropout = self.new_student("dinu")
+        self.new_mark_sheet(dropout, 4, status=MarkSheetDoc.APPROVED)
+        Mark.objects.filter(student=dropout).update(created_time=self.long_ago)
+        MarkSheetDoc.objects.filter(student=dropout).update(created_time=self.long_ago)
+
+    def student_with_final_sheet(self, name, sheet_status, uploaded):
+        student = self.new_student(name)
+        mark_doc = self.new_mark_sheet(student, 6, status=sheet_status)
+        Mark.objects.create(
+            student=student, subject=self.subject, exam=self.exams[6], grade="A", grade_point=8, credit=4,
+            credit_point=32, status="Passed", added_by=self.admin,
+        )
+        MarkSheetDoc.objects.filter(id=mark_doc.id).update(created_time=uploaded)
+        Mark.objects.filter(student=student).update(created_time=uploaded)
+        return student
+
+    def test_graduated_students(self):
+        self.assertEqual(graduated_students("default"), [self.graduate.id])
+
+    def test_archived_marks_round_trip(self):
+        token = create_auth_token(self.graduate.user)
+        client = Client(HTTP_AUTHORIZATION=f"Token {token}")
+
+        def views():
+            cache.clear()
+            marks = client.get("/api/marks/view/", {"exam": self.exams[6].id})
+            subject = client.get("/api/subject/result/", {"subject": self.subject.id})
+            self.assertEqual((marks.status_code, subject.status_code), (200, 200))
+            subject = subject.json()
+            # archived rows come after the hot ones
+            subject["marks"].sort(key=lambda mark: mark["student__user__first_name"])
+            return marks.json(), subject
+
+        before = views()
+        self.assertEqual(len(before[0]["mark_list"]), 1)
+        self.assertEqual(len(before[1]["marks"]), 3)
+        hot = list(Mark.objects.filter(student=self.graduate).values())
+
+        call_command("archive_history", "--database", "default", "--skip-tokens", stdout=io.StringIO())
+        self.assertFalse(Mark.objects.filter(student=self.graduate).exists())
+        self.assertEqual(Mark.objects.count(), 2)
+        archived = list(ArchivedMark.objects.filter(student=self.graduate).values())
+        self.assertEqual([{**row, "archived_time": None} for row in archived], [{**row, "archived_time": None} for row in hot])
+        self.assertEqual(views(), before)
+
+        # a second run finds nobody left to archive
+        self.assertEqual(graduated_students("default"), [])
+
+    def test_archive_tokens(self):
+        user = self.graduate.user
+        for _ in range(3):
+            create_auth_token(user)
+        UserAuthToken.objects.create(user=user, key="revoked", is_active=False, added_by=user)
+        UserAuthToken.objects.update(created_time=self.long_ago)
+        stale = set(UserAuthToken.objects.values_list("id", flat=True))
+        # expires the last old token; the new one is expired in turn, but too recently to archive
+        create_auth_token(user)
+        create_auth_token(user)
+        kept = set(UserAuthToken.objects.values_list("id", flat=True)) - stale
+
+        self.assertEqual(archive_tokens(batch_size=3), 4)
+        self.assertEqual(set(ArchivedUserAuthToken.objects.values_list("id", flat=True)), stale)
+        self.assertEqual(set(UserAuthToken.objects.values_list("id", flat=True)), kept)
+        self.assertEqual(UserAuthToken.objects.filter(is_expired=True).count(), 1)
+
+
+class ServeFileTests(SimpleTestCase):
+    """Streaming stored files with ETags and single byte ranges"""
+
+    content = bytes(range(256)) * 4
+
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        self.storage = FileSystemStorage(location=location)
+        self.name = self.storage.save("sheet.pdf", ContentFile(self.content))
+
+    def serve(self, **headers):
+        request = RequestFactory().get("/", **headers)
+        response = serve_file(request, self.storage, self.name, "application/pdf")
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range("bytes=0-99", 1024), (0, 99))
+        self.assertEqual(parse_range("bytes=1000-", 1024), (1000, 1023))
+        self.assertEqual(parse_range("bytes=1000-5000", 1024), (1000, 1023))
+        self.assertEqual(parse_range("bytes=-24", 1024), (1000, 1023))
+        self.assertEqual(parse_range("bytes=-5000", 1024), (0, 1023))
+        # not a single byte range: the whole file
+        for header in ("bytes=-", "bytes=0-1,5-6", "items=0-1"):
+            self.assertIsNone(parse_range(header, 1024))
+        for header in ("bytes=1024-", "bytes=5-4", "bytes=-0"):
+            with self.assertRaises(ValueError):
+                parse_range(header, 1024)
+
+    def test_whole_file(self):
+        response, body = self.serve()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertTrue(response["ETag"])
+
+    def test_ranges(self):
+        response, body = self.serve(HTTP_RANGE="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.content[10:20])
+        self.assertEqual(response["Content-Range"], "bytes 10-19/1024")
+        self.assertEqual(response["Content-Length"], "10")
+
+        response, body = self.serve(HTTP_RANGE="bytes=-100")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.content[-100:])
+        self.assertEqual(response["Content-Range"], "bytes 924-1023/1024")
+
+        response, body = self.serve(HTTP_RANGE="bytes=2048-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */1024")
+
+    def test_if_range(self):
+        etag = self.serve()[0]["ETag"]
+        response, body = self.serve(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=etag)
+        self.assertEqual((response.status_code, body), (206, self.content[:10]))
+        # the client's copy is stale: the whole current file instead of a range of it
+        response, body = self.serve(HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"0-0"')
+        self.assertEqual((response.status_code, body), (200, self.content))
+
+    def test_if_none_match(self):
+        etag = self.serve()[0]["ETag"]
+        for header in (etag, f'"0-0", W/{etag}', "*"):
+            with self.subTest(header):
+                response, body = self.serve(HTTP_IF_NONE_MATCH=header)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response["ETag"], etag)
+                self.assertEqual(body, b"")
+        response, body = self.serve(HTTP_IF_NONE_MATCH='"0-0"')
+        self.assertEqual((response.status_code, body), (200, self.content))
+
+    @override_settings(MEDIA_SENDFILE="nginx", MEDIA_SENDFILE_PREFIX="/protected/")
+    def test_sendfile(self):
+        response, body = self.serve()
+        self.assertEqual(response["X-Accel-Redirect"], "/protected/" + self.name)
+        self.assertEqual(body, b"")
+
+
+class MarkSheetStorageTests(TemporaryMediaMixin, CourseFixtureMixin, TestCase):
+    """Sheets moved to the archive tier or compressed read back, and serve, as they were uploaded"""
+
+    content = b"%PDF-1.4 " + bytes(range(256)) * 8
+
+    def setUp(self):
+        super().setUp()
+        self.student = self.new_student("anu")
+        self.mark_doc = MarkSheetDoc(student=self.student, exam=self.exams[1], added_by=self.admin)
+        self.mark_doc.mark_sheet.save("sheet.pdf", ContentFile(self.content))
+        self.storage = self.mark_doc.mark_sheet.storage
+        self.storage.save(preview_name(self.mark_doc), ContentFile(b"preview"))
+        self.token = create_auth_token(self.student.user)
+
+    def move(self, new_name):
+        old_name = self.mark_doc.mark_sheet.name
+        old_preview = preview_name(self.mark_doc)
+        new_name = move_mark_sheet(self.mark_doc, new_name)
+        self.assertEqual(self.mark_doc.mark_sheet.name, new_name)
+        self.assertEqual(MarkSheetDoc.objects.get(id=self.mark_doc.id).mark_sheet.name, new_name)
+        self.assertFalse(self.storage.exists(old_name))
+        self.assertFalse(self.storage.exists(old_preview))
+        with self.storage.open(preview_name(self.mark_doc)) as preview:
+            self.assertEqual(preview.read(), b"preview")
+        return new_name
+
+    def assert_reads_back(self):
+        name = self.mark_doc.mark_sheet.name
+        self.assertEqual(self.storage.size(name), len(self.content))
+        with self.storage.open(name) as file:
+            self.assertEqual(file.read(), self.content)
+        client = Client(HTTP_AUTHORIZATION=f"Token {self.token}")
+        response = client.get("/api/marksheet/file/", {"marksheet": self.mark_doc.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        response = client.get("/api/marksheet/file/", {"marksheet": self.mark_doc.id}, HTTP_RANGE="bytes=-16")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), self.content[-16:])
+
+    def test_compressed(self):
+        name = self.move(self.mark_doc.mark_sheet.name + ".gz")
+        self.assertTrue(name.endswith(".pdf.gz"))
+        with open(os.path.join(settings.MEDIA_ROOT, name), "rb") as raw:
+            self.assertEqual(raw.read(2), b"\x1f\x8b")
+        self.assert_reads_back()
+
+    def test_archive_tier(self):
+        hot_name = self.mark_doc.mark_sheet.name
+        name = self.move(ARCHIVE_PREFIX + hot_name)
+        self.assertTrue(os.path.exists(os.path.join(self.archive_root, hot_name)))
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, hot_name)))
+        self.assert_reads_back()
+
+        # compressed in the archive, streamed by Django even with a sendfile front server
+        self.move(name + ".gz")
+        with override_settings(MEDIA_SENDFILE="nginx"):
+            self.assert_reads_back()
+
+
+@override_settings(
+    DATABASE_SHARDS=["college_a"],
+    COURSE_SHARDS={5: "college_a"},
+    DATABASE_REPLICAS={"default": "replica", "college_a": "college_a_replica"},
+    REPLICA_STICKY_SECONDS=10,
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class RouterTestCase(SimpleTestCase):
+    """Router decisions from settings and the request's routing state, no database involved"""
+
+    cache_entry = SimpleNamespace(_meta=SimpleNamespace(app_label="django_cache", model_name="cacheentry"))
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        reset_routing()
+        self.addCleanup(reset_routing)
+        self.addCleanup(cache.clear)
+
+    def loaded(self, instance, alias):
+        instance._state.db = alias
+        return instance
+
+    def login(self, user_id):
+        """Start a request for a (non faculty, non student) user, who stays on default"""
+        reset_routing()
+        activate_user_routing(SimpleNamespace(id=user_id, role=1))
+
+
+class CourseShardRouterTests(RouterTestCase):
+    """Sharded rows go to their course's database, everything else stays on default"""
+
+    def test_shard_by_course(self):
+        self.assertEqual(shard_for_course(5), "college_a")
+        self.assertEqual(shard_for_course(6), "default")
+        self.assertEqual(self.router.db_for_write(Student, instance=Student(course_id=5)), "college_a")
+        self.assertEqual(self.router.db_for_write(Student, instance=Student(course_id=6)), "default")
+        # rows stay where they were loaded from
+        self.assertEqual(self.router.db_for_write(Mark, instance=self.loaded(Mark(), "college_a")), "college_a")
+
+    def test_active_shard(self):
+        self.assertEqual(self.router.db_for_read(Mark), "default")
+        activate_shard("college_a")
+        self.assertEqual(self.router.db_for_read(Mark), "college_a")
+        self.assertEqual(self.router.db_for_write(MarkSheetDoc), "college_a")
+        # users, tokens and reference data never leave default
+        for model in (User, UserAuthToken, Exam, Course):
+            self.assertEqual(self.router.db_for_read(model), "default")
+            self.assertEqual(self.router.db_for_write(model, instance=self.loaded(Student(), "college_a")), "default")
+
+    def test_relations_and_migrations(self):
+        student = self.loaded(Student(), "college_a")
+        self.assertTrue(self.router.allow_relation(self.loaded(Mark(), "college_a_replica"), student))
+        self.assertFalse(self.router.allow_relation(self.loaded(Mark(), "default"), student))
+        self.assertTrue(self.router.allow_relation(self.loaded(User(), "default"), student))
+        self.assertTrue(self.router.allow_migrate("college_a", "main_app", "mark"))
+        self.assertTrue(self.router.allow_migrate("college_a_replica", "main_app", "mark"))
+        self.assertFalse(self.router.allow_migrate("college_a", "main_app", "user"))
+        self.assertTrue(self.router.allow_migrate("replica", "main_app", "user"))
+
+
+class ReplicaRouterTests(RouterTestCase):
+    """Read-only requests read from the replicas, except for users who just wrote"""
+
+    def test_replica_reads(self):
+        self.login(1)
+        self.assertEqual(self.router.db_for_read(Mark), "default")
+        use_replica_reads()
+        self.assertEqual(self.router.db_for_read(Mark), "replica")
+        activate_shard("college_a")
+        self.assertEqual(self.router.db_for_read(Mark), "college_a_replica")
+        self.assertEqual(self.router.db_for_read(User), "replica")
+        # the cache table and rows loaded from a replica are written to the primary
+        self.assertEqual(self.router.db_for_read(self.cache_entry), "default")
+        self.assertEqual(self.router.db_for_write(Mark, instance=self.loaded(Mark(), "college_a_replica")), "college_a")
+
+    def test_read_your_writes(self):
+        self.login(1)
+        use_replica_reads()
+        # caching a payload does not pin the user to the primary
+        self.router.db_for_write(self.cache_entry)
+        self.assertEqual(self.router.db_for_read(Mark), "replica")
+        self.router.db_for_write(Mark)
+        self.assertEqual(self.router.db_for_read(Mark), "default")
+
+        # the next requests of the writer read from the primary until the replica caught up
+        self.login(1)
+        use_replica_reads()
+        self.assertEqual(self.router.db_for_read(Mark), "default")
+        self.login(2)
+        use_replica_reads()
+        self.assertEqual(self.router.db_for_read(Mark), "replica")
+
+        cache.clear()
+        self.login(1)
+        use_replica_reads()
+        self.assertEqual(self.router.db_for_read(Mark), "replica")
+
+    def test_replica_reads_outside_requests(self):
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Mark), "replica")
+        self.assertEqual(self.router.db_for_read(Mark), "default")
+        with override_settings(DATABASE_REPLICAS={}), replica_reads():
+            self.assertEqual(self.router.db_for_read(Mark), "default")
+
+
+class DeactivateStudentTests(CourseFixtureMixin, TestCase):
+    """Soft deleting a student deactivates everything of theirs, and only theirs"""
+
+    def setUp(self):
+        super().setUp()
+        exam = self.exams[1]
+        subject = Subject.objects.create(subject_name="a", subject_code="a", course=self.course, exam=exam, added_by=self.admin)
+        self.students = [self.new_student(name) for name in ("anu", "binu", "chinnu")]
+        for grade_point, student in zip((9, 8, 7), self.students):
+            self.new_mark_sheet(student, 1, status=MarkSheetDoc.APPROVED, sgpa=str(grade_point))
+            Mark.objects.create(student=student, subject=subject, exam=exam, grade_point=grade_point, added_by=self.admin)
+            create_auth_token(student.user)
+        # archived marks of an earlier exam
+        self.new_mark_sheet(self.students[0], 2, status=MarkSheetDoc.APPROVED)
+        Mark.objects.create(student=self.students[0], subject=subject, exam=self.exams[2], grade_point=5, added_by=self.admin)
+        archive_marks("default", [self.students[0].id])
+        services.refresh_ranks(self.course.id, exam.id)
+
+    def test_cascade(self):
+        anu, binu, chinnu = self.students
+        with self.captureOnCommitCallbacks(execute=True):
+            deactivate_student(anu)
+
+        anu.refresh_from_db()
+        anu.user.refresh_from_db()
+        self.assertFalse(anu.is_active)
+        self.assertFalse(anu.user.is_active)
+        for model in (Mark, ArchivedMark, MarkSheetDoc):
+            self.assertFalse(model.active_objects.filter(student=anu).exists(), model.__name__)
+        self.assertFalse(UserAuthToken.active_objects.filter(user=anu.user).exists())
+        # the cohort is re-ranked without anu
+        self.assertFalse(RankSnapshot.objects.filter(student=anu).exists())
+        ranks = RankSnapshot.objects.filter(exam=self.exams[1], subject=None).order_by("rank")
+        self.assertEqual([(snapshot.student_id, snapshot.rank, snapshot.cohort_size) for snapshot in ranks], [
+            (binu.id, 1, 2), (chinnu.id, 2, 2),
+        ])
+
+        for student in (binu, chinnu):
+            student.refresh_from_db()
+            self.assertTrue(student.is_active)
+            self.assertTrue(User.objects.get(id=student.user_id).is_active)
+            for model in (Mark, MarkSheetDoc):
+                self.assertEqual(model.active_objects.filter(student=student).count(), 1, model.__name__)
+            self.assertTrue(UserAuthToken.active_objects.filter(user=student.user).exists())
+
+
+class PayloadCacheTests(CourseFixtureMixin, TestCase):
+    """Cached login and result payloads follow the edits and reviews behind them"""
+
+    def setUp(self):
+        super().setUp()
+        self.subject = Subject.objects.create(
+            subject_name="a", subject_code="a", course=self.course, exam=self.exams[1], added_by=self.admin
+        )
+        self.student = self.new_student("anu")
+        self.mark_sheet = self.new_mark_sheet(self.student, 1, sgpa="8.0")
+        self.mark = Mark.objects.create(
+            student=self.student, subject=self.subject, exam=self.exams[1], grade="A", grade_point=8, credit=4,
+            credit_point=32, status="Passed", added_by=self.admin,
+        )
+        faculty = User.objects.create_user("faculty", password=uuid.uuid4().hex, role=2, first_name="Faculty")
+        Faculty.objects.create(user=faculty, course=self.course, added_by=self.admin)
+        self.as_student = Client(HTTP_AUTHORIZATION=f"Token {create_auth_token(self.student.user)}")
+        self.as_faculty = Client(HTTP_AUTHORIZATION=f"Token {create_auth_token(faculty)}")
+
+    def request(self, client, method, path, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(client, method)(path, data)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def results(self):
+        """What the student and faculty see of the sheet: marks view, dashboard and ranks"""
+        marks = self.request(self.as_student, "get", "/api/marks/view/", {"exam": self.exams[1].id})
+        dashboard = self.request(self.as_faculty, "get", "/api/dashboard/", {})
+        ranks = self.request(self.as_student, "get", "/api/rank/", {"exam": self.exams[1].id})
+        return (
+            marks["status"], [mark["grade"] for mark in marks["mark_list"]],
+            dashboard[0]["exams"][0]["status"],
+            ranks["sgpa"] and ranks["sgpa"]["rank"], [subject["score"] for subject in ranks["subjects"]],
+        )
+
+    def test_login_payload(self):
+        self.assertEqual(self.request(self.as_student, "get", "/api/login/data/", {})["course"], "BSc Computer Science")
+        self.assertIsNotNone(cache.get(services.login_payload_key(self.student.user_id)))
+        with self.captureOnCommitCallbacks(execute=True):
+            other = Course.objects.create(course_name="BSc Physics", added_by=self.admin)
+            self.student.course = other
+            self.student.save()
+        self.assertEqual(self.request(self.as_student, "get", "/api/login/data/", {})["course"], "BSc Physics")
+        with self.captureOnCommitCallbacks(execute=True):
+            other.course_name = "BSc Physics (Honours)"
+            other.save()
+        self.assertEqual(self.request(self.as_student, "get", "/api/login/data/", {})["course"], "BSc Physics (Honours)")
+
+    def test_review_and_edit(self):
+        self.assertEqual(self.results(), ("Pending", ["A"], "Pending", None, []))
+
+        self.request(self.as_faculty, "post", "/api/marksheet/status/", {"marksheet": self.mark_sheet.id, "status": "Approve"})
+        self.assertEqual(self.results(), ("Approved", ["A"], "Approved", 1, [8.0]))
+
+        # the student corrects a mark and sends the sheet back for review, it leaves the cohort
+        self.request(self.as_student, "post", "/api/mark/edit/", {
+            "id": self.mark.id, "grade": "A+", "grade_point": 9, "credit": 4, "credit_point": 36,
+        })
+        self.assertEqual(self.results(), ("Approved", ["A+"], "Approved", 1, [9.0]))
+        self.request(self.as_student, "post", "/api/mark/confirm/", {"id": self.mark_sheet.id})
+        self.assertEqual(self.results(), ("Pending", ["A+"], "Pending", None, []))
+
+
+class ErrorHandlingTests(CourseFixtureMixin, TestCase):
+    """Expected errors become a message, unexpected ones a generic 500 logged with their traceback"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = Client(HTTP_AUTHORIZATION=f"Token {create_auth_token(self.new_student('anu').user)}")
+        errors.start_error_logging()
+        self.log = io.StringIO()
+        stream_handler = errors._listener.handlers[0]
+        stderr = stream_handler.setStream(self.log)
+        self.addCleanup(stream_handler.setStream, stderr)
+        self.counts = Counter(errors.error_stats()["errors"])
+
+    def logged(self, timeout=5):
+        """Log output, once the listener thread wrote something"""
+        deadline = time.monotonic() + timeout
+        while not self.log.getvalue() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.log.getvalue()
+
+    def new_errors(self):
+        return Counter(errors.error_stats()["errors"]) - self.counts
+
+    def test_expected_errors(self):
+        self.assertEqual(errors.error_messages(InvalidDocumentError("Invalid pdf")), ["Invalid pdf"])
+        self.assertEqual(errors.error_messages(ValidationError(["a", "b"])), ["a", "b"])
+        self.assertEqual(errors.error_messages(Mark.DoesNotExist()), ["Something went wrong."])
+        # a view leaving the error to the exception handler
+        response = self.client.post("/api/mark/edit/", {"id": 0})
+        self.assertEqual((response.status_code, response.json()), (404, ["Something went wrong."]))
+        self.assertEqual(self.new_errors(), Counter({
+            "InvalidDocumentError": 1, "ValidationError": 1, "DoesNotExist": 2,
+        }))
+        time.sleep(0.1)
+        self.assertEqual(self.log.getvalue(), "")
+
+    def test_unexpected_error(self):
+        with mock.patch("main_app.views.login_payload", side_effect=RuntimeError("boom")):
+            response = self.client.get("/api/login/data/")
+        self.assertEqual((response.status_code, response.json()), (500, ["Something went wrong."]))
+        self.assertEqual(self.new_errors(), Counter({"RuntimeError": 1}))
+        logged = self.logged()
+        self.assertIn("ERROR main_app.errors: Unhandled RuntimeError: boom", logged)
+        self.assertIn("Traceback (most recent call last):", logged)
+
+    def test_api_exceptions_keep_their_response(self):
+        # DRF's own errors, eg: a rejected token, keep DRF's response
+        response = Client().get("/api/login/data/", HTTP_AUTHORIZATION="Token nope")
+        self.assertEqual((response.status_code, response.json()), (400, ["Invalid token."]))
+        self.assertEqual(self.new_errors(), Counter({"ValidationError": 1}))
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    """orjson output reads back the same as DRF's JSONRenderer, datetimes included"""
+
+    data = {
+        "marks": [{"id": 1, "grade": "A+", "grade_point": 9, "subject_name": "Malayalam \u0d05"}],
+        "created_time": datetime.datetime(2024, 3, 1, 10, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+        "sgpa": Decimal("8.25"),
+        "exams": {3: "Semester 3"},
+        "sheet": None,
+    }
+
+    @unittest.skipUnless(orjson, "orjson is not installed")
+    def test_same_as_drf(self):
+        fast = FastJSONRenderer().render(self.data)
+        self.assertEqual(json.loads(fast), json.loads(JSONRenderer().render(self.data)))
+        # DRF's "Z" suffix, not orjson's own "+00:00"
+        self.assertIn(b'"created_time":"2024-03-01T10:30:15.123456Z"', fast)
+
+    def test_empty_and_indented(self):
+        self.assertEqual(FastJSONRenderer().render(None), b"")
+        # the browsable API asks for indentation, DRF's renderer provides it
+        indented = FastJSONRenderer().render(self.data, "application/json; indent=2")
+        self.assertEqual(indented, JSONRenderer().render(self.data, "application/json; indent=2"))
+
+
+@override_settings(COMPRESSION_MIN_SIZE=1024)
+class CompressionMiddlewareTests(SimpleTestCase):
+    """Large JSON/text responses are compressed as negotiated, the rest left alone"""
+
+    payload = {"marks": [{"id": i, "grade": "A", "subject_name": "Subject number"} for i in range(200)]}
+
+    def respond(self, response, accept_encoding=None):
+        headers = {"HTTP_ACCEPT_ENCODING": accept_encoding} if accept_encoding is not None else {}
+        request = RequestFactory().get("/", **headers)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def large(self):
+        response = JsonResponse(self.payload)
+        response["ETag"] = '"abc"'
+        return response
+
+    def test_gzip(self):
+        plain = self.large().content
+        response = self.respond(self.large(), "gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertEqual(response["Content-Length"], str(len(response.content)))
+        self.assertEqual(gzip.decompress(response.content), plain)
+        self.assertEqual(response["ETag"], 'W/"abc"')
+
+    @unittest.skipUnless(brotli, "brotli is not installed")
+    def test_brotli_preferred(self):
+        response = self.respond(self.large(), "gzip, deflate, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(response.content), self.large().content)
+
+    def test_not_accepted(self):
+        for accept_encoding in (None, "identity", "gzip;q=0, br;q=0"):
+            with self.subTest(accept_encoding):
+                response = self.respond(self.large(), accept_encoding)
+                self.assertFalse(response.has_header("Content-Encoding"))
+                # caches still have to keep the encodings apart
+                self.assertEqual(response["Vary"], "Accept-Encoding")
+                self.assertEqual(response["ETag"], '"abc"')
+
+    def test_left_alone(self):
+        small = JsonResponse({"grade": "A"})
+        pdf = HttpResponse(b"%PDF" * 1000, content_type="application/pdf")
+        stream = StreamingHttpResponse(iter([b"data: {}\n\n" * 200]), content_type="text/event-stream")
+        for response in (small, pdf, stream):
+            with self.subTest(response["Content-Type"]):
+                response = self.respond(response, "gzip, br")
+                self.assertFalse(response.has_header("Content-Encoding"))
+                self.assertFalse(response.has_header("Vary"))
+
+    def test_min_size(self):
+        body = {"grades": "A" * 500}
+        self.assertFalse(self.respond(JsonResponse(body), "gzip").has_header("Content-Encoding"))
+        with self.settings(COMPRESSION_MIN_SIZE=100):
+            self.assertEqual(self.respond(JsonResponse(body), "gzip")["Content-Encoding"], "gzip")
@@ -4,17 +4,27 @@ from .views import (
     LoginDataView,
     ChangePasswordView,
     StudentCreateViewFaculty,
+    StudentBulkCreateViewFaculty,
     ExamDropdownViewStudent,
     SubjectDropdownViewStudent,
     StudentDropdownViewFaculty,
     MarkSheetFileUploadViewStudent,
+    ConsolidatedMarkSheetUploadViewStudent,
     ViewMarkSheetView,
+    MarkSheetFileView,
+    MarkSheetPreviewView,
     ApproveMarklistView,
     StudentDetailView,
     SubjectWiseResultView,
     MarkSheetEditView,
     ConfirmMarkChangesView,
     StudentDeleteView,
+    ChangeFeedView,
+    FacultyDashboardView,
+    RankView,
+    change_feed_stream,
+    ErrorStatsView,
+    UploadTraceView,
 )
 
 urlpatterns = [
@@ -23,19 +33,29 @@ urlpatterns = [
     path("login/data/", LoginDataView.as_view(), name="login_data"),
     path("change/password/", ChangePasswordView.as_view(), name="change_password"),
     path("marks/view/", ViewMarkSheetView.as_view(), name="marks_list"),
+    path("marksheet/file/", MarkSheetFileView.as_view(), name="marksheet_file"),
+    path("marksheet/preview/", MarkSheetPreviewView.as_view(), name="marksheet_preview"),
     path("dropdown/exam/", ExamDropdownViewStudent.as_view(), name="exam_dropdown"), # semester list
+    path("changes/", ChangeFeedView.as_view(), name="change_feed"),
+    path("errors/stats/", ErrorStatsView.as_view(), name="error_stats"), # admin
+    path("profiles/", UploadTraceView.as_view(), name="upload_traces"), # admin
+    path("changes/stream/", change_feed_stream, name="change_feed_stream"), # SSE
 
     # for faculty
     path("create/student/", StudentCreateViewFaculty.as_view(), name="create_student"),
+    path("create/student/bulk/", StudentBulkCreateViewFaculty.as_view(), name="create_student_bulk"),
     path("list/student/", StudentDropdownViewFaculty.as_view(), name="list_student"),
     path("marksheet/status/", ApproveMarklistView.as_view(), name="approve_marklist"),
     path("student/view/", StudentDetailView.as_view(), name="student_view"),
     path("dropdown/subject/", SubjectDropdownViewStudent.as_view(), name="subject_dropdown"),
     path("subject/result/", SubjectWiseResultView.as_view(), name="subject_result"),
     path("delete/student/", StudentDeleteView.as_view(), name="delete_student"),
+    path("dashboard/", FacultyDashboardView.as_view(), name="faculty_dashboard"),
+    path("rank/", RankView.as_view(), name="rank"),
 
     # for student
     path("upload/marksheet/", MarkSheetFileUploadViewStudent.as_view(), name="marksheet_file_upload"),
+    path("upload/gradecard/", ConsolidatedMarkSheetUploadViewStudent.as_view(), name="grade_card_upload"),
     path("mark/edit/", MarkSheetEditView.as_view(), name="marksheet_edit"),
     path("mark/confirm/", ConfirmMarkChangesView.as_view(), name="marksheet_confirm"),
 ]
@@ -3,40 +3,73 @@ Views Naming Convention : [Functionality]View[User-Role-Accessible(optional)]
 """
 import time
 from django.shortcuts import render
+from django.urls import reverse
+from django.utils.http import urlencode
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from rest_framework import exceptions
+from django.conf import settings
 from django.db import transaction
+from django.db.models import F
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.authentication import SessionAuthentication
 from django.core.exceptions import ValidationError
 from rest_framework import status
 
-from .authentication import CustomTokenAuthentication
+from .authentication import CustomTokenAuthentication, SignedLinkAuthentication, sign_marksheet_link
+from .errors import PermissionDeniedError, error_stats
 from .serializers import (
     UserLoginSerializer,
     StudentCreateSerializer,
-    StudentListSerialzer,
     MarksViewRequestSerialzerFaculty,
     MarksViewRequestSerialzerStudent,
-    MarksViewSerializer,
 )
-from .models import User, UserAuthToken, Subject, Exam, Course, Student, Faculty, Mark, MarkSheetDoc, ROLE_CHOICES
+from .models import User, UserAuthToken, Subject, Exam, Course, Student, Faculty, Mark, MarkSheetDoc, UploadTrace
+from .reference_cache import reference_data
+from .routers import activate_user_routing, reset_routing, use_replica_reads
 from .services import (
     verify_document,
     validate_file_upload_request,
     verify_file_type,
-    retreive_and_save_marks,
+    upload_mark_sheet,
+    upload_consolidated_mark_sheet,
+    validate_idempotency_key,
     validate_login_data,
     get_login_user,
     create_auth_token,
     login_success_data,
+    login_payload,
     check_deleted,
-    handle_error
+    handle_error,
+    parse_student_rows,
+    onboard_students,
+    deactivate_student,
+    can_view_marksheet,
+    change_feed,
+    get_dashboard,
+    student_ranks,
+    cohort_ranking,
+    reviewable_mark_sheets,
 )
+from .previews import has_preview, preview_name, preview_content_type, schedule_preview
+from .media import serve_file
+from .renderers import dumps
+from .profiling import start_upload_profile
+from .archive import historical_marks
 
 
 # Create your views here.
 
 
+class ReplicaReadMixin:
+    """Read-only view, its queries may be served by the read replica (see routers.py)"""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        use_replica_reads()
+
 
 class LoginView(APIView):
 
@@ -46,6 +79,7 @@ class LoginView(APIView):
         try:
             username, password = validate_login_data(request.data)
             user = get_login_user(username, password)
+            activate_user_routing(user)
             check_deleted(user)
             token = create_auth_token(user)
             data = login_success_data(user, token)
@@ -61,20 +95,7 @@ class LoginDataView(APIView):
     authentication_classes = [CustomTokenAuthentication]
 
     def get(self, request):
-        user = request.user
-        res = {}
-        res["username"] = user.username
-        res["user_role"] = user.role
-        res['role_name'] = dict(ROLE_CHOICES).get(user.role)
-        if user.role == 2:
-            faculty = Faculty.objects.get(user=user)
-            res['profile_id'] = faculty.id
-            course = faculty.course.course_name
-        elif user.role == 3:
-            student = Student.objects.get(user=user)
-            res['profile_id'] = student.id
-            course = student.course.course_name
-        res['course'] = course
+        res = login_payload(request.user, request.auth.key)
         return Response(status=status.HTTP_200_OK, data=res)
 
 
@@ -111,7 +132,7 @@ class StudentCreateViewFaculty(APIView):
             user = request.user
             has_permission = User.objects.filter(id=user.id, role__in=[1,2]).exists()
             if not has_permission:
-                raise ValidationError("You do not have permission to create Student.")
+                raise PermissionDeniedError("You do not have permission to create Student.")
 
             # validating data
             serializer = StudentCreateSerializer(data=request.data)
@@ -155,12 +176,103 @@ class StudentCreateViewFaculty(APIView):
             return Response(status=status.HTTP_404_NOT_FOUND, data=msg)
 
 
+class StudentBulkCreateViewFaculty(APIView):
+    """Bulk student onboarding for faculty from a csv/json file or a json list"""
+
+    authentication_classes = [CustomTokenAuthentication]
+
+    def post(self, request):
+        try:
+            # check permision
+            user = request.user
+            if user.role not in [1, 2]:
+                raise PermissionDeniedError("You do not have permission to create Student.")
+
+            file = request.FILES.get('file')
+            if file is not None:
+                rows = parse_student_rows(file)
+            else:
+                rows = request.data.get("students")
+            if not isinstance(rows, list) or not rows:
+                raise ValidationError("Upload a csv/json file or a list of students!")
+            # hashing a larger file would outlive the worker timeout
+            if len(rows) > settings.BULK_ONBOARD_MAX_ROWS:
+                raise ValidationError(
+                    f"At most {settings.BULK_ONBOARD_MAX_ROWS} students per upload, split the file or ask "
+                    "the admin to run `python manage.py onboard_students` for the whole intake"
+                )
+
+            faculty = Faculty.objects.get(user=user)
+            report = onboard_students(user, faculty.course, rows)
+            return Response(status=status.HTTP_201_CREATED, data=report)
+        except Exception as e:
+            msg = handle_error(e)
+            return Response(status=status.HTTP_404_NOT_FOUND, data=msg)
+
+
+class FacultyDashboardView(APIView):
+    """Student x exam upload / approval status grid for the faculty's course"""
+
+    authentication_classes = [CustomTokenAuthentication]
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            user = request.user
+            if user.role != 2:
+                raise PermissionDeniedError("You must be logged in as Faculty to view the dashboard")
+            faculty = Faculty.active_objects.filter(user=user)[0]
+            res = get_dashboard(faculty.course_id)
+            return Response(status=status.HTTP_200_OK, data=res)
+        except Exception as e:
+            msg = handle_error(e)
+            return Response(status=status.HTTP_404_NOT_FOUND, data=msg)
+
+
+class RankView(ReplicaReadMixin, APIView):
+    """
+    Rank and percentile for an exam, from the rank snapshot. Students get their
+    own; faculty a student's (`student`) or the whole cohort in rank order,
+    by SGPA or in one `subject`.
+    """
+
+    authentication_classes = [CustomTokenAuthentication]
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            user = request.user
+            exam = reference_data.get_exam(request.GET.get("exam"))
+            student_id = request.GET.get("student")
+            if user.role == 3:
+                student = Student.active_objects.get(user=user)
+                res = student_ranks(student, exam.id)
+            elif user.role == 2:
+                faculty = Faculty.active_objects.filter(user=user)[0]
+                if student_id:
+                    student = Student.active_objects.get(id=student_id, course_id=faculty.course_id)
+                    res = student_ranks(student, exam.id)
+                else:
+                    res = cohort_ranking(faculty.course_id, exam.id, request.GET.get("subject") or None)
+            else:
+                raise PermissionDeniedError("Log in as faculty or student to view ranks")
+            return Response(status=status.HTTP_200_OK, data=res)
+        except Exception as e:
+            msg = handle_error(e)
+            return Response(status=status.HTTP_404_NOT_FOUND, data=msg)
+
+
 class ExamDropdownViewStudent(APIView):
 
     authentication_classes = [CustomTokenAuthentication]
 
     def get(self, request):
-        exams = Exam.objects.filter(is_active = True).values("id", "exam_name")
+        exams = [
+            {"id": exam.id, "exam_name": exam.exam_name}
+            for exam in reference_data.active_exams()
+        ]
         return Response(status=status.HTTP_200_OK, data=exams)
 
 
@@ -178,22 +290,25 @@ class SubjectDropdownViewStudent(APIView):
             return Response(status=status.HTTP_400_BAD_REQUEST, data="Log in as faculty to get subjects")
 
         # retrieving student object fropm database and getting related course object
-        faculty = Faculty.objects.filter(user=user, is_active=True)[0]
+        faculty = Faculty.active_objects.filter(user=user)[0]
         faculty_course = faculty.course
 
         # retrieving data from database with students course and exam id provided
         res = []
-        exams = Exam.objects.filter(is_active = True)
+        exams = reference_data.active_exams()
         for exam in exams:
             subject_dict = {}
-            subjects = Subject.objects.filter(course=faculty_course, exam=exam).values("id", "subject_name")
+            subjects = [
+                {"id": subject.id, "subject_name": subject.subject_name}
+                for subject in reference_data.subjects_for(faculty_course.id, exam.id)
+            ]
             subject_dict["exam"] = exam.exam_name
             subject_dict["subjects"] = subjects
             res.append(subject_dict)
         return Response(status=status.HTTP_200_OK, data=res)
 
 
-class StudentDropdownViewFaculty(APIView):
+class StudentDropdownViewFaculty(ReplicaReadMixin, APIView):
     """Student List view for faculty"""
 
     authentication_classes = [CustomTokenAuthentication]
@@ -204,15 +319,24 @@ class StudentDropdownViewFaculty(APIView):
         try:
             user = request.user
             if user.role != 2:
-                raise ValidationError("You must be logged in as Faculty to view Students")
+                raise PermissionDeniedError("You must be logged in as Faculty to view Students")
             
-            faculty = Faculty.objects.filter(user=user, is_active=True)[0]
+            faculty = Faculty.active_objects.filter(user=user)[0]
             faculty_course = faculty.course
 
-            students = Student.objects.filter(is_active=True, course=faculty_course)
-            serializer = StudentListSerialzer(students, many=True)
-
-            return Response(status=status.HTTP_200_OK, data=serializer.data)
+            students = list(
+                Student.active_objects.filter(course=faculty_course).values("id", "registration_no", "user_id")
+            )
+            # users live on the default database, students may be on a course shard
+            names = dict(
+                User.objects.filter(id__in=[student["user_id"] for student in students]).values_list("id", "first_name")
+            )
+            data = [
+                {"id": student["id"], "name": names.get(student["user_id"]), "registration_no": student["registration_no"]}
+                for student in students
+            ]
+
+            return Response(status=status.HTTP_200_OK, data=data)
         except Exception as e:
             msg = handle_error(e)
             return Response(status=status.HTTP_404_NOT_FOUND, data=msg)
@@ -226,11 +350,10 @@ class MarkSheetFileUploadViewStudent(APIView):
     def post(self, request):
         try:
             # user verification
-            time.sleep(1)
             user = request.user
-            student = Student.objects.filter(user=user, is_active=True)
+            student = Student.active_objects.filter(user=user)
             if not student.exists():
-                raise ValidationError("You must be logged in as Student to perform this action")
+                raise PermissionDeniedError("You must be logged in as Student to perform this action")
             student = student[0]
 
             # retreiving data from request
@@ -238,21 +361,61 @@ class MarkSheetFileUploadViewStudent(APIView):
             exam_id = request.POST.get('exam')
             validate_file_upload_request(exam_id, file)
 
-            exam = Exam.objects.get(id=exam_id)
-
-            already_uploaded = Mark.objects.filter(student=student, exam=exam).exists()
-            if already_uploaded:
-                raise ValidationError("You have already uploaded marks for this exam")
+            exam = reference_data.get_exam(exam_id)
+            # a retried or double submitted upload repeats its Idempotency-Key
+            idempotency_key = validate_idempotency_key(
+                request.headers.get("Idempotency-Key") or request.POST.get("idempotency_key")
+            )
 
             verify_file_type(file)
-            retreive_and_save_marks(user, file, exam, student)
+            profile = start_upload_profile(request)
+            mark_doc, created = upload_mark_sheet(user, file, exam, student, idempotency_key, profile=profile)
+            if not created and mark_doc.status == MarkSheetDoc.PROCESSING:
+                return Response(status=status.HTTP_202_ACCEPTED, data="Mark Sheet is being processed")
             return Response(status=status.HTTP_200_OK, data="Mark Sheet Uploaded Succesfully!")
         except Exception as e:
             msg = handle_error(e)
             return Response(status=status.HTTP_404_NOT_FOUND, data=msg)
         
 
-class ViewMarkSheetView(APIView):
+class ConsolidatedMarkSheetUploadViewStudent(APIView):
+    """API for importing every semester of a consolidated grade card in one upload"""
+
+    authentication_classes = [CustomTokenAuthentication]
+
+    def post(self, request):
+        try:
+            user = request.user
+            student = Student.active_objects.filter(user=user)
+            if not student.exists():
+                raise PermissionDeniedError("You must be logged in as Student to perform this action")
+            student = student[0]
+
+            file = request.FILES.get('doc')
+            if file in ['undefined', None, ""]:
+                raise ValidationError("Choose a pdf file!")
+            idempotency_key = validate_idempotency_key(
+                request.headers.get("Idempotency-Key") or request.POST.get("idempotency_key")
+            )
+
+            verify_file_type(file)
+            profile = start_upload_profile(request)
+            mark_docs, skipped, created = upload_consolidated_mark_sheet(
+                user, file, student, idempotency_key, profile=profile
+            )
+            if not created and any(mark_doc.status == MarkSheetDoc.PROCESSING for mark_doc in mark_docs):
+                return Response(status=status.HTTP_202_ACCEPTED, data="Grade card is being processed")
+            data = {
+                "imported": [mark_doc.exam.exam_name for mark_doc in mark_docs],
+                "skipped": [exam.exam_name for exam in skipped],
+            }
+            return Response(status=status.HTTP_200_OK, data=data)
+        except Exception as e:
+            msg = handle_error(e)
+            return Response(status=status.HTTP_404_NOT_FOUND, data=msg)
+
+
+class ViewMarkSheetView(ReplicaReadMixin, APIView):
     """View Mark Sheet Uploaded by the Student"""
 
     authentication_classes = [CustomTokenAuthentication]
@@ -288,34 +451,108 @@ class ViewMarkSheetView(APIView):
                 student = Student.objects.get(user=user)
 
             exam_id = serializer.validated_data.get("exam")
-            exam = Exam.objects.get(id=exam_id)
-
-            marks = Mark.objects.filter(student=student, exam=exam, is_active=True)
-            serializer = MarksViewSerializer(marks, many=True)
+            exam = reference_data.get_exam(exam_id)
+
+            # plain rows straight to the renderer, no serializer or per-mark subject query
+            marks = historical_marks(
+                {"student": student, "exam": exam},
+                "id",
+                "grade",
+                "grade_point",
+                "credit",
+                "credit_point",
+                "status",
+                subject_code=F("subject__subject_code"),
+                subject_name=F("subject__subject_name"),
+            )
             res = {}
-            mark_sheet = MarkSheetDoc.objects.filter(student=student,exam=exam, is_active=True)
+            mark_sheet = MarkSheetDoc.active_objects.filter(student=student, exam=exam)
             if mark_sheet.exists():
                 mark_sheet = mark_sheet[0]
                 res["marksheet_id"] = mark_sheet.id
-                res["marksheet_doc"] = "/media/"+str(mark_sheet.mark_sheet)
+                # signed, so the links also open from <a href> / <img src>
+                query = urlencode({"marksheet": mark_sheet.id, "link": sign_marksheet_link(user, mark_sheet)})
+                res["marksheet_file"] = reverse("marksheet_file") + "?" + query
+                res["marksheet_doc"] = res["marksheet_file"]
+                res["marksheet_preview"] = reverse("marksheet_preview") + "?" + query
                 res["status"] = mark_sheet.status
                 res["sgpa"] = mark_sheet.sgpa
             else:
                 res["marksheet_id"] = ""
                 res["marksheet_doc"] = ""
+                res["marksheet_file"] = ""
+                res["marksheet_preview"] = ""
                 res["status"] = ""
                 res["sgpa"] = ""
 
             res["student"] = student.user.first_name
             res["course"] = student.course.course_name
             res["exam"] = exam.exam_name
-            res["mark_list"] = serializer.data
+            res["mark_list"] = list(marks)
             return Response(status=status.HTTP_200_OK, data=res)
         except Exception as e:
             msg = handle_error(e)
             return Response(status=status.HTTP_404_NOT_FOUND, data=msg)
 
 
+class MarkSheetFileView(ReplicaReadMixin, APIView):
+    """Mark sheet pdf for its student or the course's faculty"""
+
+    authentication_classes = [CustomTokenAuthentication, SignedLinkAuthentication]
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            mark_sheet = MarkSheetDoc.active_objects.get(id=request.GET.get("marksheet"))
+            if not can_view_marksheet(request.user, mark_sheet):
+                raise PermissionDeniedError("You do not have permission to view this Mark Sheet")
+            if not mark_sheet.mark_sheet:
+                raise ValidationError("Mark Sheet is still being processed")
+            return serve_file(
+                request,
+                mark_sheet.mark_sheet.storage,
+                mark_sheet.mark_sheet.name,
+                "application/pdf",
+            )
+        except Exception as e:
+            msg = handle_error(e)
+            return Response(status=status.HTTP_404_NOT_FOUND, data=msg)
+
+
+class MarkSheetPreviewView(ReplicaReadMixin, APIView):
+    """Compressed page 1 image of a mark sheet for the review screen"""
+
+    authentication_classes = [CustomTokenAuthentication, SignedLinkAuthentication]
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            mark_sheet = MarkSheetDoc.active_objects.get(id=request.GET.get("marksheet"))
+            if not can_view_marksheet(request.user, mark_sheet):
+                raise PermissionDeniedError("You do not have permission to view this Mark Sheet")
+            if not mark_sheet.mark_sheet:
+                raise ValidationError("Mark Sheet is still being processed")
+            if not has_preview(mark_sheet):
+                if not settings.MARKSHEET_PREVIEWS:
+                    raise ValidationError("Mark Sheet previews are disabled")
+                schedule_preview(mark_sheet)
+                return Response(status=status.HTTP_202_ACCEPTED, data="Preview is being generated")
+
+            # a sheet's pdf never changes after upload, so neither does its preview
+            return serve_file(
+                request,
+                mark_sheet.mark_sheet.storage,
+                preview_name(mark_sheet),
+                preview_content_type(),
+                cache_control=f"private, max-age={settings.PREVIEW_CACHE_SECONDS}, immutable",
+            )
+        except Exception as e:
+            msg = handle_error(e)
+            return Response(status=status.HTTP_404_NOT_FOUND, data=msg)
+
+
 class ApproveMarklistView(APIView):
     """API for approve/reject MarkSheet for faculty"""
 
@@ -329,9 +566,11 @@ class ApproveMarklistView(APIView):
             role = user.role
             if role != 2:
                 return Response(status=status.HTTP_404_NOT_FOUND, data="No permission to approve/reject MarkSheet")
-            print(request.data)
             marksheet_id = request.data.get("marksheet")
-            marksheet = MarkSheetDoc.objects.get(id=marksheet_id)
+            # same rules as the admin's approve action
+            marksheet = reviewable_mark_sheets(MarkSheetDoc.objects.filter(id=marksheet_id)).first()
+            if marksheet is None:
+                raise ValidationError("Mark Sheet not found or still being processed")
             status_ = request.data.get("status")
             if status_ == "Approve":
                 marksheet.status = "Approved"
@@ -349,7 +588,7 @@ class ApproveMarklistView(APIView):
             return Response(status=status.HTTP_404_NOT_FOUND, data=msg)
 
 
-class StudentDetailView(APIView):
+class StudentDetailView(ReplicaReadMixin, APIView):
 
     authentication_classes = [CustomTokenAuthentication]
 
@@ -358,14 +597,14 @@ class StudentDetailView(APIView):
     def get(self, request):
         user = request.user
         student_id = request.GET.get("student")
-        student = Student.objects.get(id=student_id)
+        student = Student.active_objects.get(id=student_id)
         res = {}
         res["student"] = student.user.first_name
         res["course"] = student.course.course_name
         return Response(status=status.HTTP_200_OK, data=res)
 
 
-class SubjectWiseResultView(APIView):
+class SubjectWiseResultView(ReplicaReadMixin, APIView):
     
     authentication_classes = [CustomTokenAuthentication]
 
@@ -375,16 +614,24 @@ class SubjectWiseResultView(APIView):
         user = request.user
         subject_id = request.GET.get("subject")
         res = {}
-        subject = Subject.objects.get(id=subject_id)
-        marks = Mark.objects.filter(subject=subject).values(
-            "student__user__first_name",
+        subject = reference_data.get_subject(subject_id)
+        marks = historical_marks(
+            {"subject": subject},
+            "student__user_id",
             "grade",
             "grade_point",
             "credit",
             "credit_point",
             "status",
         )
-        res["marks"] = marks
+        # users live on the default database, marks may be on a course shard
+        names = dict(
+            User.objects.filter(id__in=[mark["student__user_id"] for mark in marks]).values_list("id", "first_name")
+        )
+        res["marks"] = [
+            {"student__user__first_name": names.get(mark.pop("student__user_id")), **mark}
+            for mark in marks
+        ]
         res["subject"] = subject.subject_name
 
         
@@ -438,14 +685,149 @@ class StudentDeleteView(APIView):
     def post(self, request):
         student_id = request.POST.get("student")
         student = Student.objects.get(id=student_id)
-        user = student.user
-        with transaction.atomic():
-            student.is_active = False
-            student.full_clean()
-            student.save()
-            user.is_active = False
-            user.save()
+        deactivate_student(student)
 
         return Response(status=status.HTTP_200_OK, data="Student deleted Successfully!")
 
 
+
+
+class ChangeFeedView(ReplicaReadMixin, APIView):
+    """Mark sheet / mark changes since the `since` cursor, for polling clients"""
+
+    authentication_classes = [CustomTokenAuthentication]
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            since = int(request.GET.get("since") or 0)
+            res = change_feed(request.user, since)
+            return Response(status=status.HTTP_200_OK, data=res)
+        except Exception as e:
+            msg = handle_error(e)
+            return Response(status=status.HTTP_404_NOT_FOUND, data=msg)
+
+
+def change_feed_stream(request):
+    """
+    Server-Sent Events version of ChangeFeedView. Resumes from the
+    Last-Event-ID header the browser sends on reconnect. Each open stream
+    holds a worker thread for up to CHANGE_FEED_STREAM_TIMEOUT seconds, run
+    it on threaded workers (gunicorn --threads / gthread).
+
+    WSGI only: Django 4.1 iterates a streaming body inside the ASGI event
+    loop, where the ORM queries and the polling sleep are not allowed, so
+    ASGI clients are answered 501 and poll changes/ instead.
+    """
+    if isinstance(request, ASGIRequest):
+        return JsonResponse(
+            ["The change stream needs a WSGI worker, poll changes/ instead"],
+            status=status.HTTP_501_NOT_IMPLEMENTED, safe=False,
+        )
+    try:
+        user_auth = CustomTokenAuthentication().authenticate(request)
+    except exceptions.APIException as e:
+        return JsonResponse([str(e.detail)], status=status.HTTP_401_UNAUTHORIZED, safe=False)
+    if user_auth is None:
+        return JsonResponse(["Authentication credentials were not provided."], status=status.HTTP_401_UNAUTHORIZED, safe=False)
+    user = user_auth[0]
+    try:
+        cursor = int(request.headers.get("Last-Event-ID") or request.GET.get("since") or 0)
+    except ValueError:
+        cursor = 0
+
+    def events():
+        nonlocal cursor
+        # the body is sent after DatabaseRoutingMiddleware reset the request's routing
+        activate_user_routing(user)
+        try:
+            deadline = time.monotonic() + settings.CHANGE_FEED_STREAM_TIMEOUT
+            while time.monotonic() < deadline:
+                feed = change_feed(user, cursor)
+                for change in feed["changes"]:
+                    data = dumps(change).decode()
+                    yield f"id: {change['id']}\nevent: {change['kind']}\ndata: {data}\n\n"
+                cursor = feed["cursor"]
+                if not feed["more"]:
+                    yield ": keep-alive\n\n"
+                    time.sleep(settings.CHANGE_FEED_STREAM_INTERVAL)
+        finally:
+            reset_routing()
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+class ErrorStatsView(APIView):
+    """Per error type counters of the worker serving the request, for staff logged in to the admin"""
+
+    authentication_classes = [SessionAuthentication, CustomTokenAuthentication]
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(status=status.HTTP_200_OK, data=error_stats())
+
+
+UPLOAD_TRACE_FIELDS = (
+    "id", "upload_id", "database", "mark_sheet_id", "course_id", "student_id", "exam_id", "file_size",
+    "duration", "parse_seconds", "save_seconds", "profiled", "created_time",
+)
+
+
+class UploadTraceView(APIView):
+    """
+    Upload timings for staff: the slowest uploads (?limit=, ?profiled=1 for
+    cProfile traced ones only), or with ?marksheet=<id> (&database=<shard>)
+    the latest trace of that mark sheet including its profile, &download=1
+    for the .prof file.
+    """
+
+    authentication_classes = [SessionAuthentication, CustomTokenAuthentication]
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        try:
+            mark_sheet_id = request.GET.get("marksheet")
+            if mark_sheet_id:
+                trace = (
+                    UploadTrace.objects
+                    .filter(database=request.GET.get("database", "default"), mark_sheet_id=int(mark_sheet_id))
+                    .order_by("-created_time")
+                    .first()
+                )
+                if trace is None:
+                    raise ValidationError("No upload trace for this mark sheet")
+                if request.GET.get("download"):
+                    if trace.raw is None:
+                        raise ValidationError("This upload was not profiled")
+                    response = HttpResponse(bytes(trace.raw), content_type="application/octet-stream")
+                    response["Content-Disposition"] = f'attachment; filename="marksheet-{trace.mark_sheet_id}-{trace.id}.prof"'
+                    return response
+                data = {field: getattr(trace, field) for field in UPLOAD_TRACE_FIELDS}
+                data["stats"] = trace.stats
+                return Response(status=status.HTTP_200_OK, data=data)
+
+            limit = min(int(request.GET.get("limit", 20)), 200)
+            traces = UploadTrace.objects.order_by("-duration")
+            if request.GET.get("profiled"):
+                traces = traces.filter(profiled=True)
+            # a grade card's sheets share their upload's timings, list the upload once
+            data = []
+            uploads = set()
+            for trace in traces.values(*UPLOAD_TRACE_FIELDS).iterator():
+                if trace["upload_id"] in uploads:
+                    continue
+                uploads.add(trace["upload_id"])
+                data.append(trace)
+                if len(data) == limit:
+                    break
+            return Response(status=status.HTTP_200_OK, data=data)
+        except Exception as e:
+            msg = handle_error(e)
+            return Response(status=status.HTTP_404_NOT_FOUND, data=msg)
+